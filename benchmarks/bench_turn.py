@@ -0,0 +1,299 @@
+# benchmarks/bench_turn.py
+#
+# /chat の1ターンを main.app に対してプロセス内で繰り返し実行し、ステージごとの所要時間
+# （p50/p95/p99）と1ターンあたりの DB 往復回数を計測して JSON に保存する。
+# LLM は擬似バックエンド（LLM_BACKEND=fake）、保存先は組み込みストレージ（または MongoDB）を使う。
+# Drives /chat turns against main.app in-process and records per-stage latency (p50/p95/p99)
+# and DB round trips per turn, saving the results as JSON. The LLM is the fake backend
+# (LLM_BACKEND=fake) and storage is the embedded store (or MongoDB).
+#
+#   python -m benchmarks.bench_turn --turns 100 --emotion-data 1000 --index 1000
+#   python -m benchmarks.bench_turn --compare benchmarks/results/before.json
+
+import argparse
+import json
+import math
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 要求されたステージのまとまり（StageGraph / timed_stage のステージ名 → 集計名）
+# Reported stage groups (StageGraph / timed_stage stage names → report name)
+STAGE_GROUPS = {
+    "history_load": ["history"],
+    "index_match": ["index", "best_match"],
+    "category_lookup": ["category_lookup"],
+    "llm": ["llm"],
+    "persistence": ["persist"],
+    "oblivion": ["oblivion"],
+}
+SEED_EMOTIONS = ["Joy", "Trust", "Anticipation", "Surprise", "Sadness", "Curiosity", "Hope", "Love"]
+SEED_KEYWORDS = ["天気", "仕事", "音楽", "旅行", "料理", "記憶", "映画", "友達", "散歩", "読書"]
+MESSAGES = ["こんにちは", "今日はいい天気ですね", "仕事で疲れました", "最近どんな音楽を聴いていますか", "旅行の思い出を話してもいい？"]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="/chat ターンのベンチマーク / /chat turn benchmark")
+    parser.add_argument("--turns", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--emotion-data", type=int, default=200, help="投入する emotion_data 件数 / emotion_data documents to seed")
+    parser.add_argument("--index", type=int, default=200, help="投入する emotion_index 件数 / emotion_index documents to seed")
+    parser.add_argument("--latency", default="lognormal:300:0.4", help="擬似 LLM の待ち時間 / fake LLM latency (fake_llm.LatencyModel)")
+    parser.add_argument("--stream", action="store_true", help="/chat/stream を使う / use /chat/stream")
+    parser.add_argument("--mongo", action="store_true", help="MONGODB_URI の MongoDB を使う / use MongoDB at MONGODB_URI")
+    parser.add_argument("--session", default="bench", help="ターンを送る session_id / session_id for the turns")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="結果の JSON / result JSON (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--compare", default=None, help="比較する以前の結果 / earlier result to compare with")
+    return parser.parse_args(argv)
+
+
+# 設定は import 時に読まれるため、アプリを読み込む前に環境変数を決める
+# Settings are read at import time, so the environment is fixed before the app is loaded
+def configure_environment(args, workdir: str):
+    os.environ["LLM_BACKEND"] = "fake"
+    os.environ["LLM_FAKE_LATENCY"] = args.latency
+    os.environ["LLM_FAKE_SEED"] = str(args.seed)
+    os.environ.setdefault("OPENAI_API_KEY", "bench")
+    os.environ.setdefault("TRANSLATION_BACKEND", "glossary")
+    os.environ["TRANSLATION_CACHE_PATH"] = os.path.join(workdir, "translation_cache.sqlite3")
+    if not args.mongo:
+        os.environ["USE_MONGODB"] = "false"
+        os.environ["LOCAL_DB_PATH"] = os.path.join(workdir, "emotion_db.sqlite3")
+
+
+def percentiles(values: list[float]) -> dict:
+    if not values:
+        return {"n": 0}
+    ordered = sorted(values)
+
+    def rank(p):
+        return ordered[min(len(ordered) - 1, max(0, math.ceil(p / 100 * len(ordered)) - 1))]
+
+    return {
+        "n": len(ordered),
+        "mean": round(statistics.fmean(ordered), 2),
+        "p50": round(rank(50), 2),
+        "p95": round(rank(95), 2),
+        "p99": round(rank(99), 2),
+        "max": round(ordered[-1], 2)
+    }
+
+
+def _date(rng: random.Random) -> str:
+    return (datetime.now() - timedelta(days=rng.uniform(0, 30))).strftime("%Y%m%d%H%M%S")
+
+
+# 記憶は時間をかけて蓄積されるので、_id の生成時刻も date に合わせる（差分読み込みの対象外になる）
+# Memories accumulate over time, so the _id creation time follows date (outside the incremental window)
+def _object_id(date: str, rng: random.Random):
+    from bson import ObjectId
+    timestamp = int(datetime.strptime(date, "%Y%m%d%H%M%S").timestamp())
+    return ObjectId(timestamp.to_bytes(4, "big") + rng.randbytes(8))
+
+
+def _composition(rng: random.Random) -> dict:
+    emotions = rng.sample(SEED_EMOTIONS, 3)
+    first = rng.randrange(40, 71, 5)
+    second = rng.randrange(10, 100 - first - 5 + 1, 5)
+    return {emotions[0]: first, emotions[1]: second, emotions[2]: 100 - first - second}
+
+
+# emotion_data / emotion_index に、アプリが書き込むのと同じ形の文書を投入する
+# Seed emotion_data / emotion_index with documents shaped like the ones the app writes
+def seed(args):
+    from module.mongo import repository
+    from module.params import emotion_map
+
+    rng = random.Random(args.seed)
+    categories = ["short"] * 6 + ["intermediate"] * 3 + ["long"]
+
+    emotion_docs = []
+    for _ in range(args.emotion_data):
+        emotion_en = rng.choice(SEED_EMOTIONS)
+        record = {
+            "date": _date(rng),
+            "主感情": emotion_map[emotion_en],
+            "構成比": {emotion_map[k]: v for k, v in _composition(rng).items()},
+            "状況": "ベンチマーク用の記憶",
+            "心理反応": "落ち着いて受け止めた",
+            "keywords": rng.sample(SEED_KEYWORDS, 2),
+            "応答": "覚えています。"
+        }
+        emotion_docs.append({
+            "emotion": emotion_en,
+            "category": rng.choice(categories),
+            "data": {**record, "履歴": [record]},
+            "履歴": [record],
+            "session_id": args.session
+        })
+
+    index_docs = []
+    for _ in range(args.index):
+        emotion_en = rng.choice(SEED_EMOTIONS)
+        date = _date(rng)
+        index_docs.append({
+            "_id": _object_id(date, rng),
+            "date": date,
+            "主感情": emotion_en,
+            "構成比": {emotion_map[k]: v for k, v in _composition(rng).items()},
+            "キーワード": rng.sample(SEED_KEYWORDS, 2),
+            "emotion": emotion_en,
+            "category": rng.choice(categories),
+            "応答": "覚えています。",
+            "履歴": [{"date": date}],
+            "session_id": args.session
+        })
+
+    for name, docs in ((repository.EMOTION_DATA, emotion_docs), (repository.EMOTION_INDEX, index_docs)):
+        if docs:
+            repository.get_collection(name).insert_many(docs)
+
+
+def _db_ops(before: dict, after: dict) -> dict:
+    from module.mongo.repository import APP_LOG
+    ops = {name: after.get(name, 0) - before.get(name, 0) for name in after}
+    return {name: count for name, count in ops.items() if count and name != APP_LOG}
+
+
+def run_turns(args) -> dict:
+    from fastapi.testclient import TestClient
+
+    import main
+    from module.llm import llm_client
+    from module.mongo import repository
+    from module.utils.stage_graph import add_timing_observer, remove_timing_observer
+
+    current = defaultdict(list)
+    lock = threading.Lock()
+
+    def observe(graph_name, stage, duration_ms):
+        with lock:
+            current[stage].append(duration_ms)
+
+    stage_samples = defaultdict(list)
+    group_samples = defaultdict(list)
+    db_turns = []
+    turn_ms = []
+    llm_calls = []
+    failures = 0
+    endpoint = "/chat/stream" if args.stream else "/chat"
+
+    add_timing_observer(observe)
+    try:
+        with TestClient(main.app) as client:
+            seed(args)
+            for i in range(args.warmup + args.turns):
+                with lock:
+                    current.clear()
+                ops_before = repository.get_op_counts()
+                calls_before = getattr(llm_client.client, "calls", 0)
+                start = time.perf_counter()
+                # 背景タスク（記憶の保存・忘却）は TestClient の中で応答前に実行される
+                # Background tasks (memory write, oblivion) run inside the TestClient before it returns
+                response = client.post(endpoint, data={
+                    "message": MESSAGES[i % len(MESSAGES)],
+                    "session_id": args.session,
+                    "bypass_cache": "true"
+                })
+                elapsed = (time.perf_counter() - start) * 1000
+                if i < args.warmup:
+                    continue
+                if response.status_code != 200:
+                    failures += 1
+                turn_ms.append(elapsed)
+                llm_calls.append(getattr(llm_client.client, "calls", 0) - calls_before)
+                ops = _db_ops(ops_before, repository.get_op_counts())
+                db_turns.append({**ops, "total": sum(ops.values())})
+                with lock:
+                    turn = {stage: sum(values) for stage, values in current.items()}
+                for stage, value in turn.items():
+                    stage_samples[stage].append(value)
+                for group, stages in STAGE_GROUPS.items():
+                    if any(s in turn for s in stages):
+                        group_samples[group].append(sum(turn.get(s, 0.0) for s in stages))
+    finally:
+        remove_timing_observer(observe)
+
+    return {
+        "turn_ms": percentiles(turn_ms),
+        "stages": {group: percentiles(group_samples[group]) for group in STAGE_GROUPS},
+        "raw_stages": {stage: percentiles(values) for stage, values in sorted(stage_samples.items())},
+        "db_round_trips_per_turn": {
+            name: percentiles([ops.get(name, 0) for ops in db_turns])
+            for name in sorted({name for ops in db_turns for name in ops})
+        },
+        "llm_calls_per_turn": round(statistics.fmean(llm_calls), 3) if llm_calls else 0.0,
+        "failures": failures
+    }
+
+
+def _git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def print_report(result: dict, previous: dict | None = None):
+    print(f"\n/chat turns: {result['config']['turns']}  (git {result['git_revision']})")
+
+    def row(name, stats, before=None):
+        if not stats.get("n"):
+            print(f"  {name:<22} (not reached)")
+            return
+        line = f"  {name:<22} p50 {stats['p50']:>9.2f}  p95 {stats['p95']:>9.2f}  p99 {stats['p99']:>9.2f}"
+        if before and before.get("n"):
+            line += f"   Δp50 {stats['p50'] - before['p50']:+.2f}  Δp95 {stats['p95'] - before['p95']:+.2f}"
+        print(line)
+
+    print("latency (ms)")
+    row("turn", result["turn_ms"], previous and previous.get("turn_ms"))
+    for group, stats in result["stages"].items():
+        row(group, stats, previous and previous.get("stages", {}).get(group))
+    print("DB round trips per turn")
+    for name, stats in result["db_round_trips_per_turn"].items():
+        row(name, stats, previous and previous.get("db_round_trips_per_turn", {}).get(name))
+    print(f"LLM calls per turn: {result['llm_calls_per_turn']}  failures: {result['failures']}")
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    workdir = tempfile.mkdtemp(prefix="bench_turn_")
+    configure_environment(args, workdir)
+    sys.path.insert(0, ROOT)
+    os.chdir(ROOT)
+
+    result = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "git_revision": _git_revision(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        **run_turns(args)
+    }
+
+    output = args.output or os.path.join(ROOT, "benchmarks", "results", f"bench_turn_{datetime.now():%Y%m%d_%H%M%S}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+
+    previous = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            previous = json.load(f)
+    print_report(result, previous)
+    print(f"\nresults: {output}")
+
+
+if __name__ == "__main__":
+    main()
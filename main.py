@@ -1,23 +1,42 @@
 import sys
 import os
 import re
+import json
 import traceback
 from fastapi import FastAPI, HTTPException, UploadFile, File, Form, BackgroundTasks
-from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool, iterate_in_threadpool
 from pydantic import BaseModel
+import anyio
 import uvicorn
 
 # モジュールパス追加
 # Add module path
 sys.path.append(os.path.join(os.path.dirname(__file__), "module"))
 from module.llm.llm_client import generate_emotion_from_prompt_with_context, generate_gpt_response_from_history
-from module.utils.utils import load_history, append_history
-from module.utils.utils import logger
+from module.llm.llm_client import stream_emotion_from_prompt_with_context
+from module.llm.stream_filter import DisplayStreamFilter
+from module.llm.dispatcher import get_llm_dispatcher, LLMBusyError
+from module.llm.response_cache import get_response_cache
+from module.llm.resilience import get_circuit_breaker
+from module.nlp.translation import get_translation_service
+from module.nlp import tagger
+from module.utils.utils import load_history, append_history, flush_history
+from module.utils.utils import logger, log_sink, prompt_registry
+from module.mongo.write_spool import shutdown_write_spool, get_write_spool
+from module.mongo.mongo_client import get_pool_stats
+from module.mongo.migrations import run_migrations, CollectionScanError
+from module.params import MIGRATE_ON_STARTUP, VERIFY_QUERY_PLANS_ON_STARTUP, CHAT_THREADPOOL_SIZE, DEFAULT_SESSION_ID
+from module.utils.session_cache import get_session_cache
 from module.emotion.main_emotion import save_response_to_memory, write_structured_emotion_data
 from module.emotion.emotion_stats import summarize_feeling
 from module.emotion.emotion_stats import load_current_emotion
 from module.response.main_response import find_response_by_emotion, get_best_match, collect_all_category_responses
-from module.response.response_index import load_index
+from module.response.response_index import load_and_categorize_index
+from module.response.index_cache import get_index_cache
+from module.emotion.basic_personality import get_top_long_emotions
+from module.utils.stage_graph import StageGraph, timed_stage
+from module.utils.turn_context import turn_scope
 from module.emotion.emotion_stats import load_current_emotion, merge_emotion_vectors, save_current_emotion, summarize_feeling
 from module.oblivion.oblivion_module import run_oblivion_cleanup_all
 
@@ -26,6 +45,17 @@ app = FastAPI()
 class UserMessage(BaseModel):
     message: str
 
+# session_id は英数字・ハイフン・アンダースコアの64文字まで（未指定なら既定のセッション）
+# session_id is up to 64 letters, digits, hyphens or underscores (default session when omitted)
+SESSION_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+def resolve_session_id(session_id: str | None) -> str:
+    if not session_id:
+        return DEFAULT_SESSION_ID
+    if not SESSION_ID_PATTERN.match(session_id):
+        raise HTTPException(status_code=400, detail="session_id が不正です。") # Invalid session_id
+    return session_id
+
 #応答テキストから末尾のJSONブロックを除去（UI表示用）
 #Remove the trailing JSON block from the response text (for UI display).
 def sanitize_output_for_display(text: str) -> str:
@@ -36,14 +66,69 @@ def sanitize_output_for_display(text: str) -> str:
         return text.replace(matches[-1], '').strip()
     return text.strip()
 
+# /chat はブロッキング処理をスレッドプールで実行するため、同時実行数に合わせて上限を広げる
+# /chat runs blocking work in the threadpool, so size it for concurrent conversations
+@app.on_event("startup")
+def configure_threadpool():
+    anyio.to_thread.current_default_thread_limiter().total_tokens = CHAT_THREADPOOL_SIZE
+
+# 起動時に MeCab の辞書を読み込んでおく（各スレッドの Tagger は初回に作られ、以後使い回される）
+# Load the MeCab dictionary at startup (each thread's Tagger is built on first use and reused after)
+@app.on_event("startup")
+def warm_up_tagger():
+    try:
+        tagger.warm_up()
+    except Exception as e:
+        logger.error(f"[ERROR] MeCab の初期化に失敗: {e}")  # MeCab initialization failed
+
+# 起動時にインデックスを作成（検証有効時はコレクションスキャンで起動を止める）
+# Create indexes at startup (with verification on, a collection scan aborts startup)
+@app.on_event("startup")
+def migrate_on_startup():
+    if not MIGRATE_ON_STARTUP:
+        return
+    try:
+        run_migrations(verify=VERIFY_QUERY_PLANS_ON_STARTUP)
+    except CollectionScanError:
+        raise
+    except Exception as e:
+        logger.error(f"[ERROR] 起動時のインデックス作成に失敗: {e}")  # Failed to create indexes at startup
+
+# 終了時にスプールとキュー内のログを書き出す
+# Flush the write spool and queued logs on shutdown
+@app.on_event("shutdown")
+def flush_logs_on_shutdown():
+    shutdown_write_spool()
+    log_sink.shutdown()
+
 @app.get("/")
 def get_ui():
     return FileResponse("static/index.html")
 
+# 接続状態・プール・書き込みスプール・ログキューの統計
+# Connection, pool, write spool and log queue statistics
+@app.get("/health")
+def get_health():
+    return {
+        "mongo": get_pool_stats(),
+        "write_spool": get_write_spool().stats(),
+        "log_sink": log_sink.stats(),
+        "llm_dispatcher": get_llm_dispatcher().stats(),
+        "llm_breaker": get_circuit_breaker().stats(),
+        "llm_cache": get_response_cache().stats(),
+        "session_cache": get_session_cache().stats(),
+        "translation": get_translation_service().stats(),
+        "index_cache": get_index_cache().stats(),
+        "prompts": prompt_registry.stats()
+    }
+
+# before_seq を指定すると、その seq より古い履歴を返す（ページング用）
+# With before_seq, returns entries older than that seq (for paging)
 @app.get("/history")
-def get_history():
+def get_history(limit: int = 100, before_seq: int | None = None, session_id: str | None = None):
+    session_id = resolve_session_id(session_id)
     try:
-        return {"history": load_history()}
+        return {"history": load_history(limit, before_seq=before_seq, session_id=session_id)}
     except Exception as e:
         logger.exception("履歴取得中に例外が発生しました") #An exception occurred while retrieving the history
         raise HTTPException(status_code=500, detail="履歴の取得中にエラーが発生しました。") #An error occurred while retrieving the history
@@ -51,10 +136,16 @@ def get_history():
 @app.post("/chat")
 async def chat(
     message: str = Form(...),
+    session_id: str | None = Form(None),
+    bypass_cache: bool = Form(False),
     file: UploadFile = File(None),
     background_tasks: BackgroundTasks = None
 ):
     logger.debug("✅ /chat エンドポイントに到達") # Reached the /chat endpoint
+    session_id = resolve_session_id(session_id)
+    dispatcher = get_llm_dispatcher()
+    if dispatcher.is_saturated():
+        return busy_response(LLMBusyError(dispatcher.retry_after(), "queue_full"))
     logger.info("✅ debug() 実行済み") # debug() executed
 
     try:
@@ -67,57 +158,168 @@ async def chat(
             # if extracted_text:
                 # user_input += f"\n\n[添付ファイルの内容]:\n{extracted_text}"
 
-        append_history("user", user_input)
-        logger.debug("📝 ユーザー履歴追加完了") # User history successfully appended
+        # pymongo / OpenAI クライアントは同期APIのため、各ステージはスレッドプールで実行してイベントループを塞がない。
+        # 1ターン内の読み込み・分析結果は turn_scope のキャッシュで共有し、重複実行しない
+        # pymongo and the OpenAI client are synchronous, so each stage runs in the threadpool to keep the event loop free.
+        # Reads and analyses are shared through the turn_scope cache so none runs twice per turn
+        with turn_scope(session_id) as turn:
+            graph = build_turn_graph(user_input)
+            graph.add("final", lambda r: generate_emotion_from_prompt_with_context(
+                user_input=user_input,
+                emotion_structure=r["emotion_data"].get("構成比", {}),
+                best_match=r["best_match"],
+                top4_personality=r["personality"],
+                use_cache=not bypass_cache
+            ), deps=["emotion_data", "best_match", "personality", "matched_response"])
 
-        logger.debug(f"②現在感情をロード") # Load current emotion
-        index_data = load_index()
-        current_emotion = load_current_emotion()
-        logger.debug(f"🎯 [INFO] 現在感情ベクトル: {current_emotion}") # Current emotion vector
+            results = await graph.run()
+            logger.debug(f"🎯 [INFO] 現在感情ベクトル: {results['current_emotion']}") # Current emotion vector
+            final_response, final_emotion = results["final"]
+            summary = await run_in_threadpool(persist_turn, final_response, final_emotion)
 
-        response_text = generate_gpt_response_from_history()
-        logger.info(f"📨 GPT応答:\n{response_text}")
+            logger.debug(f"🧠 ターン内キャッシュ: {turn.stats()}")  # Turn cache stats
 
-        emotion_data = find_response_by_emotion()
+            if background_tasks:
+                background_tasks.add_task(process_and_cleanup_emotion_data, final_response, session_id)
 
-        if emotion_data["type"] == "extracted":
-            logger.info("[STEP] GPT応答から構成比とキーワードを取得済") #Composition and keywords extracted from GPT response
-            best_match = get_best_match(emotion_data)
+        visible_response = sanitize_output_for_display(final_response)
 
-            if best_match:
-                logger.info("[STEP] インデックスにマッチした応答を取得") # Retrieved response matched to index
-                response_text = best_match.get("応答", "")
-                append_history("assistant", response_text)
-            else:
-                from datetime import datetime
-                dominant_emotion = next(iter(emotion_data["構成比"]), None)
-                if dominant_emotion:
-                    today = datetime.now().strftime("%Y-%m-%d")
-                    matched = collect_all_category_responses(
-                        emotion_name=dominant_emotion,
-                        date_str=today
-                    )
-                    for cat in ["short", "intermediate", "long"]:
-                        if matched.get(cat):
-                            response_text = matched[cat].get("応答", "")
-                            logger.info(f"[STEP] 履歴から {cat} カテゴリの応答を返却") # Returned response from {cat} category in history
-                            append_history("assistant", response_text)
-                            break
-
-                if not response_text:
-                    logger.warning("[WARN] 履歴にも一致する応答が見つかりませんでした") # No matching response found in history
-                    response_text = "ごめんなさい、うまく思い出せませんでした。" # I'm sorry, I couldn't recall it properly.
-                    append_history("assistant", response_text)
-        else:
-            logger.info("[STEP] GPT応答が構造化されていないため、生の応答を返却") # Since the GPT response is not structured, the raw response will be returned.
-            append_history("assistant", response_text)
+        return {
+            "response": visible_response,
+            "summary": summary
+        }
 
-        final_response, final_emotion = generate_emotion_from_prompt_with_context(
-            user_input=user_input,
-            emotion_structure=emotion_data.get("構成比", {}),
-            best_match=get_best_match(emotion_data)
-        )
+    except LLMBusyError as e:
+        logger.warning(f"⏳ LLM呼び出しが混雑のため拒否: {e}") # Rejected because the LLM dispatcher is busy
+        return busy_response(e)
+    except Exception as e:
+        logger.error(f"❌ エラー発生: {e}") # Error occurred
+        return PlainTextResponse("エラーが発生しました。", status_code=500) # An error has occurred
+
+# 混雑時は 503 と Retry-After を返す
+# Respond 503 with Retry-After while busy
+def busy_response(error: LLMBusyError) -> PlainTextResponse:
+    return PlainTextResponse(
+        "混雑しています。しばらくしてから再度お試しください。", # Busy, please try again shortly
+        status_code=503,
+        headers={"Retry-After": error.retry_after_header}
+    )
+
+# SSE の1イベント分の文字列（data は JSON で送る）
+# One SSE event (data is sent as JSON)
+def format_sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+# /chat のストリーミング版。応答はトークン到着ごとに token イベントで送り、感情JSONは表示から除く。
+# 生成が途中で失敗したときは reset イベントで表示済みのトークンを取り消させ、代替の応答を token で送り直す。
+# 記録・感情更新の後、確定した表示用応答と summary を summary イベントで送り、最後に done を送る。
+# Streaming variant of /chat. The response is sent as token events as it arrives, with the emotion JSON withheld.
+# If generation fails midway, a reset event tells the client to discard the tokens shown so far and the
+# fallback reply is sent again as token events.
+# After persistence, the final display text and summary go out as a summary event, followed by done.
+@app.post("/chat/stream")
+async def chat_stream(
+    message: str = Form(...),
+    session_id: str | None = Form(None),
+    bypass_cache: bool = Form(False),
+    file: UploadFile = File(None),
+    background_tasks: BackgroundTasks = None
+):
+    logger.debug("✅ /chat/stream エンドポイントに到達") # Reached the /chat/stream endpoint
+    session_id = resolve_session_id(session_id)
+    dispatcher = get_llm_dispatcher()
+    if dispatcher.is_saturated():
+        return busy_response(LLMBusyError(dispatcher.retry_after(), "queue_full"))
+    user_input = message
+
+    async def event_stream():
+        try:
+            with turn_scope(session_id) as turn:
+                results = await build_turn_graph(user_input).run()
+
+                display_filter = DisplayStreamFilter()
+                final_response, final_emotion = "", {}
+                events = stream_emotion_from_prompt_with_context(
+                    user_input=user_input,
+                    emotion_structure=results["emotion_data"].get("構成比", {}),
+                    best_match=results["best_match"],
+                    top4_personality=results["personality"],
+                    use_cache=not bypass_cache
+                )
+                # OpenAI のストリームは同期イテレータなので、1チャンクずつスレッドプールで読む
+                # The OpenAI stream is a sync iterator, so each chunk is read in the threadpool
+                async for kind, payload in iterate_in_threadpool(events):
+                    if kind == "delta":
+                        visible = display_filter.feed(payload)
+                        if visible:
+                            yield format_sse("token", {"text": visible})
+                    elif kind == "reset":
+                        display_filter = DisplayStreamFilter()
+                        yield format_sse("reset", {})
+                    else:
+                        final_response, final_emotion = payload
+                # 記号の途中かもしれないとして保留していた末尾を出す
+                # Release the tail held back as a possible partial fence
+                tail = display_filter.flush()
+                if tail:
+                    yield format_sse("token", {"text": tail})
+
+                summary = await run_in_threadpool(persist_turn, final_response, final_emotion)
+                logger.debug(f"🧠 ターン内キャッシュ: {turn.stats()}")  # Turn cache stats
+
+                if background_tasks:
+                    background_tasks.add_task(process_and_cleanup_emotion_data, final_response, session_id)
+
+            yield format_sse("summary", {
+                "response": sanitize_output_for_display(final_response),
+                "summary": summary
+            })
+        except LLMBusyError as e:
+            logger.warning(f"⏳ LLM呼び出しが混雑のため拒否: {e}") # Rejected because the LLM dispatcher is busy
+            yield format_sse("error", {"message": "混雑しています。しばらくしてから再度お試しください。",
+                                       "retry_after": e.retry_after_header})
+        except Exception as e:
+            logger.error(f"❌ ストリーミング中にエラー発生: {e}") # Error occurred while streaming
+            yield format_sse("error", {"message": "エラーが発生しました。"}) # An error has occurred
+        yield format_sse("done", {})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# 応答生成の手前までのステージ（/chat と /chat/stream で共通）
+# 互いに独立した読み込み（インデックス・現在感情・人格傾向・履歴）は並行して実行する。
+# Stages up to response generation (shared by /chat and /chat/stream).
+# Independent reads (index, current emotion, personality, history) run concurrently.
+def build_turn_graph(user_input: str) -> StageGraph:
+    graph = StageGraph("chat")
+    graph.add("append_user", lambda r: append_history("user", user_input))
+    graph.add("index", lambda r: load_and_categorize_index())
+    graph.add("current_emotion", lambda r: load_current_emotion())
+    graph.add("personality", lambda r: get_top_long_emotions())
+    graph.add("history", lambda r: load_history(3), deps=["append_user"])
+    graph.add("analysis", lambda r: generate_gpt_response_from_history(
+        selected_history=r["history"],
+        current_emotion=r["current_emotion"]
+    ), deps=["history", "current_emotion"])
+    graph.add("emotion_data", lambda r: find_response_by_emotion(), deps=["analysis"])
+    graph.add("best_match", lambda r: get_best_match(r["emotion_data"], categorized_index=r["index"]),
+              deps=["emotion_data", "index"])
+    graph.add("matched_response", lambda r: select_matched_response(
+        r["emotion_data"], r["analysis"], r["best_match"]
+    ), deps=["emotion_data", "analysis", "best_match"])
+    return graph
+
+# 生成した応答を履歴・記憶に保存し、現在感情を更新して summary を返す
+# Store the generated response in history and memory, update the current emotion and return the summary
+def persist_turn(final_response: str, final_emotion: dict) -> dict:
+    with timed_stage("persist"):
         append_history("assistant", final_response)
+        # このターンの発言・応答をまとめて1回で書き込む
+        # Write this turn's messages in a single write
+        flush_history()
 
         parsed_emotion_data = save_response_to_memory(final_response)
         if parsed_emotion_data:
@@ -136,34 +338,65 @@ async def chat(
             normalize=True
         )
         save_current_emotion(merged_emotion)
-        summary = summarize_feeling(merged_emotion)
+        return summarize_feeling(merged_emotion)
 
-        if background_tasks:
-            background_tasks.add_task(process_and_cleanup_emotion_data, final_response)
+# 構造化された感情データからインデックス / 各カテゴリの記憶に一致する応答を選び、履歴に追加する
+# Pick the response matched from the index / category memories and append it to the history
+def select_matched_response(emotion_data: dict, response_text, best_match: dict | None):
+    logger.info(f"📨 GPT応答:\n{response_text}")
 
-        visible_response = sanitize_output_for_display(final_response)
+    if emotion_data["type"] == "extracted":
+        logger.info("[STEP] GPT応答から構成比とキーワードを取得済") #Composition and keywords extracted from GPT response
 
-        return {
-            "response": visible_response,
-            "summary": summary
-        }
+        if best_match:
+            logger.info("[STEP] インデックスにマッチした応答を取得") # Retrieved response matched to index
+            response_text = best_match.get("応答", "")
+            append_history("assistant", response_text)
+        else:
+            from datetime import datetime
+            dominant_emotion = next(iter(emotion_data["構成比"]), None)
+            if dominant_emotion:
+                today = datetime.now().strftime("%Y-%m-%d")
+                matched = collect_all_category_responses(
+                    emotion_name=dominant_emotion,
+                    date_str=today
+                )
+                for cat in ["short", "intermediate", "long"]:
+                    if matched.get(cat):
+                        response_text = matched[cat].get("応答", "")
+                        logger.info(f"[STEP] 履歴から {cat} カテゴリの応答を返却") # Returned response from {cat} category in history
+                        append_history("assistant", response_text)
+                        break
 
-    except Exception as e:
-        logger.error(f"❌ エラー発生: {e}") # Error occurred
-        return PlainTextResponse("エラーが発生しました。", status_code=500) # An error has occurred
+            if not response_text:
+                logger.warning("[WARN] 履歴にも一致する応答が見つかりませんでした") # No matching response found in history
+                response_text = "ごめんなさい、うまく思い出せませんでした。" # I'm sorry, I couldn't recall it properly.
+                append_history("assistant", response_text)
+    else:
+        logger.info("[STEP] GPT応答が構造化されていないため、生の応答を返却") # Since the GPT response is not structured, the raw response will be returned.
+        append_history("assistant", response_text)
+
+    return response_text
 
-def store_emotion_structured_data(response_text: str):
+def store_emotion_structured_data(response_text: str, session_id: str | None = None):
     logger.info("🧩 store_emotion_structured_data() が呼び出されました")
     parsed_emotion_data = save_response_to_memory(response_text)
     if parsed_emotion_data:
-        write_structured_emotion_data(parsed_emotion_data)
+        write_structured_emotion_data(parsed_emotion_data, session_id)
     else:
         logger.warning("⚠ 背景タスク：構造データの抽出に失敗したため、保存をスキップ") # Background task: Skipped saving due to failure in extracting structured data
 
-def process_and_cleanup_emotion_data(response_text: str):
+# 背景タスクはターンの外で動くため、セッションを引数で受け取る
+# Background tasks run outside the turn, so they take the session as an argument
+def process_and_cleanup_emotion_data(response_text: str, session_id: str | None = None):
     logger.info("🔄 感情データの保存と忘却処理を開始します") # Starting emotion data saving and oblivion processing
-    store_emotion_structured_data(response_text)
+    store_emotion_structured_data(response_text, session_id)
     logger.info("🧹 感情データ保存後、忘却処理を実行します") # After saving emotion data, executing oblivion processing
-    run_oblivion_cleanup_all()
+    with timed_stage("oblivion"):
+        run_oblivion_cleanup_all(session_id)
     logger.info("✅ 感情データ保存＋忘却処理 完了") # Emotion data saving and oblivion processing completed
-uvicorn.run(app,host="localhost",port=8080)
\ No newline at end of file
+
+# 直接実行時のみサーバーを起動（uvicorn main:app / テストからの import では起動しない）
+# Start the server only when run directly (not under `uvicorn main:app` or when imported by tests)
+if __name__ == "__main__":
+    uvicorn.run(app,host="localhost",port=8080)
\ No newline at end of file
@@ -3,20 +3,28 @@ import os
 import json
 from collections import Counter
 
-from module.mongo.mongo_client import get_mongo_client
+from module.mongo.repository import find_emotion_labels_by_category
 from module.utils.utils import logger
 from module.params import emotion_map
+from module.utils.turn_context import turn_cached, current_session_id
+from module.utils.session_cache import get_session_cache
 
 # MongoDBからlongカテゴリのemotionをカウントし、出現頻度の高い感情トップ4（日本語）を返す。
 # Count emotions in the 'long' category from MongoDB and return the top 4 most frequent emotions (in Japanese).
-def get_top_long_emotions():
+# 1ターン内では1回だけ、ターンをまたいではセッション別キャッシュから返す
+# Computed once per turn; across turns served from the per-session cache
+def get_top_long_emotions(session_id: str | None = None):
+    session_id = session_id or current_session_id()
+    return turn_cached(
+        ("personality", session_id),
+        get_session_cache().get_or_load,
+        session_id, "personality", lambda: _count_top_long_emotions(session_id)
+    )
+
+def _count_top_long_emotions(session_id: str):
     try:
-        client = get_mongo_client()
-        db = client["emotion_db"]
-        collection = db["emotion_data"]
-
-        logger.info("📡 MongoDBクライアント接続完了 → longカテゴリを走査")  # MongoDB client connected → scanning 'long' category
-        long_docs = collection.find({"category": "long"})
+        logger.info("📡 longカテゴリの感情ラベルを取得")  # Fetching emotion labels in the 'long' category
+        long_docs = find_emotion_labels_by_category("long", session_id)
 
         counter = Counter()
         for i, doc in enumerate(long_docs, start=1):
@@ -4,7 +4,9 @@ import json
 from datetime import datetime
 
 from module.utils.utils import logger
-from module.mongo.mongo_client import get_mongo_client
+from module.mongo.repository import find_latest_current_emotion, insert_current_emotion
+from module.utils.turn_context import turn_cached, turn_cache_set, current_session_id
+from module.utils.session_cache import get_session_cache
 from module.params import emotion_map, emotion_map_reverse
 
 # 🔸 構成比を32感情に正規化（日本語キー順）
@@ -12,16 +14,20 @@ from module.params import emotion_map, emotion_map_reverse
 def normalize_composition_vector(raw_composition: dict) -> dict:
     return {emotion: raw_composition.get(emotion, 0) for emotion in emotion_map_reverse.keys()}
 
-# 現在感情：読み込み
-# Load current emotion
-def load_current_emotion():
+# 現在感情：読み込み（1ターン内では1回だけ、ターンをまたいではセッション別キャッシュから）
+# Load current emotion (once per turn; across turns from the per-session cache)
+def load_current_emotion(session_id: str | None = None):
+    session_id = session_id or current_session_id()
+    return turn_cached(
+        ("current_emotion", session_id),
+        get_session_cache().get_or_load,
+        session_id, "current_emotion", lambda: _load_current_emotion_from_db(session_id)
+    )
+
+def _load_current_emotion_from_db(session_id: str):
     try:
-        client = get_mongo_client()
-        if client:
-            db = client["emotion_db"]
-            collection = db["current_emotion"]
-            latest = collection.find_one(sort=[("timestamp", -1)])
-            return latest["emotion_vector"] if latest else {}
+        latest = find_latest_current_emotion(session_id)
+        return latest["emotion_vector"] if latest else {}
     except Exception as e:
         logger.error(f"[ERROR] 現在感情の読み込みに失敗: {e}")  # Failed to load current emotion
         return {}
@@ -93,18 +99,17 @@ def merge_emotion_vectors(
 
 # 現在感情：保存
 # Save current emotion
-def save_current_emotion(emotion_vector):
+def save_current_emotion(emotion_vector, session_id: str | None = None):
     try:
-        client = get_mongo_client()
-        if client:
-            db = client["emotion_db"]
-            collection = db["current_emotion"]
-            entry = {
-                "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                "emotion_vector": emotion_vector
-            }
-            collection.insert_one(entry)
-            logger.info("[INFO] 現在感情をMongoDBに保存しました")  # Current emotion saved to MongoDB
+        session_id = session_id or current_session_id()
+        entry = {
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "emotion_vector": emotion_vector
+        }
+        insert_current_emotion(entry, session_id)
+        turn_cache_set(("current_emotion", session_id), emotion_vector)
+        get_session_cache().set(session_id, "current_emotion", emotion_vector)
+        logger.info("[INFO] 現在感情をスプール経由でMongoDBに保存しました")  # Current emotion saved to MongoDB via the spool
     except Exception as e:
         logger.error(f"[ERROR] 現在感情の保存に失敗: {e}")  # Failed to save current emotion
 
@@ -6,8 +6,10 @@ from datetime import datetime
 from collections import defaultdict, Counter
 
 from module.utils.utils import logger
-from module.mongo.mongo_client import get_mongo_client
+from module.mongo.repository import insert_index_entry
+from module.response.index_cache import get_index_cache
 from module.params import emotion_map 
+from module.utils.turn_context import current_session_id
 
 # ✅ 正規順の日本語感情リスト（英語順に並べ替え）
 # ✅ Ordered list of Japanese emotions sorted by English order
@@ -15,16 +17,9 @@ emotion_order = [emotion_map[en] for en in sorted(emotion_map.keys()) if en in e
 
 # 感情構造データを MongoDB Atlas の emotion_db.emotion_index に保存する。
 # Save emotion structure data to MongoDB Atlas emotion_db.emotion_index.
-def save_index_data(data: dict, emotion_en: str, category: str):
+def save_index_data(data: dict, emotion_en: str, category: str, session_id: str | None = None):
     try:
-        client = get_mongo_client()
-        if client is None:
-            logger.error("❌ MongoDBクライアント取得に失敗")  # Failed to obtain MongoDB client
-            return
-
-        db = client["emotion_db"]
-        collection = db["emotion_index"]
-
+        session_id = session_id or current_session_id()
         # 🔧 構成比32感情ベクトル（emotion_mapの英語順 → 日本語で格納）
         # 🔧 Full 32 emotion composition vector (stored in Japanese order based on English order in emotion_map)
         full_composition = {}
@@ -47,8 +42,12 @@ def save_index_data(data: dict, emotion_en: str, category: str):
             "category": category
         }
 
-        result = collection.insert_one(index_document)
-        logger.info(f"✅ インデックス保存成功: _id={result.inserted_id} / date={data['date']}")  # Index saved successfully
+        inserted_id = insert_index_entry(index_document, session_id)
+        logger.info(f"✅ インデックス保存受付: _id={inserted_id} / date={data['date']}")  # Index save accepted
+
+        # このプロセスのインデックスキャッシュ（転置インデックス）にすぐ反映する
+        # Reflect it in this process's index cache (inverted index) right away
+        get_index_cache().add(session_id, {**index_document, "_id": inserted_id})
 
     except Exception as e:
         logger.error(f"❌ インデックス保存中にエラー: {e}")  # Error occurred while saving index
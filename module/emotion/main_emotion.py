@@ -6,8 +6,10 @@ import re
 from datetime import datetime
 
 from module.utils.utils import logger
-from module.mongo.mongo_client import get_mongo_client
+from module.mongo.repository import insert_emotion_data
 from module.emotion.index_emotion import save_index_data
+from module.utils.turn_context import current_session_id
+from module.utils.session_cache import get_session_cache
 from module.params import emotion_map, emotion_map_reverse
 
 
@@ -48,16 +50,9 @@ def save_response_to_memory(response_text: str) -> dict | None:
 
 # 抽出済みの感情構造データ（JSON）を MongoDB Atlas の emotion_db.emotion_data に保存する。
 # Save the extracted emotion structure data (JSON) to MongoDB Atlas emotion_db.emotion_data.
-def write_structured_emotion_data(data: dict):
+def write_structured_emotion_data(data: dict, session_id: str | None = None):
     try:
-        client = get_mongo_client()
-        if client is None:
-            logger.error("❌ MongoDBクライアント取得に失敗")  # Failed to obtain MongoDB client
-            return
-
-        db = client["emotion_db"]
-        collection = db["emotion_data"]
-
+        session_id = session_id or current_session_id()
         # 主感情を英語に変換
         # Convert main emotion to English
         main_emotion_ja = data.get("主感情", "")
@@ -85,10 +80,14 @@ def write_structured_emotion_data(data: dict):
             "履歴": [data.copy()]  # History
         }
 
-        # MongoDBへ保存（新規挿入）
-        # Save to MongoDB (insert)
-        result = collection.insert_one(document)
-        logger.info(f"✅ MongoDB保存成功: _id={result.inserted_id}, 感情={main_emotion_en}, カテゴリ={category}")  # MongoDB save successful
+        # MongoDBへ保存（新規挿入、スプール経由）
+        # Save to MongoDB (insert, through the spool)
+        inserted_id = insert_emotion_data(document, session_id)
+        logger.info(f"✅ MongoDB保存受付: _id={inserted_id}, 感情={main_emotion_en}, カテゴリ={category}")  # MongoDB save accepted
+        if category == "long":
+            # 人格傾向は long の件数から求めるため、次のターンで数え直す
+            # Personality is counted from long memories, so recount it on the next turn
+            get_session_cache().invalidate(session_id, "personality")
         
         # 🔄 インデックスにも同時保存
         # Also save to index simultaneously
@@ -96,7 +95,8 @@ def write_structured_emotion_data(data: dict):
             save_index_data(
                 data=data,
                 emotion_en=main_emotion_en,
-                category=category
+                category=category,
+                session_id=session_id
             )
         else:
             logger.warning("⚠ dateが存在しないためインデックス保存スキップ")  # Skipped index saving because date is missing
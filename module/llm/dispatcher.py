@@ -0,0 +1,201 @@
+# module/llm/dispatcher.py
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+DEFAULT_SESSION = "default"
+
+
+class LLMBusyError(RuntimeError):
+    """
+    待ち行列が満杯、または待ち時間の上限を超えたときに送出される。
+    retry_after は再試行までの目安（秒）。
+
+    Raised when the wait queue is full or the wait exceeded its limit.
+    retry_after is the suggested delay before retrying, in seconds.
+    """
+
+    def __init__(self, retry_after: float, reason: str):
+        super().__init__(f"LLM dispatcher busy ({reason}), retry after {retry_after:.1f}s")
+        self.retry_after = retry_after
+        self.reason = reason
+
+    # Retry-After ヘッダー用の整数秒
+    # Whole seconds for the Retry-After header
+    @property
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class _Ticket:
+    __slots__ = ("session", "event", "granted", "enqueued_at")
+
+    def __init__(self, session: str):
+        self.session = session
+        self.event = threading.Event()
+        self.granted = False
+        self.enqueued_at = time.monotonic()
+
+
+class LLMDispatcher:
+    """
+    OpenAI 呼び出しの同時実行数を max_concurrency に制限する。
+    - 空きが無ければ最大 max_queue 件まで待ち行列に入れ、セッションごとに順番に（ラウンドロビンで）枠を渡す
+    - 待ち行列が満杯なら即座に LLMBusyError を送出する（retry_after 付き）
+    - queue_timeout 秒待っても枠が空かなければ LLMBusyError を送出する
+    呼び出しはスレッドプール上の同期処理なので、threading で待つ。
+
+    Caps concurrent OpenAI calls at max_concurrency.
+    - Without a free slot, up to max_queue callers wait; freed slots go to sessions in turn (round robin)
+    - When the queue is full, LLMBusyError (with retry_after) is raised immediately
+    - When no slot frees up within queue_timeout seconds, LLMBusyError is raised
+    Calls are synchronous work in the threadpool, so waiting uses threading primitives.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 8,
+        max_queue: int = 32,
+        queue_timeout: float = 20.0,
+        initial_service_time: float = 3.0
+    ):
+        self.max_concurrency = max(max_concurrency, 1)
+        self.max_queue = max(max_queue, 0)
+        self.queue_timeout = queue_timeout
+
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._queued = 0
+        self._queues = OrderedDict()  # session -> deque[_Ticket]（先頭が次の番） # first session is next in turn
+        self._service_ewma = initial_service_time
+
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.max_queued_seen = 0
+        self._wait_total = 0.0
+
+    def acquire(self, session_id: str | None = None) -> float:
+        session = session_id or DEFAULT_SESSION
+        with self._lock:
+            if self._in_flight < self.max_concurrency and self._queued == 0:
+                self._in_flight += 1
+                self.admitted += 1
+                return 0.0
+            if self._queued >= self.max_queue:
+                self.rejected += 1
+                raise LLMBusyError(self._retry_after_locked(), "queue_full")
+            ticket = _Ticket(session)
+            self._queues.setdefault(session, deque()).append(ticket)
+            self._queued += 1
+            self.max_queued_seen = max(self.max_queued_seen, self._queued)
+
+        ticket.event.wait(self.queue_timeout)
+        with self._lock:
+            # 待ち切れと同時に枠を渡された場合は、そのまま実行する
+            # A slot handed over right as the wait expired is still used
+            if not ticket.granted:
+                self._remove_locked(ticket)
+                self.timed_out += 1
+                raise LLMBusyError(self._retry_after_locked(), "queue_timeout")
+            waited = time.monotonic() - ticket.enqueued_at
+            self.admitted += 1
+            self._wait_total += waited
+            return waited
+
+    # 枠を返す。待ちがあれば次のセッションに直接渡す（in_flight は減らさない）
+    # Return a slot; with callers waiting it is handed to the next session directly (in_flight unchanged)
+    def release(self, service_time: float | None = None):
+        with self._lock:
+            if service_time is not None:
+                self._service_ewma = 0.8 * self._service_ewma + 0.2 * service_time
+            ticket = self._next_ticket_locked()
+            if ticket is None:
+                self._in_flight -= 1
+                return
+            ticket.granted = True
+            ticket.event.set()
+
+    # with dispatcher.slot(session_id): の中で OpenAI を呼ぶ
+    # Call OpenAI inside `with dispatcher.slot(session_id):`
+    @contextmanager
+    def slot(self, session_id: str | None = None):
+        self.acquire(session_id)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - start)
+
+    # 待ち行列が満杯か（処理を始める前の早期拒否用）
+    # Whether the queue is full (for rejecting before any work starts)
+    def is_saturated(self) -> bool:
+        with self._lock:
+            return self._in_flight >= self.max_concurrency and self._queued >= self.max_queue
+
+    def retry_after(self) -> float:
+        with self._lock:
+            return self._retry_after_locked()
+
+    # 先頭のセッションから1件取り出し、まだ待ちがあればそのセッションを最後尾に回す
+    # Take one ticket from the first session and move that session to the back if it still has waiters
+    def _next_ticket_locked(self) -> _Ticket | None:
+        if not self._queues:
+            return None
+        session, queue = next(iter(self._queues.items()))
+        ticket = queue.popleft()
+        self._queued -= 1
+        if queue:
+            self._queues.move_to_end(session)
+        else:
+            del self._queues[session]
+        return ticket
+
+    def _remove_locked(self, ticket: _Ticket):
+        queue = self._queues.get(ticket.session)
+        if queue is None or ticket not in queue:
+            return
+        queue.remove(ticket)
+        self._queued -= 1
+        if not queue:
+            del self._queues[ticket.session]
+
+    # 前に並んでいる分が今の同時実行数で捌けるまでの目安時間
+    # Estimated time for the callers ahead to drain at the current concurrency
+    def _retry_after_locked(self) -> float:
+        return max(1.0, (self._queued + 1) * self._service_ewma / self.max_concurrency)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "in_flight": self._in_flight,
+                "queued": self._queued,
+                "queued_by_session": {s: len(q) for s, q in self._queues.items()},
+                "max_concurrency": self.max_concurrency,
+                "max_queue": self.max_queue,
+                "max_queued_seen": self.max_queued_seen,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+                "avg_wait_ms": round(self._wait_total / self.admitted * 1000, 2) if self.admitted else 0.0,
+                "service_time_ewma_ms": round(self._service_ewma * 1000, 2)
+            }
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+def get_llm_dispatcher() -> LLMDispatcher:
+    global _dispatcher
+    if _dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                from module.params import LLM_MAX_CONCURRENCY, LLM_MAX_QUEUE, LLM_QUEUE_TIMEOUT
+                _dispatcher = LLMDispatcher(
+                    max_concurrency=LLM_MAX_CONCURRENCY,
+                    max_queue=LLM_MAX_QUEUE,
+                    queue_timeout=LLM_QUEUE_TIMEOUT
+                )
+    return _dispatcher
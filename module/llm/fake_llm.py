@@ -0,0 +1,297 @@
+# module/llm/fake_llm.py
+import argparse
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from types import SimpleNamespace
+
+import httpx
+import openai
+
+from module.llm.response_cache import make_cache_key
+
+FAKE_BASE_URL = "http://fake-llm.local/v1"
+FAKE_EMOTIONS = ["喜び", "期待", "信頼", "驚き", "好奇心", "希望", "愛", "感傷", "不安", "悲しみ"]
+FAKE_REPLIES = [
+    "こんにちは、ご主人。お話しできてうれしいです。",
+    "なるほど、そういうことだったのですね。もう少し聞かせてください。",
+    "覚えておきますね。あなたの言葉はちゃんと記憶に残っています。",
+    "少し考えてみました。きっと大丈夫だと思います。",
+]
+
+
+class LatencyModel:
+    """
+    擬似応答の待ち時間（ミリ秒）の分布。仕様文字列で指定する。
+    - "0" / ""                  : 待たない
+    - "fixed:800"               : 常に 800ms
+    - "uniform:300:1200"        : 300〜1200ms の一様分布
+    - "lognormal:800:0.4"       : 中央値 800ms、σ=0.4 の対数正規分布（実際の API に近い裾の長さ）
+    seed を固定すると、同じ順番で同じ値を返す。
+
+    Latency distribution (milliseconds) for fake completions, given as a spec string.
+    - "0" / ""                  : no delay
+    - "fixed:800"               : always 800ms
+    - "uniform:300:1200"        : uniform between 300 and 1200ms
+    - "lognormal:800:0.4"       : lognormal with median 800ms and sigma 0.4 (long tail like the real API)
+    With a fixed seed the same sequence of values is returned.
+    """
+
+    def __init__(self, spec: str = "0", seed: int = 0):
+        self.spec = spec or "0"
+        kind, *args = self.spec.split(":")
+        self.kind = kind
+        self.args = [float(a) for a in args]
+        if kind not in ("0", "fixed", "uniform", "lognormal"):
+            raise ValueError(f"unknown latency spec: {spec}")
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample_ms(self) -> float:
+        with self._lock:
+            if self.kind == "fixed":
+                return self.args[0]
+            if self.kind == "uniform":
+                return self._rng.uniform(self.args[0], self.args[1])
+            if self.kind == "lognormal":
+                return self._rng.lognormvariate(math.log(self.args[0]), self.args[1])
+            return 0.0
+
+
+# 入力メッセージから決まる擬似応答（自然文 + 構成比 + ```json 感情ブロック）
+# Fake completion determined by the input messages (reply + 構成比 line + ```json emotion block)
+def fake_completion_text(messages: list[dict]) -> str:
+    digest = hashlib.sha256(json.dumps(messages, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+    rng = random.Random(int(digest[:16], 16))
+
+    emotions = rng.sample(FAKE_EMOTIONS, 3)
+    first = rng.randrange(40, 71, 5)
+    second = rng.randrange(10, 100 - first - 5 + 1, 5)
+    ratios = dict(zip(emotions, [first, second, 100 - first - second]))
+
+    user_text = messages[-1].get("content", "") if messages else ""
+    utterance = re.search(r"ユーザー発言: (.*)", user_text)
+    topic = (utterance.group(1) if utterance else user_text).strip()[:12] or "対話"
+
+    emotion_data = {
+        "date": "",
+        "データ種別": "emotion",
+        "重み": rng.randint(30, 79),
+        "主感情": emotions[0],
+        "構成比": ratios,
+        "状況": f"ユーザーが「{topic}」について話しかけた場面",
+        "心理反応": f"{emotions[0]}を中心に、穏やかに受け止めた",
+        "関係性変化": "対話を通じて少し距離が縮まった",
+        "関連": ["日常会話"],
+        "keywords": [topic]
+    }
+    ratio_text = "、".join(f"{k}:{v}%" for k, v in ratios.items())
+    return (
+        f"{rng.choice(FAKE_REPLIES)}\n（感情　{ratio_text}）\n\n"
+        f"```json\n{json.dumps(emotion_data, ensure_ascii=False, indent=2)}\n```"
+    )
+
+
+def _completion(content: str):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(role="assistant", content=content))])
+
+
+def _chunk(content: str):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content))])
+
+
+def _split_chunks(text: str, size: int = 4) -> list[str]:
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def _timeout_error():
+    return openai.APITimeoutError(request=httpx.Request("POST", f"{FAKE_BASE_URL}/chat/completions"))
+
+
+class FakeChatClient:
+    """
+    OpenAI クライアントの代わりに使う、ネットワーク不要の擬似クライアント。
+    client.chat.completions.create(messages=..., stream=..., timeout=..., **params) だけを実装する。
+    - 応答内容は入力メッセージから決定的に決まる（fake_completion_text）
+    - 最初の応答までの待ち時間は LatencyModel、ストリームのチャンク間隔は chunk_delay_ms
+    - 待ち時間が timeout を超える場合は openai.APITimeoutError を送出する
+
+    Network-free stand-in for the OpenAI client.
+    Implements only client.chat.completions.create(messages=..., stream=..., timeout=..., **params).
+    - Content is a deterministic function of the input messages (fake_completion_text)
+    - Time to first response follows the LatencyModel; stream chunks are chunk_delay_ms apart
+    - Raises openai.APITimeoutError when the latency exceeds timeout
+    """
+
+    def __init__(self, latency: LatencyModel | None = None, chunk_delay_ms: float = 0.0):
+        self.latency = latency or LatencyModel()
+        self.chunk_delay_ms = chunk_delay_ms
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, messages: list[dict], stream: bool = False, timeout: float | None = None, **params):
+        self.calls += 1
+        delay = self.latency.sample_ms() / 1000
+        if timeout is not None and delay > timeout:
+            time.sleep(timeout)
+            raise _timeout_error()
+        time.sleep(delay)
+
+        content = fake_completion_text(messages)
+        if not stream:
+            return _completion(content)
+        return self._stream(content)
+
+    def _stream(self, content: str):
+        for piece in _split_chunks(content):
+            if self.chunk_delay_ms:
+                time.sleep(self.chunk_delay_ms / 1000)
+            yield _chunk(piece)
+
+
+class CassetteMissError(LookupError):
+    """
+    replay モードで、カセットに記録の無い呼び出しがあった。
+    A call in replay mode had no recorded completion in the cassette.
+    """
+
+
+class CassetteClient:
+    """
+    実際の応答をカセット（JSONL ファイル）に記録し、再生する。
+    キーは make_cache_key（メッセージ + サンプリング設定。stream / timeout は含めない）。
+    - "record": 記録があれば再生し、無ければ inner を呼んで記録に追記する
+    - "replay": 記録だけを返し、無ければ CassetteMissError（ネットワークを使わない）
+    ストリーミング呼び出しも、記録済みの全文をチャンクに分けて返す。
+
+    Records real completions to a cassette (JSONL file) and replays them.
+    Keyed by make_cache_key (messages + sampling params, excluding stream / timeout).
+    - "record": replays a recorded completion, otherwise calls inner and appends it to the cassette
+    - "replay": returns recordings only and raises CassetteMissError otherwise (no network)
+    Streaming calls replay the recorded text split into chunks.
+    """
+
+    def __init__(self, inner, path: str, mode: str = "replay"):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"unknown cassette mode: {mode}")
+        if mode == "record" and inner is None:
+            raise ValueError("record mode needs a client to record from")
+        self.inner = inner
+        self.path = path
+        self.mode = mode
+        self._lock = threading.Lock()
+        self._entries = {}
+        self.hits = 0
+        self.recorded = 0
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._entries[entry["key"]] = entry["content"]
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, messages: list[dict], stream: bool = False, timeout: float | None = None, **params):
+        key = make_cache_key(messages, params)
+        with self._lock:
+            content = self._entries.get(key)
+        if content is not None:
+            self.hits += 1
+            return self._stream(content) if stream else _completion(content)
+        if self.mode == "replay":
+            raise CassetteMissError(f"no recorded completion for key {key[:12]} in {self.path}")
+
+        if not stream:
+            content = self.inner.chat.completions.create(messages=messages, timeout=timeout, **params).choices[0].message.content
+            self._record(key, messages, params, content)
+            return _completion(content)
+        return self._record_stream(key, messages, params, timeout)
+
+    def _stream(self, content: str):
+        for piece in _split_chunks(content):
+            yield _chunk(piece)
+
+    # 受け取ったチャンクをそのまま流し、最後まで読めたら全文を記録する
+    # Pass chunks through as they arrive and record the full text once the stream completes
+    def _record_stream(self, key: str, messages: list[dict], params: dict, timeout: float | None):
+        parts = []
+        for chunk in self.inner.chat.completions.create(messages=messages, stream=True, timeout=timeout, **params):
+            if chunk.choices and chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+            yield chunk
+        self._record(key, messages, params, "".join(parts))
+
+    def _record(self, key: str, messages: list[dict], params: dict, content: str):
+        entry = {"key": key, "params": params, "messages": messages, "content": content}
+        with self._lock:
+            self._entries[key] = content
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self.recorded += 1
+
+
+# OpenAI 互換の HTTP サーバー（/v1/chat/completions）。OPENAI_BASE_URL を向ければ SDK ごと試せる
+# OpenAI-compatible HTTP server (/v1/chat/completions); point OPENAI_BASE_URL at it to exercise the SDK too
+def create_fake_app(client: FakeChatClient | None = None):
+    from fastapi import FastAPI
+    from fastapi.responses import StreamingResponse
+
+    client = client or FakeChatClient()
+    app = FastAPI()
+
+    @app.post("/v1/chat/completions")
+    def chat_completions(body: dict):
+        model = body.get("model", "fake")
+        created = int(time.time())
+        result = client.create(messages=body.get("messages", []), stream=bool(body.get("stream")))
+        if not body.get("stream"):
+            return {
+                "id": f"chatcmpl-fake-{client.calls}",
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": result.choices[0].message.content},
+                    "finish_reason": "stop"
+                }]
+            }
+
+        def events():
+            for chunk in result:
+                payload = {
+                    "id": f"chatcmpl-fake-{client.calls}",
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {"content": chunk.choices[0].delta.content}, "finish_reason": None}]
+                }
+                yield f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+    from module.params import LLM_FAKE_LATENCY, LLM_FAKE_CHUNK_DELAY_MS, LLM_FAKE_SEED
+
+    parser = argparse.ArgumentParser(description="OpenAI 互換の擬似 LLM サーバー / OpenAI-compatible fake LLM server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8010)
+    parser.add_argument("--latency", default=LLM_FAKE_LATENCY)
+    parser.add_argument("--chunk-delay-ms", type=float, default=LLM_FAKE_CHUNK_DELAY_MS)
+    args = parser.parse_args()
+
+    fake = FakeChatClient(LatencyModel(args.latency, seed=LLM_FAKE_SEED), chunk_delay_ms=args.chunk_delay_ms)
+    uvicorn.run(create_fake_app(fake), host=args.host, port=args.port)
@@ -4,18 +4,44 @@ import json
 import os
 import threading
 from datetime import datetime
-from nrclex import NRCLex#感情のスコア出す
-from translate import Translator#翻訳ライブラリー
-import MeCab
 
-from module.utils.utils import load_history, load_system_prompt_cached, load_emotion_prompt, load_dialogue_prompt, logger
-from module.params import OPENAI_MODEL, OPENAI_TEMPERATURE, OPENAI_TOP_P, OPENAI_MAX_TOKENS
+from module.utils.utils import load_history, load_system_prompt_cached, load_emotion_prompt, load_dialogue_system_prompt, logger, history_analysis
+from module.params import OPENAI_MODEL, OPENAI_TEMPERATURE, OPENAI_TOP_P, OPENAI_MAX_TOKENS, LLM_CACHE_ENABLED, LLM_INPUT_TOKEN_BUDGET
+from module.params import LLM_REQUEST_TIMEOUT, LLM_BACKEND, LLM_CASSETTE_PATH, LLM_DEGRADED_RESPONSE
+from module.params import LLM_FAKE_LATENCY, LLM_FAKE_CHUNK_DELAY_MS, LLM_FAKE_SEED, EMOTION_ENGINE
 from module.mongo.emotion_dataset import get_recent_dialogue_history
 from module.emotion.basic_personality import get_top_long_emotions
 from module.emotion.emotion_stats import load_current_emotion
-
-
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+from module.utils.turn_context import turn_cached, turn_cache_set, current_session_id
+from module.llm.dispatcher import get_llm_dispatcher, LLMBusyError
+from module.llm.response_cache import get_response_cache, make_cache_key
+from module.llm.token_budget import PromptSection, fit_sections, MESSAGE_OVERHEAD_TOKENS
+from module.llm.resilience import resilient_call, get_circuit_breaker
+from module.llm.fake_llm import FakeChatClient, LatencyModel, CassetteClient
+from module.utils.stage_graph import timed_stage
+from module.nlp.message_analysis import aggregate_analyses
+
+
+# LLM_BACKEND に応じたクライアントを作る（どれも client.chat.completions.create で呼べる）
+# Build the client for LLM_BACKEND (all are called through client.chat.completions.create)
+def create_llm_client(backend: str = LLM_BACKEND):
+    if backend == "fake":
+        logger.info("🧪 擬似 LLM バックエンドを使用します")  # Using the fake LLM backend
+        return FakeChatClient(LatencyModel(LLM_FAKE_LATENCY, seed=LLM_FAKE_SEED), chunk_delay_ms=LLM_FAKE_CHUNK_DELAY_MS)
+    if backend == "replay":
+        logger.info(f"📼 カセットを再生します: {LLM_CASSETTE_PATH}")  # Replaying the cassette
+        return CassetteClient(None, LLM_CASSETTE_PATH, mode="replay")
+
+    # 再試行は resilient_call 側で行うため、SDK の自動再試行は切る
+    # Retries are handled by resilient_call, so the SDK's own retries are disabled
+    openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0, timeout=LLM_REQUEST_TIMEOUT)
+    if backend == "record":
+        logger.info(f"📼 カセットに記録します: {LLM_CASSETTE_PATH}")  # Recording to the cassette
+        return CassetteClient(openai_client, LLM_CASSETTE_PATH, mode="record")
+    return openai_client
+
+
+client = create_llm_client()
 
 
 def extract_emotion_json_block(response_text: str) -> dict | None:
@@ -45,18 +71,40 @@ def extract_emotion_json_block(response_text: str) -> dict | None:
     return None
 
 
-def generate_gpt_response_from_history() -> tuple[str, dict]:
+# 履歴ベースの感情分析。1ターン内では最初の呼び出し結果を再利用する
+# （main の analysis ステージ / find_response_by_emotion / 応答生成のフォールバックで共有）
+# History-based emotion analysis. Within a turn the first result is reused
+# (shared by main's analysis stage, find_response_by_emotion and the generation fallback).
+def generate_gpt_response_from_history(
+    selected_history: list[dict] | None = None,
+    current_emotion: dict | None = None
+) -> tuple[str, dict]:
+    return turn_cached(
+        "history_analysis",
+        _generate_gpt_response_from_history,
+        selected_history,
+        current_emotion
+    )
+
+def _generate_gpt_response_from_history(
+    selected_history: list[dict] | None = None,
+    current_emotion: dict | None = None
+) -> tuple[str, dict]:
     logger.info("[START] generate_gpt_response_from_history")
     generation_time = datetime.now().strftime("%Y%m%d%H%M%S")
 
     system_prompt = load_system_prompt_cached()
     emotion_prompt = load_emotion_prompt()
 
-    logger.info("[INFO] 履歴取得中...")
-    selected_history = load_history(3)
+    # 呼び出し元で取得済みの履歴・現在感情があれば再利用する
+    # Reuse history / current emotion already loaded by the caller
+    if selected_history is None:
+        logger.info("[INFO] 履歴取得中...")
+        selected_history = load_history(3)
     logger.info(f"[INFO] 履歴件数: {len(selected_history)} 件")
 
-    current_emotion = load_current_emotion()
+    if current_emotion is None:
+        current_emotion = load_current_emotion()
     logger.info(f"[INFO] 現在感情ベクトル: {current_emotion}")
 
     if current_emotion:
@@ -91,33 +139,20 @@ def generate_gpt_response_from_history() -> tuple[str, dict]:
 
         formatted_history.append({
             "role": entry.get("role", "user"),
-            "content": message
+            "content": message,
+            "analysis": entry.get("analysis")
         })
 
     try:
-        logger.info("NRCLex呼び出し開始")
-        # 翻訳 → 感情分析
-        translator = Translator(from_lang="ja", to_lang="en")
-        english_message = translator.translate(message)
-        text = NRCLex(english_message)
-        # 英語→日本語変換マッピング
-        key_mapping = {
-            'fear': '恐れ', 'anger': '怒り', 'anticip': '期待', 'trust': '信頼',
-            'surprise': '驚き', 'positive': '積極性', 'negative': '悲観',
-            'sadness': '悲しみ', 'disgust': '嫌悪', 'joy': '喜び',
-        }
-        # 感情構成比の整形
-        emotion = {key_mapping.get(k, k): v for k, v in text.affect_frequencies.items()}
-        # MeCabによる名詞抽出
-        mecab = MeCab.Tagger()
-        result = mecab.parseToNode(message)
-        taglist = []
-        while result:
-            word = result.surface
-            tag = result.feature.split(",")[0]
-            if tag == "名詞" and word:
-                taglist.append(word)
-            result = result.next
+        # メッセージごとの分析結果（append_history で保存済み）を新しい順に集計する。
+        # 保存済みの結果が無い旧形式のメッセージだけをここで分析する
+        # Aggregate the per-message analyses (stored by append_history), newest first;
+        # only legacy messages without a stored analysis are analysed here
+        analyses = [history_analysis(h["content"], entry) for h, entry in zip(formatted_history, selected_history)]
+        aggregated = aggregate_analyses(analyses)
+        emotion = aggregated["構成比"]
+        taglist = aggregated["keywords"]
+        logger.info(f"[INFO] 履歴分析: {len(analyses)} 件を集計 (lang={aggregated['lang']}, engine={EMOTION_ENGINE})")  # Aggregated history analysis
         # fallback_emotion_data の構築
         fallback_emotion_data = {
             "date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
@@ -134,17 +169,168 @@ def generate_gpt_response_from_history() -> tuple[str, dict]:
 def generate_emotion_from_prompt_with_context(
     user_input: str,
     emotion_structure: dict,
-    best_match: dict | None
+    best_match: dict | None,
+    top4_personality: list[tuple[str, int]] | None = None,
+    use_cache: bool = True
 ) -> tuple[str, dict]:
     generation_time = datetime.now().strftime("%Y%m%d%H%M%S")
 
-    system_prompt = (
-        load_system_prompt_cached()
-        + "\n\n"
-        + load_dialogue_prompt()
-    )
+    if best_match is None:
+        return _fallback_from_history(generation_time)
 
-    top4_personality = get_top_long_emotions()
+    messages = build_context_messages(user_input, best_match, top4_personality)
+    params = completion_params()
+
+    cache_key = _response_cache_key(messages, params, use_cache)
+    cached = get_response_cache().get(cache_key) if cache_key else None
+    if cached is not None:
+        logger.info("♻️ LLM応答キャッシュにヒット")  # LLM response cache hit
+        return finalize_emotion_response(cached, generation_time)
+
+    if get_circuit_breaker().is_open():
+        return _fallback_from_provider_failure(generation_time, "circuit open")
+
+    try:
+        # 同時実行数の上限を超える分は待ち行列で待つ（満杯なら LLMBusyError を呼び出し元へ）
+        # Calls beyond the concurrency cap wait in the queue (LLMBusyError goes to the caller when full)
+        with get_llm_dispatcher().slot(current_session_id()), timed_stage("llm"):
+            response = resilient_call(
+                lambda timeout: client.chat.completions.create(messages=messages, timeout=timeout, **params)
+            )
+        full_response = response.choices[0].message.content.strip()
+    except LLMBusyError:
+        raise
+    except Exception as e:
+        return _fallback_from_provider_failure(generation_time, e)
+
+    if cache_key and full_response:
+        get_response_cache().set(cache_key, full_response)
+    return finalize_emotion_response(full_response, generation_time)
+
+
+# generate_emotion_from_prompt_with_context のストリーミング版。
+# ("delta", テキスト断片) をトークン到着ごとに返し、最後に ("final", (応答本文, 感情データ)) を1回返す。
+# ストリームが途中で切れたときは ("reset", None) で送信済みの断片を取り消し、代替の応答を delta で送り直す
+# （delta を連結したものが常に final の応答本文と一致する）。
+# Streaming variant of generate_emotion_from_prompt_with_context.
+# Yields ("delta", text) as tokens arrive, then ("final", (response, emotion_data)) exactly once.
+# When the stream breaks off midway, ("reset", None) retracts the deltas sent so far and the fallback
+# reply follows as deltas (the concatenated deltas always match the final response).
+def stream_emotion_from_prompt_with_context(
+    user_input: str,
+    emotion_structure: dict,
+    best_match: dict | None,
+    top4_personality: list[tuple[str, int]] | None = None,
+    use_cache: bool = True
+):
+    generation_time = datetime.now().strftime("%Y%m%d%H%M%S")
+
+    if best_match is None:
+        fallback_response, fallback_emotion_data = _fallback_from_history(generation_time)
+        yield "delta", fallback_response
+        yield "final", (fallback_response, fallback_emotion_data)
+        return
+
+    messages = build_context_messages(user_input, best_match, top4_personality)
+    params = completion_params()
+
+    cache_key = _response_cache_key(messages, params, use_cache)
+    cached = get_response_cache().get(cache_key) if cache_key else None
+    if cached is not None:
+        logger.info("♻️ LLM応答キャッシュにヒット")  # LLM response cache hit
+        yield "delta", cached
+        yield "final", finalize_emotion_response(cached, generation_time)
+        return
+
+    if get_circuit_breaker().is_open():
+        fallback_response, fallback_emotion_data = _fallback_from_provider_failure(generation_time, "circuit open")
+        yield "delta", fallback_response
+        yield "final", (fallback_response, fallback_emotion_data)
+        return
+
+    parts = []
+    try:
+        # ストリームを読み終えるまで枠を保持する。再試行は最初の応答が届くまでに限る
+        # The slot is held until the stream has been read to the end; retries only happen before the first response
+        with get_llm_dispatcher().slot(current_session_id()), timed_stage("llm"):
+            stream = resilient_call(
+                lambda timeout: client.chat.completions.create(messages=messages, stream=True, timeout=timeout, **params)
+            )
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    parts.append(delta)
+                    yield "delta", delta
+    except LLMBusyError:
+        raise
+    except Exception as e:
+        if parts:
+            get_circuit_breaker().record_failure()  # ストリーム途中の切断 # Stream broke off midway
+            yield "reset", None
+        fallback_response, fallback_emotion_data = _fallback_from_provider_failure(generation_time, e)
+        yield "delta", fallback_response
+        yield "final", (fallback_response, fallback_emotion_data)
+        return
+
+    full_response = "".join(parts).strip()
+    if cache_key and full_response:
+        get_response_cache().set(cache_key, full_response)
+    yield "final", finalize_emotion_response(full_response, generation_time)
+
+
+# 応答生成のサンプリング設定（キャッシュキーにも含める）
+# Sampling parameters for generation (also part of the cache key)
+def completion_params() -> dict:
+    return {
+        "model": OPENAI_MODEL,
+        "max_tokens": OPENAI_MAX_TOKENS,
+        "temperature": OPENAI_TEMPERATURE,
+        "top_p": OPENAI_TOP_P
+    }
+
+# キャッシュを使う場合のキー。無効化中・リクエスト単位で迂回する場合は None
+# Cache key when the cache applies; None when disabled or bypassed for this request
+def _response_cache_key(messages: list[dict], params: dict, use_cache: bool) -> str | None:
+    if not LLM_CACHE_ENABLED:
+        return None
+    if not use_cache:
+        get_response_cache().record_bypass()
+        return None
+    return make_cache_key(messages, params)
+
+
+# 参照インデックスが無い場合は履歴ベースの分析結果をそのまま応答にする
+# Without a matched index entry, the history-based analysis becomes the response
+def _fallback_from_history(generation_time: str) -> tuple[str, dict]:
+    fallback_response, fallback_emotion_data = generate_gpt_response_from_history()
+    fallback_emotion_data = dict(fallback_emotion_data)  # ターン内キャッシュを書き換えない # Keep the turn cache intact
+    fallback_emotion_data["date"] = generation_time
+    return fallback_response, fallback_emotion_data
+
+
+# プロバイダー障害時（期限切れ・再試行切れ・ブレーカー開）は障害中である旨を応答にし、
+# ローカルの感情分析（EMOTION_ENGINE）の結果は感情データとしてだけ返す
+# On provider failure (deadline, retries exhausted, open breaker) the reply says the service is degraded;
+# the local emotion analysis (EMOTION_ENGINE) is only returned as the emotion data
+def _fallback_from_provider_failure(generation_time: str, reason) -> tuple[str, dict]:
+    logger.error(f"[ERROR] 応答生成失敗、ローカル分析にフォールバック: {reason}")  # Generation failed, falling back to local analysis
+    _, fallback_emotion_data = _fallback_from_history(generation_time)
+    return LLM_DEGRADED_RESPONSE, fallback_emotion_data
+
+
+# 人格傾向・参照記憶・ユーザー発言から応答生成用のメッセージを組み立てる
+# Assemble the generation messages from personality, reference memories and the user input
+def build_context_messages(
+    user_input: str,
+    best_match: dict,
+    top4_personality: list[tuple[str, int]] | None = None
+) -> list[dict]:
+    system_prompt = load_dialogue_system_prompt()
+
+    if top4_personality is None:
+        top4_personality = get_top_long_emotions()
     personality_text = "\n【人格傾向】\nこのAIは以下の感情を持つ傾向があります：\n"
     if top4_personality:
         for emotion, count in top4_personality:
@@ -152,16 +338,12 @@ def generate_emotion_from_prompt_with_context(
     else:
         personality_text += "傾向情報がまだ十分にありません。\n"
 
-    if best_match is None:
-        fallback_response, fallback_emotion_data = generate_gpt_response_from_history()
-        fallback_emotion_data["date"] = generation_time
-        return fallback_response, fallback_emotion_data
-
     from module.response.main_response import collect_all_category_responses
 
     emotion_name = best_match.get("emotion")
     date_str = best_match.get("date")
-    history_data = collect_all_category_responses(emotion_name, date_str)
+    with timed_stage("category_lookup"):
+        history_data = collect_all_category_responses(emotion_name, date_str)
 
     reference_emotions = []
     for category in ["short", "intermediate", "long"]:
@@ -169,73 +351,92 @@ def generate_emotion_from_prompt_with_context(
         if data:
             reference_emotions.append(data)
 
-    reference_text = "\n\n【AI自身の記憶（参考感情データ）】\n"
-    reference_text += (
+    reference_header = "\n\n【AI自身の記憶（参考感情データ）】\n"
+    reference_header += (
         "以下は、あなた自身（AI）がこれまでに経験・記録した感情の記憶です。\n"
         "各ケースは実際のユーザーとの対話に基づいて記録されたものであり、あなたの内的な記憶として保存されています。\n"
         "これらの記憶を参照しながら、自然で一貫性のある応答を構成してください。\n"
     )
 
+    # 記憶ケースの全文と、予算超過時に使う要約版（状況・心理反応を省く）
+    # Full memory cases, plus compact versions (without 状況 / 心理反応) used when over budget
+    memory_cases = []
+    memory_summaries = []
     for i, item in enumerate(reference_emotions, 1):
-        reference_text += f"\n● 記憶ケース{i}\n"
-        reference_text += f"主感情: {item.get('主感情')}\n"
-        reference_text += f"構成比: {item.get('構成比')}\n"
-        reference_text += f"状況: {item.get('状況')}\n"
-        reference_text += f"心理反応: {item.get('心理反応')}\n"
-        reference_text += f"キーワード: {', '.join(item.get('keywords', []))}\n"
+        head = f"\n● 記憶ケース{i}\n主感情: {item.get('主感情')}\n構成比: {item.get('構成比')}\n"
+        keywords = f"キーワード: {', '.join(item.get('keywords', []))}\n"
+        memory_cases.append(head + f"状況: {item.get('状況')}\n" + f"心理反応: {item.get('心理反応')}\n" + keywords)
+        memory_summaries.append(head + keywords)
+
+    instruction_text = (
+        "【指示】上記の感情参照データと人格傾向を参考に、emotion_promptのルールに従って応答を生成してください。\n"
+        "自然な応答 + 構成比 + JSON形式の感情構造の順で出力してください。"
+    )
+
+    # 入力トークン予算に収まるよう、優先度の低い区画（記憶 → 人格傾向 → ユーザー発言）から削る
+    # Fit the input token budget by reducing the lowest-priority sections first (memories, personality, user input)
+    system_section = PromptSection("system", system_prompt, priority=100)
+    personality_section = PromptSection("personality", personality_text, priority=40, truncatable=True)
+    user_section = PromptSection("user_input", user_input, priority=80, truncatable=True)
+    memory_section = PromptSection("memories", priority=20, header=reference_header, items=memory_cases, summaries=memory_summaries)
+    instruction_section = PromptSection("instruction", instruction_text, priority=100)
+    report = fit_sections(
+        [system_section, personality_section, user_section, memory_section, instruction_section],
+        LLM_INPUT_TOKEN_BUDGET,
+        overhead=2 * MESSAGE_OVERHEAD_TOKENS
+    )
+    turn_cache_set("token_counts", report)
+    logger.info(f"🧮 入力トークン: {report['total']}/{report['budget']} {report['sections']}")  # Input tokens per section
+    if report["actions"]:
+        logger.info(f"✂️ 予算超過のため削減: {report['total_before']} → {report['total']} {report['actions']}")  # Reduced to fit the budget
+    if report["over_budget"]:
+        logger.warning(f"[WARN] 削減後も入力トークン予算を超過: {report['total']}/{report['budget']}")  # Still over budget after reduction
 
     prompt = (
-        f"{personality_text}\n"
-        f"ユーザー発言: {user_input}\n"
-        f"{reference_text}\n\n"
-        f"【指示】上記の感情参照データと人格傾向を参考に、emotion_promptのルールに従って応答を生成してください。\n"
-        f"自然な応答 + 構成比 + JSON形式の感情構造の順で出力してください。"
+        f"{personality_section.text}\n"
+        f"ユーザー発言: {user_section.text}\n"
+        f"{memory_section.text}\n\n"
+        f"{instruction_section.text}"
     )
 
-    try:
-        response = client.chat.completions.create(
-            model=OPENAI_MODEL,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=OPENAI_MAX_TOKENS,
-            temperature=OPENAI_TEMPERATURE,
-            top_p=OPENAI_TOP_P
-        )
-        full_response = response.choices[0].message.content.strip()
+    return [
+        {"role": "system", "content": system_section.text},
+        {"role": "user", "content": prompt}
+    ]
 
-        emotion_data = extract_emotion_json_block(full_response)
 
-        if emotion_data:
-            emotion_data["date"] = generation_time
+# 生成結果から感情JSONを取り出し、構成比の更新を起動して（応答本文, 感情データ）を返す
+# Extract the emotion JSON from a completion, kick off the 構成比 update and return (response, emotion_data)
+def finalize_emotion_response(full_response: str, generation_time: str) -> tuple[str, dict]:
+    emotion_data = extract_emotion_json_block(full_response)
 
-            if "構成比" in emotion_data:
-                while isinstance(emotion_data["構成比"], str):
-                    try:
-                        emotion_data["構成比"] = json.loads(emotion_data["構成比"])
-                    except json.JSONDecodeError:
-                        break
+    if emotion_data:
+        emotion_data["date"] = generation_time
 
-                logger.debug(f"🧪 [DEBUG] 構成比 type: {type(emotion_data['構成比'])}")
-                logger.debug(f"🧪 [DEBUG] 構成比 内容: {emotion_data['構成比']}")
+        if "構成比" in emotion_data:
+            while isinstance(emotion_data["構成比"], str):
+                try:
+                    emotion_data["構成比"] = json.loads(emotion_data["構成比"])
+                except json.JSONDecodeError:
+                    break
 
-                threading.Thread(
-                    target=run_emotion_update_pipeline,
-                    args=(emotion_data["構成比"],)
-                ).start()
+            logger.debug(f"🧪 [DEBUG] 構成比 type: {type(emotion_data['構成比'])}")
+            logger.debug(f"🧪 [DEBUG] 構成比 内容: {emotion_data['構成比']}")
 
-            clean_response = re.sub(r"```json\s*\{.*?\}\s*```", "", full_response, flags=re.DOTALL).strip()
-            return clean_response, emotion_data
+            # スレッドにはターンの文脈が引き継がれないので、セッションは明示的に渡す
+            # The thread does not inherit the turn context, so the session is passed explicitly
+            threading.Thread(
+                target=run_emotion_update_pipeline,
+                args=(emotion_data["構成比"], current_session_id())
+            ).start()
 
-        return full_response, {}
+        clean_response = re.sub(r"```json\s*\{.*?\}\s*```", "", full_response, flags=re.DOTALL).strip()
+        return clean_response, emotion_data
 
-    except Exception as e:
-        logger.error(f"[ERROR] 応答生成失敗: {e}")
-        return "応答生成でエラーが発生しました。", {}
+    return full_response, {}
 
 
-def run_emotion_update_pipeline(new_vector: dict) -> tuple[str, dict]:
+def run_emotion_update_pipeline(new_vector: dict, session_id: str | None = None) -> tuple[str, dict]:
     try:
         from module.emotion.emotion_stats import (
             load_current_emotion,
@@ -244,12 +445,12 @@ def run_emotion_update_pipeline(new_vector: dict) -> tuple[str, dict]:
             summarize_feeling
         )
 
-        current = load_current_emotion()
+        current = load_current_emotion(session_id)
         logger.debug(f"[DEBUG] current type: {type(current)}")
         logger.debug(f"[DEBUG] new_vector type: {type(new_vector)}")
         logger.debug(f"[DEBUG] new_vector content: {new_vector}")
         merged = merge_emotion_vectors(current, new_vector)
-        save_current_emotion(merged)
+        save_current_emotion(merged, session_id)
         summary = summarize_feeling(merged)
         return "感情を更新しました。", summary
 
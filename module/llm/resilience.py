@@ -0,0 +1,221 @@
+# module/llm/resilience.py
+import random
+import threading
+import time
+
+import openai
+
+from module.llm.fake_llm import CassetteMissError
+
+# 再試行してよい失敗（タイムアウト・接続断・レート制限・5xx）
+# Failures worth retrying (timeouts, connection errors, rate limits, 5xx)
+RETRYABLE_ERRORS = (
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+
+# プロバイダーの状態とは無関係な失敗（ブレーカーに成功・失敗のどちらも記録しない）
+# Failures that say nothing about the provider's health (recorded neither as success nor failure)
+NEUTRAL_ERRORS = (CassetteMissError,)
+
+
+class CircuitOpenError(RuntimeError):
+    """
+    サーキットブレーカーが開いている（プロバイダー障害中）ため呼び出しを行わなかった。
+    Raised without calling the provider because the circuit breaker is open (provider unhealthy).
+    """
+
+
+class DeadlineExceededError(TimeoutError):
+    """
+    呼び出し全体の期限（再試行を含む）を超えた。
+    The overall deadline for the call (retries included) was exceeded.
+    """
+
+
+class CircuitBreaker:
+    """
+    連続 failure_threshold 回の失敗で開き、reset_timeout 秒間は呼び出しを即座に拒否する。
+    - 期限が過ぎると半開状態になり、試験的な呼び出しを1件だけ通す
+    - 試験呼び出しが成功すれば閉じ、失敗すれば再び開く。どちらでもなく終われば release で枠を返す
+
+    Opens after failure_threshold consecutive failures and rejects calls immediately for reset_timeout seconds.
+    - Afterwards it goes half-open and lets exactly one trial call through
+    - A successful trial closes it, a failed one opens it again; one ending neither way hands the slot back with release
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = max(failure_threshold, 1)
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self.opened = 0
+        self.short_circuited = 0
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._state = self.HALF_OPEN
+                self._trial_in_flight = False
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            self.short_circuited += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    # 結果を記録せずに試験呼び出しの枠を返す（状態は変えない）
+    # Hand back the trial slot without recording an outcome (does not change state)
+    def release(self):
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    self.opened += 1
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._trial_in_flight = False
+
+    # 開いていて、まだ試験呼び出しの時期でないか（状態は変えない）
+    # Whether it is open and not yet due for a trial call (does not change state)
+    def is_open(self) -> bool:
+        with self._lock:
+            return self._state == self.OPEN and time.monotonic() - self._opened_at < self.reset_timeout
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "state": self._state,
+                "consecutive_failures": self._failures,
+                "opened": self.opened,
+                "short_circuited": self.short_circuited
+            }
+
+
+# 指数バックオフの上限内で一様に揺らす（full jitter）
+# Uniformly jittered within the exponential backoff cap (full jitter)
+def backoff_delay(attempt: int, base_delay: float, max_delay: float) -> float:
+    return random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+
+
+def call_with_resilience(
+    fn,
+    breaker: CircuitBreaker,
+    deadline: float = 60.0,
+    request_timeout: float = 30.0,
+    max_retries: int = 2,
+    base_delay: float = 0.5,
+    max_delay: float = 4.0
+):
+    """
+    fn(timeout=秒) を呼び出す。timeout は1回あたりの上限と残り期限の短い方。
+    - 再試行可能な失敗は max_retries 回まで、揺らぎ付きの待ち時間をおいて再試行する
+    - ブレーカーが開いていれば CircuitOpenError、期限切れなら DeadlineExceededError
+    - それ以外の失敗はそのまま送出する（4xx と NEUTRAL_ERRORS 以外はブレーカーに失敗として記録）
+    - 結果を記録せずに抜けた場合（NEUTRAL_ERRORS や BaseException）は、試験呼び出しの枠を必ず返す
+
+    Calls fn(timeout=seconds), where timeout is the shorter of the per-attempt limit and the time left.
+    - Retryable failures are retried up to max_retries times with a jittered delay
+    - Raises CircuitOpenError while the breaker is open and DeadlineExceededError once the deadline passes
+    - Other failures propagate as-is (recorded as breaker failures, except 4xx and NEUTRAL_ERRORS)
+    - Leaving without recording an outcome (NEUTRAL_ERRORS, BaseException) always hands back the trial slot
+    """
+    expires_at = time.monotonic() + deadline
+    attempt = 0
+    while True:
+        if not breaker.allow():
+            raise CircuitOpenError("LLM circuit breaker is open")
+        remaining = expires_at - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceededError(f"LLM call deadline of {deadline:.1f}s exceeded")
+
+        recorded = False
+        try:
+            result = fn(timeout=min(request_timeout, remaining))
+        except RETRYABLE_ERRORS as e:
+            breaker.record_failure()
+            recorded = True
+            delay = backoff_delay(attempt, base_delay, max_delay)
+            # 再試行回数切れ・ブレーカーが開いた・待つと期限を過ぎる場合は元の失敗を送出する
+            # Re-raise when retries are exhausted, the breaker opened or waiting would pass the deadline
+            if attempt >= max_retries or breaker.is_open() or time.monotonic() + delay >= expires_at:
+                raise
+            from module.utils.utils import logger  # 遅延importで循環参照を回避
+            logger.warning(f"[WARN] LLM呼び出し失敗、{delay:.2f}秒後に再試行 ({attempt + 1}/{max_retries}): {e}")  # Retrying LLM call
+            time.sleep(delay)
+            attempt += 1
+            continue
+        except openai.APIStatusError:
+            # 4xx は呼び出し側の問題で、プロバイダーは応答している
+            # 4xx is the caller's problem; the provider itself responded
+            breaker.record_success()
+            recorded = True
+            raise
+        except NEUTRAL_ERRORS:
+            raise
+        except Exception:
+            breaker.record_failure()
+            recorded = True
+            raise
+        else:
+            breaker.record_success()
+            recorded = True
+            return result
+        finally:
+            if not recorded:
+                breaker.release()
+
+
+_breaker = None
+_breaker_lock = threading.Lock()
+
+def get_circuit_breaker() -> CircuitBreaker:
+    global _breaker
+    if _breaker is None:
+        with _breaker_lock:
+            if _breaker is None:
+                from module.params import LLM_BREAKER_FAILURES, LLM_BREAKER_RESET_TIMEOUT
+                _breaker = CircuitBreaker(failure_threshold=LLM_BREAKER_FAILURES, reset_timeout=LLM_BREAKER_RESET_TIMEOUT)
+    return _breaker
+
+
+# params の設定で call_with_resilience を呼ぶ
+# call_with_resilience with the settings from params
+def resilient_call(fn):
+    from module.params import (
+        LLM_CALL_DEADLINE, LLM_REQUEST_TIMEOUT, LLM_MAX_RETRIES, LLM_RETRY_BASE_DELAY, LLM_RETRY_MAX_DELAY
+    )
+    return call_with_resilience(
+        fn,
+        get_circuit_breaker(),
+        deadline=LLM_CALL_DEADLINE,
+        request_timeout=LLM_REQUEST_TIMEOUT,
+        max_retries=LLM_MAX_RETRIES,
+        base_delay=LLM_RETRY_BASE_DELAY,
+        max_delay=LLM_RETRY_MAX_DELAY
+    )
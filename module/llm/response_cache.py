@@ -0,0 +1,124 @@
+# module/llm/response_cache.py
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict
+
+
+# 組み立て済みメッセージとサンプリング設定から決まるキー（内容が同じなら同じキー）
+# Key derived from the assembled messages and sampling parameters (same content, same key)
+def make_cache_key(messages: list[dict], params: dict) -> str:
+    payload = json.dumps({"messages": messages, "params": params}, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    LLM 応答のキャッシュ。キーは make_cache_key のハッシュ、値は生成テキスト。
+    - メモリ上の LRU（maxsize 件まで）
+    - persistent_path を指定すると SQLite の永続層も使い、再起動後も有効
+    - どちらの層も ttl 秒で期限切れ
+
+    Cache of LLM completions keyed by make_cache_key, holding the generated text.
+    - In-memory LRU (up to maxsize entries)
+    - With persistent_path, an SQLite tier that survives restarts
+    - Entries in both tiers expire after ttl seconds
+    """
+
+    def __init__(self, maxsize: int = 512, ttl: float = 300.0, persistent_path: str | None = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._memory = OrderedDict()  # key -> (stored_at, value)
+        self._lock = threading.Lock()
+        self._conn = None
+        if persistent_path:
+            directory = os.path.dirname(persistent_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(persistent_path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_response_cache "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL)"
+            )
+            self._conn.commit()
+        self.counts = Counter()
+
+    # 壁時計で記録する（永続層はプロセスをまたぐため）
+    # Stored with wall-clock time, since the persistent tier outlives the process
+    def _expired(self, stored_at: float) -> bool:
+        return time.time() - stored_at > self.ttl
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                stored_at, value = entry
+                if not self._expired(stored_at):
+                    self._memory.move_to_end(key)
+                    self.counts["memory_hits"] += 1
+                    return value
+                del self._memory[key]
+
+            if self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT value, stored_at FROM llm_response_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and not self._expired(row[1]):
+                    self._store_memory(key, row[0], row[1])
+                    self.counts["persistent_hits"] += 1
+                    return row[0]
+
+            self.counts["misses"] += 1
+            return None
+
+    def set(self, key: str, value: str):
+        stored_at = time.time()
+        with self._lock:
+            self._store_memory(key, value, stored_at)
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO llm_response_cache VALUES (?, ?, ?)", (key, value, stored_at)
+                )
+                self._conn.execute("DELETE FROM llm_response_cache WHERE stored_at < ?", (stored_at - self.ttl,))
+                self._conn.commit()
+
+    def _store_memory(self, key: str, value: str, stored_at: float):
+        self._memory[key] = (stored_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.maxsize:
+            self._memory.popitem(last=False)
+            self.counts["evictions"] += 1
+
+    # キャッシュを使わなかった呼び出しを数える
+    # Count a call that skipped the cache
+    def record_bypass(self):
+        with self._lock:
+            self.counts["bypassed"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self.counts["memory_hits"] + self.counts["persistent_hits"]
+            lookups = hits + self.counts["misses"]
+            return {
+                "size": len(self._memory),
+                "persistent": self._conn is not None,
+                **{k: self.counts[k] for k in ("memory_hits", "persistent_hits", "misses", "evictions", "bypassed")},
+                "hit_rate": round(hits / lookups, 3) if lookups else 0.0
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_response_cache() -> ResponseCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                from module.params import LLM_CACHE_MAXSIZE, LLM_CACHE_TTL, LLM_CACHE_PATH
+                _cache = ResponseCache(maxsize=LLM_CACHE_MAXSIZE, ttl=LLM_CACHE_TTL, persistent_path=LLM_CACHE_PATH)
+    return _cache
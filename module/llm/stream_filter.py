@@ -0,0 +1,66 @@
+# module/llm/stream_filter.py
+import re
+
+# 表示から隠す部分の開始（```json フェンス / 行頭の { で始まる裸の JSON ブロック）
+# Where the part hidden from display starts (```json fence / bare JSON block with { at the start of a line)
+FENCE = "```"
+HIDDEN_START = re.compile(r"```|^[ \t]*\{", re.MULTILINE)
+
+
+class DisplayStreamFilter:
+    """
+    ストリーミング中のトークンから、UIに表示してよい部分だけを取り出す。
+    応答の末尾に付く感情JSON（```json フェンス、または行頭の { で始まるブロック）が始まった時点で以降を保留し、表示しない。
+    文中の { はそのまま表示する。
+    チャンク境界で ``` が分割されても取りこぼさないよう、記号の途中かもしれない末尾は次のチャンクまで待ち、
+    ストリームの終わりに flush で出す。
+    ストリーム終了後の確定表示は sanitize_output_for_display の結果を使う。
+
+    Extracts the displayable part of a token stream. Once the trailing emotion JSON
+    (```json fence, or a block with { at the start of a line) starts, everything after it is withheld;
+    a { in the middle of a sentence is shown. A tail that might be the start of a fence split across
+    chunks is held back until the next chunk arrives, and released by flush at the end of the stream.
+    The final displayed text after the stream is the result of sanitize_output_for_display.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._emitted = 0
+        self.withheld = False
+
+    # チャンクを受け取り、新たに表示できるテキストを返す
+    # Take a chunk and return the newly displayable text
+    def feed(self, chunk: str) -> str:
+        if self.withheld:
+            return ""
+        self._buffer += chunk
+
+        # 表示済みの行の先頭から探す（行頭の判定に改行が要る）
+        # Search from the start of the line already being shown (the newline is needed to tell line starts)
+        match = HIDDEN_START.search(self._buffer, max(self._buffer.rfind("\n", 0, self._emitted), 0))
+        if match:
+            self.withheld = True
+            visible_end = max(match.start(), self._emitted)
+        else:
+            visible_end = len(self._buffer) - self._partial_fence_length()
+
+        text = self._buffer[self._emitted:visible_end]
+        self._emitted = max(self._emitted, visible_end)
+        return text
+
+    # ストリームの終わりに、保留していた末尾（` や ``）を返す
+    # At the end of the stream, return the tail held back (` or ``)
+    def flush(self) -> str:
+        if self.withheld:
+            return ""
+        text = self._buffer[self._emitted:]
+        self._emitted = len(self._buffer)
+        return text
+
+    # 末尾が ``` の途中（` または ``）なら、その長さだけ保留する
+    # Hold back a tail that could be the beginning of ``` (` or ``)
+    def _partial_fence_length(self) -> int:
+        for length in range(len(FENCE) - 1, 0, -1):
+            if self._buffer.endswith(FENCE[:length]):
+                return length
+        return 0
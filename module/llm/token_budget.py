@@ -0,0 +1,134 @@
+# module/llm/token_budget.py
+import math
+import re
+
+# 日本語は1文字、英単語は約4文字、数字は約3桁で1トークンと見積もる（オフラインの概算）
+# Offline approximation: one token per Japanese character, ~4 letters per English token, ~3 digits per token
+_TOKEN_PATTERN = re.compile(
+    r"[A-Za-z]+|[0-9]+|[぀-ヿ㐀-鿿豈-﫿ｦ-ﾟ]|\s+|.",
+    re.DOTALL
+)
+MESSAGE_OVERHEAD_TOKENS = 4  # メッセージごとの役割・区切り分 # Role and delimiter tokens per message
+TRUNCATION_MARK = "…（省略）"
+
+
+def _piece_tokens(piece: str) -> int:
+    head = piece[0]
+    if head.isspace():
+        return 0
+    if head.isascii() and head.isalpha():
+        return math.ceil(len(piece) / 4)
+    if head.isascii() and head.isdigit():
+        return math.ceil(len(piece) / 3)
+    return 1
+
+
+def estimate_tokens(text: str) -> int:
+    return sum(_piece_tokens(m.group()) for m in _TOKEN_PATTERN.finditer(text or ""))
+
+
+# 先頭から max_tokens 以内に収まるところで切り、省略の印を付ける
+# Cut the text where it still fits in max_tokens and mark the omission
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    limit = max(max_tokens - estimate_tokens(TRUNCATION_MARK), 0)
+    used = 0
+    cut = 0
+    for m in _TOKEN_PATTERN.finditer(text):
+        used += _piece_tokens(m.group())
+        if used > limit:
+            break
+        cut = m.end()
+    return text[:cut].rstrip() + TRUNCATION_MARK
+
+
+class PromptSection:
+    """
+    プロンプトの1区画。priority が低いものから削る。
+    - items を持つ区画は、後ろの項目から summaries（要約版）に置き換え、それでも足りなければ後ろから外す
+    - truncatable な区画は末尾を切り詰める
+    - どちらでもない区画（システムプロンプトや指示文）は削らない
+
+    One section of the prompt; lower priority sections are reduced first.
+    - Sections with items swap the trailing items for their summaries, then drop them from the end
+    - Truncatable sections have their tail cut off
+    - Other sections (system prompt, instructions) are never reduced
+    """
+
+    def __init__(
+        self,
+        name: str,
+        text: str = "",
+        priority: int = 0,
+        items: list[str] | None = None,
+        summaries: list[str] | None = None,
+        header: str = "",
+        truncatable: bool = False
+    ):
+        self.name = name
+        self.priority = priority
+        self._text = text
+        self.header = header
+        self.items = list(items or [])
+        self.summaries = list(summaries) if summaries is not None else list(self.items)
+        self.truncatable = truncatable and not self.items
+        self.truncated = False
+
+    @property
+    def text(self) -> str:
+        if not self.items and not self.header:
+            return self._text
+        return self.header + "".join(self.items)
+
+    @property
+    def tokens(self) -> int:
+        return estimate_tokens(self.text)
+
+    @property
+    def reducible(self) -> bool:
+        if self.items:
+            return True
+        return self.truncatable and not self.truncated and self.tokens > 0
+
+    # 1段階だけ削る。excess は予算の超過分
+    # Reduce by one step; excess is how far over budget the prompt is
+    def reduce(self, excess: int) -> str:
+        if self.items:
+            for index in reversed(range(len(self.items))):
+                if self.items[index] != self.summaries[index]:
+                    self.items[index] = self.summaries[index]
+                    return "summarized"
+            self.items.pop()
+            self.summaries.pop()
+            return "dropped"
+        self._text = truncate_to_tokens(self._text, max(self.tokens - excess, 0))
+        self.truncated = True
+        return "truncated"
+
+
+# 合計が budget 以下になるまで、優先度の低い区画から削る
+# Reduce the lowest-priority sections until the total fits within budget
+def fit_sections(sections: list[PromptSection], budget: int, overhead: int = 0) -> dict:
+    before = {s.name: s.tokens for s in sections}
+    total = sum(before.values()) + overhead
+    total_before = total
+    actions = []
+
+    while total > budget:
+        candidates = [s for s in sections if s.reducible]
+        if not candidates:
+            break
+        section = min(candidates, key=lambda s: s.priority)
+        actions.append(f"{section.name}:{section.reduce(total - budget)}")
+        total = sum(s.tokens for s in sections) + overhead
+
+    return {
+        "budget": budget,
+        "total_before": total_before,
+        "total": total,
+        "sections": {s.name: s.tokens for s in sections},
+        "sections_before": before,
+        "actions": actions,
+        "over_budget": total > budget
+    }
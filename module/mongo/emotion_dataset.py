@@ -1,14 +1,6 @@
 # module/mongo/emotion_dataset.py
 
-from pymongo import MongoClient
-from datetime import datetime
-import os
-from module.utils.utils import logger
-
-# MongoDB接続設定（RenderのEnvironment Variablesから取得）
-MONGO_URI = os.getenv("MONGODB_URI")
-DB_NAME = "emotion_db"
-COLLECTION_NAME = "dialogue_history"
+from module.utils.utils import load_history, logger
 
 def get_recent_dialogue_history(n: int = 3) -> list[dict]:
     """
@@ -22,16 +14,9 @@ def get_recent_dialogue_history(n: int = 3) -> list[dict]:
     ]
     """
     try:
-        client = MongoClient(MONGO_URI)
-        collection = client[DB_NAME][COLLECTION_NAME]
-
-        # timestamp降順で取得し、昇順に並べ直す
-        cursor = collection.find(
-            {},
-            {"_id": 0, "role": 1, "message": 1}
-        ).sort("timestamp", -1).limit(n)
-
-        result = list(cursor)[::-1]  # 昇順に並べ替え
+        # seq降順で取得し（ターン内の未保存分を含む）、昇順に並べ直す
+        docs = load_history(n)
+        result = [{"role": d.get("role"), "message": d.get("message")} for d in docs][::-1]  # 昇順に並べ替え
 
         return result
 
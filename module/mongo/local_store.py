@@ -0,0 +1,475 @@
+# module/mongo/local_store.py
+#
+# MongoDB Atlas の代わりに使える組み込みストレージ（SQLite）。
+# リポジトリ層が使う pymongo Collection の操作だけを同じ呼び出し形式で実装する。
+# Embedded storage (SQLite) usable instead of MongoDB Atlas. Implements only the pymongo
+# Collection operations the repository layer uses, with the same call signatures.
+
+import os
+import sqlite3
+import threading
+from types import SimpleNamespace
+
+from bson import ObjectId, json_util
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+DUPLICATE_KEY_ERROR = 11000
+
+# SQLの列として持つフィールド（検索・並べ替えの高速化用）
+# Fields mirrored into SQL columns (for filtering and sorting)
+INDEXED_FIELDS = ("category", "timestamp", "session_id", "seq")
+# 後から追加した列（既存のテーブルには ALTER TABLE で足し、本文から値を埋める）
+# Columns added later (appended to existing tables with ALTER TABLE and filled from the body)
+ADDED_COLUMNS = (("session_id", "TEXT"), ("seq", "INTEGER"))
+# フィールド → 列名（_id は主キーの id 列）
+# Field → column name (_id is the id primary key)
+COLUMNS = {"_id": "id", **{field: field for field in INDEXED_FIELDS}}
+
+_COMPARISON_SQL = {"$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}
+
+
+# id 列（主キー）で引ける _id の値（ObjectId または文字列）
+# _id values the id primary key can look up (ObjectId or string)
+def _is_id(value) -> bool:
+    return isinstance(value, (ObjectId, str))
+
+_MISSING = object()
+
+
+# ---- クエリ評価 / query evaluation ----
+
+# ドット区切りのパスで値を取り出す。途中に配列があれば各要素を展開する（MongoDBと同じ）
+# Resolve a dotted path, fanning out over arrays on the way (as MongoDB does)
+def _resolve(doc, path: str) -> list:
+    values = [doc]
+    for part in path.split("."):
+        next_values = []
+        for value in values:
+            if isinstance(value, dict):
+                if part in value:
+                    next_values.append(value[part])
+            elif isinstance(value, list):
+                for item in value:
+                    if isinstance(item, dict) and part in item:
+                        next_values.append(item[part])
+        values = next_values
+    flattened = []
+    for value in values:
+        flattened.append(value)
+        if isinstance(value, list):
+            flattened.extend(value)
+    return flattened
+
+def _compare(values: list, op: str, operand) -> bool:
+    if op == "$in":
+        return any(v in operand for v in values) or (None in operand and not values)
+    if op == "$nin":
+        return not any(v in operand for v in values)
+    if op == "$exists":
+        return bool(values) == bool(operand)
+    if op == "$ne":
+        return operand not in values
+    comparisons = {
+        "$gt": lambda a, b: a > b,
+        "$gte": lambda a, b: a >= b,
+        "$lt": lambda a, b: a < b,
+        "$lte": lambda a, b: a <= b,
+    }
+    if op not in comparisons:
+        raise ValueError(f"未対応の演算子です: {op}")  # Unsupported operator
+    result = False
+    for v in values:
+        try:
+            result = result or comparisons[op](v, operand)
+        except TypeError:
+            continue
+    return result
+
+def matches(doc: dict, query: dict) -> bool:
+    for key, condition in query.items():
+        if key == "$or":
+            if not any(matches(doc, sub) for sub in condition):
+                return False
+            continue
+        if key == "$and":
+            if not all(matches(doc, sub) for sub in condition):
+                return False
+            continue
+
+        values = _resolve(doc, key)
+        if isinstance(condition, dict) and condition and all(k.startswith("$") for k in condition):
+            if not all(_compare(values, op, operand) for op, operand in condition.items()):
+                return False
+        elif condition is None:
+            if values and None not in values:
+                return False
+        elif condition not in values:
+            return False
+    return True
+
+def project(doc: dict, projection: dict | None) -> dict:
+    if not projection:
+        return doc
+    include_id = projection.get("_id", 1)
+    fields = [k for k, v in projection.items() if k != "_id" and v]
+    if not fields:
+        result = {k: v for k, v in doc.items() if projection.get(k, 1)}
+        return result
+
+    result = {}
+    for path in fields:
+        parts = path.split(".")
+        src, dst = doc, result
+        for i, part in enumerate(parts):
+            if not isinstance(src, dict) or part not in src:
+                break
+            if i == len(parts) - 1:
+                dst[part] = src[part]
+            else:
+                src = src[part]
+                dst = dst.setdefault(part, {})
+    if include_id and "_id" in doc:
+        result["_id"] = doc["_id"]
+    return result
+
+def _sort_value(doc: dict, key: str):
+    values = _resolve(doc, key)
+    return (0, "") if not values or values[0] is None else (1, values[0])
+
+def _set_path(doc: dict, path: str, value):
+    parts = path.split(".")
+    target = doc
+    for part in parts[:-1]:
+        target = target.setdefault(part, {})
+    target[parts[-1]] = value
+
+def _get_path(doc: dict, path: str, default=None):
+    target = doc
+    for part in path.split("."):
+        if not isinstance(target, dict) or part not in target:
+            return default
+        target = target[part]
+    return target
+
+def apply_update(doc: dict, update: dict):
+    for op, fields in update.items():
+        if op == "$set":
+            for path, value in fields.items():
+                _set_path(doc, path, value)
+        elif op == "$inc":
+            for path, value in fields.items():
+                _set_path(doc, path, _get_path(doc, path, 0) + value)
+        elif op == "$push":
+            # {"$each": [...], "$slice": n} にも対応する # Also handles {"$each": [...], "$slice": n}
+            for path, value in fields.items():
+                items = list(_get_path(doc, path, []))
+                if isinstance(value, dict) and "$each" in value:
+                    items.extend(value["$each"])
+                    size = value.get("$slice")
+                    if size is not None:
+                        items = items[size:] if size < 0 else items[:size]
+                else:
+                    items.append(value)
+                _set_path(doc, path, items)
+        elif op == "$setOnInsert":
+            continue
+        else:
+            raise ValueError(f"未対応の更新演算子です: {op}")  # Unsupported update operator
+
+
+# ---- カーソル / cursor ----
+
+class LocalCursor:
+    def __init__(self, collection, query: dict, projection: dict | None):
+        self._collection = collection
+        self._query = query
+        self._projection = projection
+        self._sort = []
+        self._limit = 0
+
+    def sort(self, key_or_list, direction: int = 1):
+        if isinstance(key_or_list, str):
+            self._sort = [(key_or_list, direction)]
+        else:
+            self._sort = list(key_or_list)
+        return self
+
+    def limit(self, n: int):
+        self._limit = n
+        return self
+
+    def __iter__(self):
+        # 並べ替えが列だけで済むなら SQL に任せる（条件も全て SQL で評価できれば件数制限も SQL で行う）
+        # Leave the sort to SQL when it only uses columns (and the limit too when every condition is in SQL)
+        if all(key in COLUMNS for key, _ in self._sort):
+            docs = self._collection._scan(self._query, self._sort, self._limit)
+        else:
+            docs = self._collection._scan(self._query)
+            for key, direction in reversed(self._sort):
+                docs.sort(key=lambda d: _sort_value(d, key), reverse=direction < 0)
+        if self._limit:
+            docs = docs[:self._limit]
+        return iter([project(d, self._projection) for d in docs])
+
+
+# ---- コレクション / collection ----
+
+class LocalCollection:
+    def __init__(self, database, name: str):
+        self.database = database
+        self.name = name
+        self._table = f'"{name}"'
+        with database.lock:
+            database.conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self._table} "
+                "(id TEXT PRIMARY KEY, category TEXT, timestamp TEXT, session_id TEXT, seq INTEGER, body TEXT NOT NULL)"
+            )
+            self._add_missing_columns()
+            for field in ("category", "timestamp"):
+                database.conn.execute(
+                    f'CREATE INDEX IF NOT EXISTS "{name}_{field}" ON {self._table} ({field})'
+                )
+            database.conn.commit()
+
+    # 列が足りない旧形式のテーブルに列を追加し、保存済みの本文から値を埋める
+    # Add missing columns to an older table and fill them from the stored bodies
+    def _add_missing_columns(self):
+        conn = self.database.conn
+        existing = {row[1] for row in conn.execute(f"PRAGMA table_info({self._table})")}
+        missing = [(field, sql_type) for field, sql_type in ADDED_COLUMNS if field not in existing]
+        if not missing:
+            return
+        for field, sql_type in missing:
+            conn.execute(f"ALTER TABLE {self._table} ADD COLUMN {field} {sql_type}")
+        rows = conn.execute(f"SELECT id, body FROM {self._table}").fetchall()
+        conn.executemany(
+            f"UPDATE {self._table} SET session_id = ?, seq = ? WHERE id = ?",
+            [self._row(json_util.loads(body))[3:5] + (row_id,) for row_id, body in rows]
+        )
+
+    # 列で表せる条件を SQL の WHERE 句にする。戻り値の最後は、全ての条件を SQL で評価できたか
+    # （category / session_id / _id の等値・$in、_id / seq の比較。ObjectId の16進表記は文字列順と生成順が一致する）
+    # Turn the conditions expressible on columns into a WHERE clause; the last value tells whether every
+    # condition was (category / session_id / _id equality and $in, _id / seq comparisons; the hex form of an
+    # ObjectId sorts in creation order)
+    def _where(self, query: dict) -> tuple[list[str], list, bool]:
+        clauses = []
+        params = []
+        exact = True
+        for key, condition in query.items():
+            if key in ("category", "session_id"):
+                if isinstance(condition, str):
+                    clauses.append(f"{key} = ?")
+                    params.append(condition)
+                    continue
+                if isinstance(condition, dict) and set(condition) == {"$in"} \
+                        and all(c is None or isinstance(c, str) for c in condition["$in"]):
+                    values = [c for c in condition["$in"] if c is not None]
+                    alternatives = [f"{key} IN ({','.join('?' * len(values))})"] if values else []
+                    if None in condition["$in"]:
+                        alternatives.append(f"{key} IS NULL")
+                    clauses.append("(" + " OR ".join(alternatives or ["0"]) + ")")
+                    params.extend(values)
+                    continue
+            elif key == "_id" and _is_id(condition):
+                clauses.append("id = ?")
+                params.append(str(condition))
+                continue
+            elif key == "_id" and isinstance(condition, dict) and set(condition) == {"$in"} \
+                    and all(_is_id(c) for c in condition["$in"]):
+                clauses.append(f"id IN ({','.join('?' * len(condition['$in']))})" if condition["$in"] else "0")
+                params.extend(str(c) for c in condition["$in"])
+                continue
+            elif key in ("_id", "seq") and isinstance(condition, dict) and condition and set(condition) <= set(_COMPARISON_SQL):
+                kind = ObjectId if key == "_id" else int
+                if all(isinstance(v, kind) and not isinstance(v, bool) for v in condition.values()):
+                    for op, value in condition.items():
+                        clauses.append(f"{COLUMNS[key]} {_COMPARISON_SQL[op]} ?")
+                        params.append(str(value) if key == "_id" else value)
+                    continue
+            exact = False
+        return clauses, params, exact
+
+    # 列で表せる条件・並べ替え・件数制限は SQL で行い、残りの条件を Python で評価する
+    # Filter, sort and limit in SQL as far as the columns allow; evaluate the rest in Python
+    def _scan(self, query: dict, sort: list | None = None, limit: int = 0) -> list[dict]:
+        sql = f"SELECT body FROM {self._table}"
+        clauses, params, exact = self._where(query)
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        order = [f"{COLUMNS[key]} {'DESC' if direction < 0 else 'ASC'}" for key, direction in sort or []]
+        sql += " ORDER BY " + ", ".join(order + ["rowid"])
+        if limit and exact:
+            sql += f" LIMIT {int(limit)}"
+
+        with self.database.lock:
+            rows = self.database.conn.execute(sql, params).fetchall()
+        docs = [json_util.loads(body) for (body,) in rows]
+        return docs if exact else [d for d in docs if matches(d, query)]
+
+    # (id, category, timestamp, session_id, seq, body)
+    def _row(self, doc: dict) -> tuple:
+        category = doc.get("category")
+        timestamp = doc.get("timestamp")
+        session_id = doc.get("session_id")
+        seq = doc.get("seq")
+        return (
+            str(doc["_id"]),
+            category if isinstance(category, str) else None,
+            timestamp if isinstance(timestamp, str) else None,
+            session_id if isinstance(session_id, str) else None,
+            seq if isinstance(seq, int) and not isinstance(seq, bool) else None,
+            json_util.dumps(doc, ensure_ascii=False)
+        )
+
+    def _insert(self, docs: list[dict]) -> list:
+        ids = []
+        with self.database.lock:
+            for doc in docs:
+                doc.setdefault("_id", ObjectId())
+                try:
+                    self.database.conn.execute(
+                        f"INSERT INTO {self._table} (id, category, timestamp, session_id, seq, body) VALUES (?, ?, ?, ?, ?, ?)",
+                        self._row(doc)
+                    )
+                except sqlite3.IntegrityError:
+                    self.database.conn.commit()
+                    raise DuplicateKeyError(f"duplicate key: {doc['_id']}", DUPLICATE_KEY_ERROR)
+                ids.append(doc["_id"])
+            self.database.conn.commit()
+        return ids
+
+    def _replace(self, doc: dict):
+        with self.database.lock:
+            self.database.conn.execute(
+                f"UPDATE {self._table} SET category = ?, timestamp = ?, session_id = ?, seq = ?, body = ? WHERE id = ?",
+                self._row(doc)[1:] + (str(doc["_id"]),)
+            )
+            self.database.conn.commit()
+
+    def find(self, filter: dict | None = None, projection: dict | None = None) -> LocalCursor:
+        return LocalCursor(self, filter or {}, projection)
+
+    def find_one(self, filter: dict | None = None, projection: dict | None = None, sort=None) -> dict | None:
+        cursor = self.find(filter, projection)
+        if sort:
+            cursor.sort(sort)
+        for doc in cursor.limit(1):
+            return doc
+        return None
+
+    def insert_one(self, document: dict):
+        ids = self._insert([document])
+        return SimpleNamespace(inserted_id=ids[0], acknowledged=True)
+
+    def insert_many(self, documents: list[dict], ordered: bool = True):
+        ids = []
+        errors = []
+        for i, doc in enumerate(documents):
+            try:
+                ids.extend(self._insert([doc]))
+            except DuplicateKeyError as e:
+                errors.append({"index": i, "code": DUPLICATE_KEY_ERROR, "errmsg": str(e)})
+                if ordered:
+                    break
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "writeConcernErrors": [], "nInserted": len(ids)})
+        return SimpleNamespace(inserted_ids=ids, acknowledged=True)
+
+    # InsertOne だけ、または UpdateOne だけの一括操作に対応する
+    # Supports batches made only of InsertOne, or only of UpdateOne
+    def bulk_write(self, requests: list, ordered: bool = True):
+        if requests and all(isinstance(request, UpdateOne) for request in requests):
+            matched = modified = 0
+            for request in requests:
+                result = self.update_one(request._filter, request._doc, upsert=bool(request._upsert))
+                matched += result.matched_count
+                modified += result.modified_count
+            return SimpleNamespace(inserted_count=0, matched_count=matched, modified_count=modified, acknowledged=True)
+
+        documents = []
+        for request in requests:
+            if not isinstance(request, InsertOne):
+                raise ValueError(f"未対応の bulk_write 操作です: {type(request).__name__}")  # Unsupported bulk_write operation
+            documents.append(request._doc)
+        result = self.insert_many(documents, ordered=ordered)
+        return SimpleNamespace(inserted_count=len(result.inserted_ids), acknowledged=True)
+
+    def update_one(self, filter: dict, update: dict, upsert: bool = False):
+        doc = self.find_one(filter)
+        if doc is None:
+            if not upsert:
+                return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=None)
+            doc = {k: v for k, v in filter.items() if not k.startswith("$") and not isinstance(v, dict)}
+            for path, value in update.get("$setOnInsert", {}).items():
+                _set_path(doc, path, value)
+            apply_update(doc, update)
+            inserted_id = self._insert([doc])[0]
+            return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=inserted_id)
+
+        before = json_util.dumps(doc, sort_keys=True)
+        apply_update(doc, update)
+        modified = json_util.dumps(doc, sort_keys=True) != before
+        if modified:
+            self._replace(doc)
+        return SimpleNamespace(matched_count=1, modified_count=int(modified), upserted_id=None)
+
+    def delete_many(self, filter: dict):
+        ids = [str(doc["_id"]) for doc in self._scan(filter)]
+        with self.database.lock:
+            self.database.conn.executemany(f"DELETE FROM {self._table} WHERE id = ?", [(i,) for i in ids])
+            self.database.conn.commit()
+        return SimpleNamespace(deleted_count=len(ids), acknowledged=True)
+
+    def count_documents(self, filter: dict) -> int:
+        return len(self._scan(filter))
+
+    # キーが全て列なら SQL のインデックスを作る。それ以外のキーは Python で評価するため作成しない
+    # Create an SQL index when every key is a column; other keys are evaluated in Python, so nothing is created
+    def create_index(self, keys, name: str | None = None, **kwargs) -> str:
+        if isinstance(keys, str):
+            keys = [(keys, 1)]
+        name = name or "_".join(f"{k}_{d}" for k, d in keys)
+        if all(k in COLUMNS for k, _ in keys):
+            columns = ", ".join(f"{COLUMNS[k]} {'DESC' if d < 0 else 'ASC'}" for k, d in keys)
+            with self.database.lock:
+                self.database.conn.execute(f'CREATE INDEX IF NOT EXISTS "{self.name}_{name}" ON {self._table} ({columns})')
+                self.database.conn.commit()
+        return name
+
+
+class LocalDatabase:
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._collections = {}
+
+    def __getitem__(self, name: str) -> LocalCollection:
+        with self.lock:
+            if name not in self._collections:
+                self._collections[name] = LocalCollection(self, name)
+            return self._collections[name]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+_local_database = None
+_local_lock = threading.Lock()
+
+def get_local_database(path: str | None = None) -> LocalDatabase:
+    global _local_database
+    if _local_database is None:
+        with _local_lock:
+            if _local_database is None:
+                from module.params import LOCAL_DB_PATH
+                _local_database = LocalDatabase(path or LOCAL_DB_PATH)
+    return _local_database
@@ -0,0 +1,151 @@
+# module/mongo/migrations.py
+#
+# emotion_db のインデックス作成と実行計画の検証。
+# 起動時（main.py）または CLI から実行する:
+#     python -m module.mongo.migrations            # インデックス作成 + 実行計画の検証
+#     python -m module.mongo.migrations --no-verify
+#     python -m module.mongo.migrations --verify-only
+# Index creation and query plan verification for emotion_db, run at startup (main.py) or from the CLI.
+
+import argparse
+import sys
+
+from pymongo import ASCENDING, DESCENDING
+
+from module.mongo.repository import (
+    get_collection, backfill_dialogue_seq, is_migration_done, mark_migration_done, QUERY_SHAPES,
+    DIALOGUE_HISTORY, EMOTION_DATA, EMOTION_INDEX, CURRENT_EMOTION, EMOTION_OBLIVION, APP_LOG
+)
+from module.params import USE_MONGODB
+from module.utils.utils import logger
+
+# コレクションごとのインデックス定義（名前, キー）。
+# セッション単位のデータは session_id を先頭にした複合インデックスで引く（シャードキーと同じ並び）。
+# Index definitions per collection (name, keys). Per-session data is read through compound
+# indexes led by session_id (the same order as the shard key).
+INDEX_SPECS = {
+    DIALOGUE_HISTORY: [
+        ("session_seq_desc", [("session_id", ASCENDING), ("seq", DESCENDING)]),
+    ],
+    CURRENT_EMOTION: [
+        ("session_timestamp_desc", [("session_id", ASCENDING), ("timestamp", DESCENDING)]),
+    ],
+    EMOTION_DATA: [
+        ("session_category_emotion", [("session_id", ASCENDING), ("category", ASCENDING), ("emotion", ASCENDING)]),
+        ("session_data_history_date", [("session_id", ASCENDING), ("data.履歴.date", ASCENDING)]),  # multikey
+    ],
+    EMOTION_INDEX: [
+        ("session_category", [("session_id", ASCENDING), ("category", ASCENDING)]),
+        ("session_history_date", [("session_id", ASCENDING), ("履歴.date", ASCENDING)]),  # multikey
+        ("session_keywords", [("session_id", ASCENDING), ("キーワード", ASCENDING)]),      # multikey
+        ("session_id_asc", [("session_id", ASCENDING), ("_id", ASCENDING)]),             # 差分読み込み # incremental loads
+    ],
+    EMOTION_OBLIVION: [
+        ("session_category_date", [("session_id", ASCENDING), ("category", ASCENDING), ("date", ASCENDING)]),
+        ("session_date", [("session_id", ASCENDING), ("date", ASCENDING)]),
+    ],
+    APP_LOG: [
+        ("timestamp_desc", [("timestamp", DESCENDING)]),
+    ],
+}
+
+
+class CollectionScanError(RuntimeError):
+    pass
+
+
+# 定義済みインデックスを作成する（作成済みなら何もしない）
+# Create the declared indexes (no-op when they already exist)
+def ensure_indexes() -> list[str]:
+    created = []
+    for collection_name, specs in INDEX_SPECS.items():
+        collection = get_collection(collection_name)
+        for name, keys in specs:
+            created.append(f"{collection_name}.{collection.create_index(keys, name=name)}")
+    logger.info(f"🗂️ インデックス確認完了: {len(created)} 件")  # Index check completed
+    return created
+
+# 実行計画の中に COLLSCAN があるかを再帰的に調べる
+# Recursively look for a COLLSCAN stage in an explain plan
+def _has_collscan(plan) -> bool:
+    if isinstance(plan, dict):
+        if plan.get("stage") == "COLLSCAN":
+            return True
+        return any(_has_collscan(v) for v in plan.values())
+    if isinstance(plan, list):
+        return any(_has_collscan(v) for v in plan)
+    return False
+
+def explain_query(shape: dict) -> dict:
+    cursor = get_collection(shape["collection"]).find(shape["filter"], shape.get("projection"))
+    if shape.get("sort"):
+        cursor = cursor.sort(shape["sort"])
+    if shape.get("limit"):
+        cursor = cursor.limit(shape["limit"])
+    return cursor.explain()
+
+# リポジトリの全クエリの実行計画を確認し、想定外のコレクションスキャンがあれば例外を投げる
+# Check the plan of every repository query and raise on unexpected collection scans
+def verify_query_plans() -> dict:
+    if not USE_MONGODB:
+        logger.info("⏭️ 組み込みストレージのため実行計画の検証を省略")  # Skipped plan check for the embedded store
+        return {}
+
+    results = {}
+    offenders = []
+    for shape in QUERY_SHAPES:
+        plan = explain_query(shape).get("queryPlanner", {}).get("winningPlan", {})
+        collscan = _has_collscan(plan)
+        results[shape["name"]] = "COLLSCAN" if collscan else "IXSCAN"
+        if collscan and not shape.get("allow_collscan"):
+            offenders.append(shape["name"])
+
+    if offenders:
+        raise CollectionScanError(f"コレクションスキャンが発生するクエリ: {', '.join(offenders)}")  # Queries doing a collection scan
+    logger.info(f"✅ 実行計画の検証完了: {results}")  # Query plan check completed
+    return results
+
+# 旧形式の対話履歴に seq を補う。一度だけ実行し、完了を meta に記録する（新しい履歴は常に seq を持つ）
+# Backfill seq on legacy dialogue entries. Runs once and records completion in meta (new entries always carry seq)
+def migrate_dialogue_seq() -> int:
+    if is_migration_done("dialogue_seq"):
+        return 0
+    updated = backfill_dialogue_seq()
+    mark_migration_done("dialogue_seq", updated=updated)
+    logger.info(f"🔢 対話履歴に seq を付与: {updated} 件")  # Backfilled seq on dialogue entries
+    return updated
+
+def run_migrations(verify: bool = True) -> dict:
+    created = ensure_indexes()
+    backfilled = migrate_dialogue_seq()
+    plans = verify_query_plans() if verify else {}
+    return {"indexes": created, "backfilled": backfilled, "plans": plans}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="emotion_db のインデックス作成と実行計画の検証")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--no-verify", action="store_true", help="実行計画の検証を行わない")
+    group.add_argument("--verify-only", action="store_true", help="インデックスを作成せず検証のみ行う")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.verify_only:
+            plans = verify_query_plans()
+            created = []
+        else:
+            result = run_migrations(verify=not args.no_verify)
+            created, plans = result["indexes"], result["plans"]
+    except CollectionScanError as e:
+        print(f"❌ {e}")
+        return 1
+
+    for name in created:
+        print(f"index: {name}")
+    for name, stage in plans.items():
+        print(f"plan: {name} -> {stage}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,31 +1,190 @@
+
 import os
+import threading
+import time
 import certifi
-from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure
+from pymongo import MongoClient, monitoring
+
+from module.params import (
+    MONGO_MAX_POOL_SIZE, MONGO_MIN_POOL_SIZE, MONGO_MAX_IDLE_TIME_MS,
+    MONGO_SERVER_SELECTION_TIMEOUT_MS, MONGO_CONNECT_TIMEOUT_MS, MONGO_SOCKET_TIMEOUT_MS,
+    MONGO_HEARTBEAT_FREQUENCY_MS, MONGO_COMPRESSORS, MONGO_RETRY_WRITES, MONGO_RETRY_READS,
+    MONGO_APP_NAME
+)
 
 _mongo_client = None
+_client_lock = threading.Lock()
+
+
+class MongoMonitor(monitoring.ServerHeartbeatListener, monitoring.ServerListener, monitoring.ConnectionPoolListener):
+    """
+    ドライバのハートビートとコネクションプールのイベントから接続状態を保持する。
+    ホットパスで ping を打たずに、この状態で生死を判断する。
+    トポロジーから外れたサーバーの記録は、サーバーの終了・トポロジーの変化のイベントで取り除く。
+    Keeps connection state from driver heartbeat and pool events, so the hot path
+    can judge liveness without sending a ping.
+    Entries for servers that leave the topology are dropped on server-closed / topology-changed events.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.servers = {}
+        self.connections_open = 0
+        self.connections_checked_out = 0
+        self.checkout_failures = 0
+        self.pool_clears = 0
+
+    # ---- ハートビート / heartbeat ----
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        with self._lock:
+            self.servers[event.connection_id] = {
+                "healthy": True,
+                "rtt_ms": round(event.duration * 1000, 2),
+                "last_heartbeat": time.time()
+            }
+
+    def failed(self, event):
+        with self._lock:
+            self.servers[event.connection_id] = {
+                "healthy": False,
+                "error": str(event.reply),
+                "last_heartbeat": time.time()
+            }
+
+    # ---- サーバー / server ----
+    def opened(self, event): pass
+    def description_changed(self, event): pass
+
+    def closed(self, event):
+        with self._lock:
+            self.servers.pop(event.server_address, None)
+
+    # トポロジーに残っているサーバー以外の記録を取り除く（_TopologyListener から呼ぶ）
+    # Drop entries for servers no longer in the topology (called from _TopologyListener)
+    def prune(self, addresses):
+        with self._lock:
+            for address in [a for a in self.servers if a not in addresses]:
+                del self.servers[address]
+
+    # ---- コネクションプール / connection pool ----
+    def pool_created(self, event): pass
+    def pool_ready(self, event): pass
+    def pool_closed(self, event): pass
+    def connection_check_out_started(self, event): pass
+    def connection_ready(self, event): pass
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pool_clears += 1
+
+    def connection_created(self, event):
+        with self._lock:
+            self.connections_open += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.connections_open -= 1
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self.connections_checked_out += 1
 
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.connections_checked_out -= 1
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.checkout_failures += 1
+
+    # まだハートビートが無い間は健全とみなす（初回接続はドライバに任せる）
+    # Treat as healthy until a heartbeat arrives (the driver handles the first connect)
+    def is_healthy(self) -> bool:
+        with self._lock:
+            if not self.servers:
+                return True
+            return any(server["healthy"] for server in self.servers.values())
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "healthy": any(s["healthy"] for s in self.servers.values()) if self.servers else None,
+                "servers": {f"{host}:{port}": dict(info) for (host, port), info in self.servers.items()},
+                "connections_open": self.connections_open,
+                "connections_checked_out": self.connections_checked_out,
+                "checkout_failures": self.checkout_failures,
+                "pool_clears": self.pool_clears
+            }
+
+
+# TopologyListener は ServerListener と同名のメソッドを持つため、別のリスナーにする
+# TopologyListener shares method names with ServerListener, so it is a separate listener
+class _TopologyListener(monitoring.TopologyListener):
+    def __init__(self, monitor: MongoMonitor):
+        self.monitor = monitor
+
+    def opened(self, event): pass
+    def closed(self, event): pass
+
+    def description_changed(self, event):
+        self.monitor.prune(set(event.new_description.server_descriptions()))
+
+
+mongo_monitor = MongoMonitor()
+
+
+def _create_client(mongo_uri: str) -> MongoClient:
+    return MongoClient(
+        mongo_uri,
+        tlsCAFile=certifi.where(),
+        maxPoolSize=MONGO_MAX_POOL_SIZE,
+        minPoolSize=MONGO_MIN_POOL_SIZE,
+        maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+        serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+        socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+        heartbeatFrequencyMS=MONGO_HEARTBEAT_FREQUENCY_MS,
+        compressors=MONGO_COMPRESSORS,
+        retryWrites=MONGO_RETRY_WRITES,
+        retryReads=MONGO_RETRY_READS,
+        appname=MONGO_APP_NAME,
+        event_listeners=[mongo_monitor, _TopologyListener(mongo_monitor)]
+    )
+
+
+# プロセス内で1つの MongoClient を共有する。生死はハートビートの状態で判断し、ping は打たない。
+# Share a single MongoClient per process. Liveness comes from heartbeat state; no ping is sent.
 def get_mongo_client():
     global _mongo_client
 
     if _mongo_client is not None:
-        try:
-            _mongo_client.admin.command("ping")
-            # MongoClient is connected
-            return _mongo_client
-        except ConnectionFailure:
-            # Existing MongoClient failed, retrying
-            pass
+        # 直近のハートビートで全サーバーが落ちていれば待たずに諦める
+        # Give up without waiting when recent heartbeats say every server is down
+        return _mongo_client if mongo_monitor.is_healthy() else None
 
     try:
-        mongo_uri = os.getenv("MONGODB_URI")
-        if not mongo_uri:
-            raise ValueError("Environment variable 'MONGODB_URI' is not set")
-
-        _mongo_client = MongoClient(mongo_uri, tlsCAFile=certifi.where())
-        _mongo_client.admin.command("ping")
-        # New MongoDB connection successful
+        with _client_lock:
+            if _mongo_client is None:
+                mongo_uri = os.getenv("MONGODB_URI")
+                if not mongo_uri:
+                    raise ValueError("Environment variable 'MONGODB_URI' is not set")
+                # 接続はドライバがバックグラウンドで確立する
+                # The driver connects in the background
+                _mongo_client = _create_client(mongo_uri)
         return _mongo_client
     except Exception:
         # Connection failed
         return None
+
+# 監視用：接続状態とプール統計
+# For monitoring: connection state and pool statistics
+def get_pool_stats() -> dict:
+    stats = mongo_monitor.stats()
+    stats["client_created"] = _mongo_client is not None
+    return stats
+
+def is_mongo_healthy() -> bool:
+    return _mongo_client is not None and mongo_monitor.is_healthy()
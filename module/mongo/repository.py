@@ -0,0 +1,497 @@
+# module/mongo/repository.py
+#
+# emotion_db の全コレクションへのアクセスをまとめたリポジトリ層。
+# 各クエリは取得フィールド（projection）と件数を明示し、MongoDB へはこのモジュール経由でのみアクセスする。
+# params.USE_MONGODB が False の場合は組み込みストレージ（local_store）を使う。
+# Repository layer for every emotion_db collection. Each query declares its projection and
+# limit explicitly, and this module is the only path to MongoDB.
+# When params.USE_MONGODB is False the embedded store (local_store) is used instead.
+#
+# 対話履歴・現在感情・記憶は session_id で分割する。各クエリは session_id を先頭キーとする
+# 複合インデックスで引けるようにし（シャードキーにもそのまま使える）、書き込み時に session_id を付ける。
+# session_id を持たない既存データは既定のセッション（DEFAULT_SESSION_ID）に属するものとして扱う。
+# Dialogue history, current emotion and memories are partitioned by session_id. Every query
+# starts with session_id so it is served by a compound index led by that key (usable as a
+# shard key as-is), and writes stamp session_id. Existing data without session_id belongs to
+# the default session (DEFAULT_SESSION_ID).
+
+import copy
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+from bson import ObjectId
+from pymongo import DESCENDING, InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from module.mongo.mongo_client import get_mongo_client
+from module.mongo.local_store import get_local_database, matches, project, apply_update
+import module.mongo.write_spool as write_spool
+from module.params import EMOTION_DB_NAME, USE_MONGODB, DEFAULT_SESSION_ID, INDEX_CACHE_OVERLAP_SECONDS, INDEX_CHANGES_KEPT
+
+# コレクション名
+# Collection names
+DIALOGUE_HISTORY = "dialogue_history"
+EMOTION_DATA = "emotion_data"
+EMOTION_INDEX = "emotion_index"
+CURRENT_EMOTION = "current_emotion"
+EMOTION_OBLIVION = "emotion_oblivion"
+APP_LOG = "app_log"
+META = "meta"
+
+# 取得フィールド（projection）
+# Field projections
+LEGACY_DIALOGUE_FIELDS = {"_id": 1, "timestamp": 1}
+DIALOGUE_FIELDS = {"_id": 1, "session_id": 1, "seq": 1, "turn_id": 1, "timestamp": 1, "role": 1, "message": 1, "analysis": 1}
+CURRENT_EMOTION_FIELDS = {"_id": 1, "timestamp": 1, "emotion_vector": 1}
+EMOTION_DATA_HISTORY_FIELDS = {"_id": 1, "emotion": 1, "category": 1, "data.履歴": 1}
+EMOTION_DATA_LABEL_FIELDS = {"_id": 0, "emotion": 1}
+INDEX_MATCH_FIELDS = {"_id": 1, "date": 1, "主感情": 1, "構成比": 1, "キーワード": 1, "emotion": 1, "category": 1, "応答": 1}
+INDEX_HISTORY_FIELDS = {"_id": 1, "履歴": 1}
+OBLIVION_DATE_FIELDS = {"_id": 1, "date": 1}
+
+DUPLICATE_KEY_ERROR = 11000
+
+# 各クエリの形（migrations の実行計画検証で使う）。クエリを追加・変更したらここも更新する。
+# allow_collscan は全件取得が目的のクエリのみ True にする。
+# Shape of every query (used by the query plan check in migrations). Update this whenever a
+# query is added or changed; allow_collscan is True only for queries that read everything on purpose.
+_SESSION = {"session_id": "s-0001"}
+_DEFAULT_SESSION = {"session_id": {"$in": [DEFAULT_SESSION_ID, None]}}
+
+QUERY_SHAPES = [
+    {"name": "find_recent_dialogue", "collection": DIALOGUE_HISTORY, "filter": _SESSION,
+     "projection": DIALOGUE_FIELDS, "sort": [("seq", DESCENDING)], "limit": 3},
+    {"name": "find_recent_dialogue(default session)", "collection": DIALOGUE_HISTORY, "filter": _DEFAULT_SESSION,
+     "projection": DIALOGUE_FIELDS, "sort": [("seq", DESCENDING)], "limit": 3},
+    {"name": "find_recent_dialogue(before_seq)", "collection": DIALOGUE_HISTORY,
+     "filter": {**_SESSION, "seq": {"$lt": 1}}, "projection": DIALOGUE_FIELDS, "sort": [("seq", DESCENDING)], "limit": 100},
+    {"name": "set_dialogue_analysis", "collection": DIALOGUE_HISTORY, "filter": {**_SESSION, "seq": 1},
+     "projection": {"_id": 1}},
+    {"name": "find_latest_current_emotion", "collection": CURRENT_EMOTION, "filter": _SESSION,
+     "projection": CURRENT_EMOTION_FIELDS, "sort": [("timestamp", DESCENDING)], "limit": 1},
+    {"name": "find_emotion_data_by_category", "collection": EMOTION_DATA, "filter": {**_SESSION, "category": "short"},
+     "projection": EMOTION_DATA_HISTORY_FIELDS},
+    {"name": "find_emotion_labels_by_category", "collection": EMOTION_DATA, "filter": {**_SESSION, "category": "long"},
+     "projection": EMOTION_DATA_LABEL_FIELDS},
+    {"name": "find_emotion_data_by_history_date", "collection": EMOTION_DATA,
+     "filter": {**_SESSION, "data.履歴.date": "20250101000000"}, "projection": {"_id": 1, "data.履歴": 1}, "limit": 1},
+    {"name": "find_index_entries", "collection": EMOTION_INDEX, "filter": _SESSION,
+     "projection": INDEX_MATCH_FIELDS},
+    {"name": "find_index_entries_since", "collection": EMOTION_INDEX, "filter": {**_SESSION, "_id": {"$gt": ObjectId("000000000000000000000000")}},
+     "projection": INDEX_MATCH_FIELDS},
+    {"name": "find_index_entries_by_ids", "collection": EMOTION_INDEX, "filter": {**_SESSION, "_id": {"$in": [ObjectId("000000000000000000000000")]}},
+     "projection": INDEX_MATCH_FIELDS},
+    {"name": "get_index_version", "collection": META, "filter": {"_id": "emotion_index_version:s-0001"}},
+    {"name": "get_migration", "collection": META, "filter": {"_id": "migration:dialogue_seq"}},
+    # 一度だけ実行する移行（完了は meta に記録する）のため全件走査を許容する
+    # One-shot migration (completion is recorded in meta), so the full scan is accepted
+    {"name": "backfill_dialogue_seq", "collection": DIALOGUE_HISTORY, "filter": {"seq": {"$exists": False}},
+     "projection": LEGACY_DIALOGUE_FIELDS, "allow_collscan": True},
+    {"name": "find_index_entries_by_history_date", "collection": EMOTION_INDEX,
+     "filter": {**_SESSION, "履歴.date": "20250101000000"}, "projection": INDEX_HISTORY_FIELDS},
+    {"name": "find_oblivion_dates", "collection": EMOTION_OBLIVION, "filter": _SESSION,
+     "projection": OBLIVION_DATE_FIELDS},
+    {"name": "find_oblivion_dates(categories)", "collection": EMOTION_OBLIVION,
+     "filter": {**_SESSION, "category": {"$in": ["short", "intermediate"]}}, "projection": OBLIVION_DATE_FIELDS},
+]
+
+
+# コレクションごとの操作回数（1回の _collection 取得 = 1往復）。ベンチマークで1ターンあたりの往復数を出すのに使う
+# Operations per collection (each _collection lookup is one round trip); used by benchmarks for round trips per turn
+_op_counts = Counter()
+_op_lock = threading.Lock()
+
+def get_op_counts() -> dict:
+    with _op_lock:
+        return dict(_op_counts)
+
+def get_collection(name: str):
+    return _collection(name)
+
+def _collection(name: str):
+    with _op_lock:
+        _op_counts[name] += 1
+    if not USE_MONGODB:
+        return get_local_database()[name]
+    client = get_mongo_client()
+    if client is None:
+        raise ConnectionError("MongoDBクライアントの取得に失敗しました")  # Failed to obtain MongoDB client
+    return client[EMOTION_DB_NAME][name]
+
+# MongoDB 使用時はスプール経由（write-behind）、組み込みストレージには直接書き込む
+# Through the spool (write-behind) for MongoDB; straight into the embedded store otherwise
+def _insert(name: str, document: dict) -> ObjectId:
+    if not USE_MONGODB:
+        return _collection(name).insert_one(dict(document)).inserted_id
+    return write_spool.enqueue_insert(name, document)
+
+# _id 指定の更新・削除。MongoDB 使用時はスプール経由で、先にスプールした挿入の後に反映される。
+# スプールした場合は反映前のため、更新・削除の件数は対象の _id の数とみなす
+# Update / delete by _id. With MongoDB they go through the spool and land after inserts spooled earlier;
+# since they are not applied yet, the count is taken to be the number of targeted _ids
+def _update(name: str, filter: dict, update: dict, upsert: bool = False) -> int:
+    if not USE_MONGODB:
+        return _collection(name).update_one(filter, update, upsert=upsert).modified_count
+    write_spool.enqueue_operation(name, "update", filter, update, upsert)
+    return 1
+
+def _delete(name: str, ids: list) -> int:
+    if not USE_MONGODB:
+        return _collection(name).delete_many({"_id": {"$in": ids}}).deleted_count
+    write_spool.enqueue_operation(name, "delete", {"_id": {"$in": ids}})
+    return len(ids)
+
+def _sort_key(doc: dict):
+    return (doc.get("timestamp") or "", doc["_id"])
+
+# セッションの絞り込み条件。既定のセッションは session_id の無い既存データも含む
+# Filter for a session; the default session also covers existing data without session_id
+def session_filter(session_id: str) -> dict:
+    if session_id == DEFAULT_SESSION_ID:
+        return {"session_id": {"$in": [DEFAULT_SESSION_ID, None]}}
+    return {"session_id": session_id}
+
+def _with_session(document: dict, session_id: str) -> dict:
+    return {**document, "session_id": session_id}
+
+# スプール内の未反映分からクエリに一致するものを取り出す
+# Pick the documents still in the spool that match a query
+def _pending_matching(name: str, query: dict) -> list[dict]:
+    return [doc for doc in write_spool.pending_documents(name) if matches(doc, query)]
+
+# DB から読んだ結果に、スプール内の未反映分（挿入した文書と、その後の更新・削除）を重ねる。
+# 取りこぼしを防ぐため、呼び出し側はスプールを DB より先に読む（pending = (文書, 更新・削除)）
+# Overlay what is still in the spool (inserted documents, then updates and deletes) on a DB read.
+# Callers read the spool before the DB so nothing slips between the two (pending = (documents, operations))
+def _read_pending(name: str) -> tuple[list[dict], list[dict]]:
+    operations = write_spool.pending_operations(name)
+    return write_spool.pending_documents(name), operations
+
+def _merge_pending(query: dict, found: list[dict], projection: dict, pending: tuple[list[dict], list[dict]]) -> list[dict]:
+    spooled_docs, operations = pending
+    docs = {doc["_id"]: doc for doc in found}
+    spooled = set()
+    for doc in spooled_docs:
+        docs[doc["_id"]] = doc
+        spooled.add(doc["_id"])
+
+    touched = set()
+    for record in operations:
+        for doc_id in [doc_id for doc_id, doc in docs.items() if matches(doc, record["filter"])]:
+            if record["op"] == "delete":
+                del docs[doc_id]
+            else:
+                doc = copy.deepcopy(docs[doc_id])
+                apply_update(doc, record["update"])
+                docs[doc_id] = doc
+                touched.add(doc_id)
+
+    # DB の結果は取得フィールドしか持たないため、更新後の再判定はセッション以外の条件で行う
+    # DB results only carry the projected fields, so they are re-checked without the session condition
+    recheck = {k: v for k, v in query.items() if k != "session_id"}
+    result = []
+    for doc_id, doc in docs.items():
+        if doc_id in spooled:
+            if not matches(doc, query):
+                continue
+            doc = project(doc, projection)
+        elif doc_id in touched and not matches(doc, recheck):
+            continue
+        result.append(doc)
+    return result
+
+def _find_with_pending(name: str, query: dict, projection: dict) -> list[dict]:
+    if not USE_MONGODB:
+        return list(_collection(name).find(query, projection))
+    pending = _read_pending(name)
+    return _merge_pending(query, list(_collection(name).find(query, projection)), projection, pending)
+
+
+# ---- dialogue_history ----
+#
+# 対話履歴は1ターン分（ユーザー発言と応答）をまとめて1回で書き込む。
+# 各メッセージは単調増加の seq を持ち、読み込みは seq 降順の範囲スキャンになる。
+# Dialogue history is written one turn (user message and replies) at a time in a single write.
+# Every message carries a monotonic seq, so reads are descending range scans on seq.
+
+_seq_lock = threading.Lock()
+_last_seq = 0
+
+# 時刻（ナノ秒）ベースの単調増加番号。同一時刻や時計の巻き戻りでも前回より大きい値を返す
+# Monotonic number based on time in nanoseconds; always larger than the previous one,
+# even for equal timestamps or a clock stepping back
+def next_dialogue_seq() -> int:
+    global _last_seq
+    with _seq_lock:
+        _last_seq = max(time.time_ns(), _last_seq + 1)
+        return _last_seq
+
+def _dialogue_sort_key(doc: dict):
+    return (doc.get("seq") or 0, doc["_id"])
+
+# 直近 limit 件の対話履歴（新しい順）。before_seq 指定時はそれより古いものだけ。
+# スプール内の未反映分（後から補った分析結果を含む）も含める。
+# Latest `limit` dialogue entries (newest first), only older than before_seq when given.
+# Includes writes still in the spool (analyses filled in later among them).
+def find_recent_dialogue(limit: int, before_seq: int | None = None, session_id: str = DEFAULT_SESSION_ID) -> list[dict]:
+    query = session_filter(session_id)
+    if before_seq is not None:
+        query["seq"] = {"$lt": before_seq}
+    # 反映直後の取りこぼしを防ぐため、スプールはDBより先に読む
+    # Read the spool before the DB so nothing slips between the two reads
+    pending = _read_pending(DIALOGUE_HISTORY) if USE_MONGODB else ([], [])
+    cursor = _collection(DIALOGUE_HISTORY).find(query, DIALOGUE_FIELDS).sort("seq", DESCENDING).limit(limit)
+
+    docs = _merge_pending(query, list(cursor), DIALOGUE_FIELDS, pending)
+    return sorted(docs, key=_dialogue_sort_key, reverse=True)[:limit]
+
+# 1ターン分のメッセージを1回の一括書き込みで保存する
+# Persist one turn's messages with a single bulk write
+def insert_dialogue_turn(entries: list[dict], session_id: str = DEFAULT_SESSION_ID) -> list[ObjectId]:
+    if not entries:
+        return []
+    entries = [_with_session(e, session_id) for e in entries]
+    if not USE_MONGODB:
+        return _collection(DIALOGUE_HISTORY).insert_many(entries).inserted_ids
+    return write_spool.enqueue_insert_many(DIALOGUE_HISTORY, entries)
+
+def insert_dialogue(entry: dict, session_id: str = DEFAULT_SESSION_ID) -> ObjectId:
+    return insert_dialogue_turn([entry], session_id)[0]
+
+# 読むときに補った分析結果を保存し直す（seq はセッション内で一意）
+# Save an analysis filled in on read back onto its message (seq is unique within a session)
+def set_dialogue_analysis(seq: int, analysis: dict, session_id: str = DEFAULT_SESSION_ID) -> int:
+    return _update(DIALOGUE_HISTORY, {**session_filter(session_id), "seq": seq}, {"$set": {"analysis": analysis}})
+
+# seq を持たない旧形式の履歴に、timestamp から seq を補う（migrations から一度だけ実行）。
+# 更新は batch_size 件ずつの bulk_write で行う
+# Backfill seq on legacy entries from their timestamp (run once by migrations),
+# with bulk_write in batches of batch_size
+def backfill_dialogue_seq(batch_size: int = 1000) -> int:
+    collection = _collection(DIALOGUE_HISTORY)
+    legacy = list(collection.find({"seq": {"$exists": False}}, LEGACY_DIALOGUE_FIELDS))
+    legacy.sort(key=_sort_key)
+
+    requests = []
+    previous = 0
+    for doc in legacy:
+        try:
+            moment = datetime.strptime(doc.get("timestamp") or "", "%Y-%m-%d %H:%M:%S")
+        except ValueError:
+            moment = doc["_id"].generation_time
+        base = int(moment.timestamp() * 1_000_000_000)
+        # 同じ秒の複数件は _id 順に1ずつずらす
+        # Several entries in the same second are spread by one, in _id order
+        previous = max(base, previous + 1)
+        requests.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"seq": previous}}))
+
+    updated = 0
+    for start in range(0, len(requests), batch_size):
+        updated += collection.bulk_write(requests[start:start + batch_size], ordered=False).modified_count
+    return updated
+
+
+# ---- current_emotion ----
+
+# 最新の現在感情ドキュメント。スプール内の未反映分も候補にする。
+# Latest current_emotion document, considering writes still in the spool.
+def find_latest_current_emotion(session_id: str = DEFAULT_SESSION_ID) -> dict | None:
+    query = session_filter(session_id)
+    pending = _pending_matching(CURRENT_EMOTION, query)
+    latest = _collection(CURRENT_EMOTION).find_one(query, CURRENT_EMOTION_FIELDS, sort=[("timestamp", DESCENDING)])
+    candidates = pending + ([latest] if latest else [])
+    return max(candidates, key=_sort_key) if candidates else None
+
+def insert_current_emotion(entry: dict, session_id: str = DEFAULT_SESSION_ID) -> ObjectId:
+    return _insert(CURRENT_EMOTION, _with_session(entry, session_id))
+
+
+# ---- emotion_data ----
+
+# カテゴリ内の感情データ（emotion / category / data.履歴 のみ）。スプール内の未反映分も含める。
+# Emotion data in a category (emotion / category / data.履歴 only), including writes still in the spool.
+def find_emotion_data_by_category(category: str, session_id: str = DEFAULT_SESSION_ID) -> list[dict]:
+    query = {**session_filter(session_id), "category": category}
+    return _find_with_pending(EMOTION_DATA, query, EMOTION_DATA_HISTORY_FIELDS)
+
+# カテゴリ内の感情ラベルのみ（人格傾向の集計用）。スプール内の未反映分も含める。
+# Emotion labels only in a category (for personality counts), including writes still in the spool.
+def find_emotion_labels_by_category(category: str, session_id: str = DEFAULT_SESSION_ID) -> list[dict]:
+    query = {**session_filter(session_id), "category": category}
+    if not USE_MONGODB:
+        return list(_collection(EMOTION_DATA).find(query, EMOTION_DATA_LABEL_FIELDS))
+    # 削除・更新の突き合わせに _id が要るため、_id 付きで読んでから落とす
+    # _id is needed to line up updates and deletes, so read it and drop it afterwards
+    fields = {**EMOTION_DATA_LABEL_FIELDS, "_id": 1}
+    return [{"emotion": doc.get("emotion")} for doc in _find_with_pending(EMOTION_DATA, query, fields)]
+
+# data.履歴 に指定 date を含む感情データ1件。スプール内の未反映分も含める。
+# One emotion data document whose data.履歴 contains the given date, including writes still in the spool.
+def find_emotion_data_by_history_date(date: str, session_id: str = DEFAULT_SESSION_ID) -> dict | None:
+    query = {**session_filter(session_id), "data.履歴.date": date}
+    if not USE_MONGODB:
+        return _collection(EMOTION_DATA).find_one(query, {"_id": 1, "data.履歴": 1})
+    pending = _read_pending(EMOTION_DATA)
+    found = _collection(EMOTION_DATA).find_one(query, {"_id": 1, "data.履歴": 1})
+    docs = _merge_pending(query, [found] if found else [], {"_id": 1, "data.履歴": 1}, pending)
+    return docs[0] if docs else None
+
+# スプール内の文書にも効くよう、更新はスプール経由で挿入の後に反映する
+# Goes through the spool after the insert, so it also applies to documents still spooled
+def set_emotion_data_history(doc_id, history: list[dict]) -> int:
+    return _update(EMOTION_DATA, {"_id": doc_id}, {"$set": {"data.履歴": history}})
+
+def insert_emotion_data(document: dict, session_id: str = DEFAULT_SESSION_ID) -> ObjectId:
+    return _insert(EMOTION_DATA, _with_session(document, session_id))
+
+
+# ---- emotion_index ----
+
+# セッションのインデックス全件（マッチングに必要なフィールドのみ）
+# All index entries of a session, with only the fields needed for matching
+def find_index_entries(session_id: str = DEFAULT_SESSION_ID) -> list[dict]:
+    return list(_collection(EMOTION_INDEX).find(session_filter(session_id), INDEX_MATCH_FIELDS))
+
+# 履歴に指定 date を含むインデックス（履歴のみ）
+# Index entries whose 履歴 contains the given date (履歴 only)
+def find_index_entries_by_history_date(date: str, session_id: str = DEFAULT_SESSION_ID) -> list[dict]:
+    query = {**session_filter(session_id), "履歴.date": date}
+    return _find_with_pending(EMOTION_INDEX, query, INDEX_HISTORY_FIELDS)
+
+# 指定 _id より新しいインデックス（差分読み込み用）
+# Index entries newer than the given _id (for incremental loading)
+def find_index_entries_since(after_id: ObjectId, session_id: str = DEFAULT_SESSION_ID) -> list[dict]:
+    query = {**session_filter(session_id), "_id": {"$gt": after_id}}
+    return list(_collection(EMOTION_INDEX).find(query, INDEX_MATCH_FIELDS))
+
+# 指定 _id のインデックス（変更された文書の読み直し用）
+# Index entries with the given _ids (for re-reading changed documents)
+def find_index_entries_by_ids(ids: list, session_id: str = DEFAULT_SESSION_ID) -> list[dict]:
+    query = {**session_filter(session_id), "_id": {"$in": list(ids)}}
+    return list(_collection(EMOTION_INDEX).find(query, INDEX_MATCH_FIELDS))
+
+def set_index_history(doc_id, history: list[dict]) -> int:
+    return _update(EMOTION_INDEX, {"_id": doc_id}, {"$set": {"履歴": history}})
+
+def insert_index_entry(document: dict, session_id: str = DEFAULT_SESSION_ID) -> ObjectId:
+    return _insert(EMOTION_INDEX, _with_session(document, session_id))
+
+
+# ---- emotion_oblivion ----
+
+# セッションの忘却記録の date のみ（categories 指定時はそのカテゴリに限定）
+# Only the date of a session's oblivion records (limited to `categories` when given)
+def find_oblivion_dates(categories: list[str] | None = None, session_id: str = DEFAULT_SESSION_ID) -> list[dict]:
+    query = session_filter(session_id)
+    if categories:
+        query["category"] = {"$in": categories}
+    return _find_with_pending(EMOTION_OBLIVION, query, OBLIVION_DATE_FIELDS)
+
+def insert_oblivion_entries(entries: list[dict], session_id: str = DEFAULT_SESSION_ID) -> int:
+    entries = [_with_session(e, session_id) for e in entries]
+    if not USE_MONGODB:
+        return len(_collection(EMOTION_OBLIVION).insert_many(entries).inserted_ids)
+    return len(write_spool.enqueue_insert_many(EMOTION_OBLIVION, entries))
+
+def delete_oblivion_entries(ids: list) -> int:
+    return _delete(EMOTION_OBLIVION, ids)
+
+
+# ---- meta ----
+#
+# インデックスの版番号。忘却でインデックスが書き換わるたびに上がり、各プロセスのキャッシュはこれを見て読み直す。
+# 版番号ごとに変更した文書の _id を changes に残し（直近 INDEX_CHANGES_KEPT 件）、キャッシュはその文書だけを読み直す。
+# Index version number; bumped whenever oblivion rewrites the index so every process's cache re-reads it.
+# The _ids changed by each version are kept in changes (the latest INDEX_CHANGES_KEPT), so caches re-read only those.
+
+def _index_version_key(session_id: str) -> str:
+    return f"emotion_index_version:{session_id}"
+
+def get_index_version(session_id: str = DEFAULT_SESSION_ID) -> int:
+    doc = _collection(META).find_one({"_id": _index_version_key(session_id)}, {"version": 1})
+    return doc.get("version", 0) if doc else 0
+
+# 版番号と、版番号ごとに変更した _id の一覧（古い順。最後の要素が現在の版番号の変更、_id 不明なら None）
+# The version and the _ids changed per version (oldest first; the last one is the current version's, None when unknown)
+def get_index_changes(session_id: str = DEFAULT_SESSION_ID) -> tuple[int, list]:
+    doc = _collection(META).find_one({"_id": _index_version_key(session_id)})
+    if not doc:
+        return 0, []
+    return doc.get("version", 0), [change.get("ids") for change in doc.get("changes", [])]
+
+# 版番号を上げ、変更した _id を記録する（ids が None なら各キャッシュは全件を読み直す）。
+# スプール経由にし、先にスプールしたインデックスの更新より後に反映されるようにする
+# Bump the version and record the changed _ids (ids=None makes every cache reload everything).
+# Goes through the spool so it lands after the index updates spooled before it
+def bump_index_version(session_id: str = DEFAULT_SESSION_ID, ids: list | None = None):
+    _update(
+        META,
+        {"_id": _index_version_key(session_id)},
+        {"$inc": {"version": 1}, "$push": {"changes": {"$each": [{"ids": ids}], "$slice": -INDEX_CHANGES_KEPT}}},
+        upsert=True
+    )
+
+# 一度だけ実行する移行の完了記録
+# Completion records for one-shot migrations
+
+def _migration_key(name: str) -> str:
+    return f"migration:{name}"
+
+def is_migration_done(name: str) -> bool:
+    return _collection(META).find_one({"_id": _migration_key(name)}) is not None
+
+def mark_migration_done(name: str, **details):
+    _collection(META).update_one(
+        {"_id": _migration_key(name)},
+        {"$set": {"completed_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"), **details}},
+        upsert=True
+    )
+
+
+# ---- app_log ----
+
+def insert_app_logs(entries: list[dict]):
+    _collection(APP_LOG).insert_many(entries, ordered=False)
+
+
+# ---- スプールからの反映 / replay from the spool ----
+
+# _id を冪等キーとしてまとめて挿入する。既に反映済みの文書（重複キー）は成功扱い。
+# Bulk insert using _id as the idempotency key; documents already applied (duplicate key) count as success.
+def insert_many_idempotent(collection_name: str, documents: list[dict]):
+    try:
+        _collection(collection_name).bulk_write([InsertOne(doc) for doc in documents], ordered=False)
+    except BulkWriteError as e:
+        errors = e.details.get("writeErrors", [])
+        if any(err.get("code") != DUPLICATE_KEY_ERROR for err in errors) or e.details.get("writeConcernErrors"):
+            raise
+    if collection_name == EMOTION_INDEX:
+        _bump_version_for_late_index(documents)
+
+# スプールした _id 指定の更新・削除を反映する。$set・$inc の upsert と削除なので、
+# セグメントを反映し直しても結果は同じ（$inc の版番号は余分に上がるだけで、読み直しが1回増えるのみ）
+# Apply a spooled _id-targeted update or delete. These are $set / upserted $inc updates and deletes,
+# so replaying a segment again is harmless (an extra $inc only costs one more cache reload)
+def apply_spooled_operation(collection_name: str, record: dict):
+    collection = _collection(collection_name)
+    if record["op"] == "delete":
+        collection.delete_many(record["filter"])
+    else:
+        collection.update_one(record["filter"], record["update"], upsert=record.get("upsert", False))
+
+# 差分読み込みは _id の時刻で遡るため、遡り幅を超えて遅れて反映したインデックスは見落とされうる。
+# その場合はその _id を付けて版番号を上げ、各プロセスのキャッシュにその文書だけを読み込ませる
+# （時計のずれを見込んで遡り幅の半分で判定）
+# Incremental loads look back by _id time, so an index entry replayed later than the look-back can be
+# missed. In that case bump the version with its _id so every process's cache reads just that document
+# (half the look-back allows for clock skew)
+def _bump_version_for_late_index(documents: list[dict]):
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=INDEX_CACHE_OVERLAP_SECONDS / 2)
+    late = {}
+    for doc in documents:
+        if isinstance(doc.get("_id"), ObjectId) and doc["_id"].generation_time < cutoff:
+            late.setdefault(doc.get("session_id") or DEFAULT_SESSION_ID, []).append(doc["_id"])
+    for session_id, ids in late.items():
+        bump_index_version(session_id, ids)
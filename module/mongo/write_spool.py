@@ -0,0 +1,516 @@
+# module/mongo/write_spool.py
+import atexit
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from bson import ObjectId, json_util
+from pymongo.errors import ConnectionFailure
+
+from module.utils.utils import logger
+from module.params import (
+    WRITE_SPOOL_DIR, WRITE_SPOOL_FSYNC_POLICY, WRITE_SPOOL_FSYNC_INTERVAL,
+    WRITE_SPOOL_SEGMENT_MAX_BYTES, WRITE_SPOOL_REPLAY_INTERVAL, WRITE_SPOOL_BATCH_SIZE, WRITE_SPOOL_MAX_ATTEMPTS
+)
+
+try:
+    import fcntl  # セグメントの排他ロック（POSIXのみ） # Segment locking (POSIX only)
+except ImportError:
+    fcntl = None
+
+FSYNC_POLICIES = ("always", "interval", "never")
+QUARANTINE_FILE = "quarantine.log"
+# 接続断など、文書ではなく接続先の問題を示す例外（何度でも再試行し、隔離しない）
+# Errors that point at the server rather than the document (retried indefinitely, never quarantined)
+TRANSIENT_ERRORS = (ConnectionFailure, OSError)
+
+
+def _segment_pid(name: str) -> int | None:
+    try:
+        return int(name.split("-")[1])
+    except (IndexError, ValueError):
+        return None
+
+
+# プロセスが生きているか（シグナル0で確認。権限が無い場合は生きているとみなす）
+# Whether a process is alive (checked with signal 0; no permission means it is alive)
+def _pid_alive(pid: int) -> bool:
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+# リポジトリ経由で _id を冪等キーとして反映する
+# Apply through the repository, using _id as the idempotency key
+def insert_documents_idempotent(collection_name: str, documents: list[dict]):
+    from module.mongo.repository import insert_many_idempotent  # 遅延importで循環参照を回避
+    insert_many_idempotent(collection_name, documents)
+
+# _id 指定の更新・削除をリポジトリ経由で反映する（$set / $inc の upsert と削除はやり直しても結果が同じ）
+# Apply an _id-targeted update or delete through the repository ($set updates and deletes are safe to repeat)
+def apply_operation_idempotent(collection_name: str, record: dict):
+    from module.mongo.repository import apply_spooled_operation  # 遅延importで循環参照を回避
+    apply_spooled_operation(collection_name, record)
+
+# レコードの追跡キー（挿入は文書の _id、更新・削除はレコードの id）
+# Tracking key of a record (the document _id for inserts, the record id for updates and deletes)
+def _record_key(record: dict):
+    return record["doc"]["_id"] if record["op"] == "insert" else record["id"]
+
+
+class WriteSpool:
+    """
+    MongoDB への書き込みをローカルの追記専用セグメントファイルに記録し、
+    バックグラウンドのリプレイヤーが bulk_write でまとめて反映する（write-behind）。
+    - 書き込みは _id（クライアント側で採番する ObjectId）を冪等キーとして扱う
+    - 反映に成功したセグメントだけを削除するため、障害中のデータは失われない
+    - 反映前の文書は pending() で参照でき、直後の読み込みにも反映される
+    - max_attempts 回続けて失敗したセグメントは1件ずつ反映し、接続以外の理由で失敗する文書は
+      quarantine.log に移して後続のセグメントの反映を続ける
+    - 反映するのは自プロセスのセグメントと、終了したプロセスが残したセグメント（引き取り）だけ。
+      引き取ったセグメントの文書も pending() に載せ、反映されるまで読み込みに含める
+    - _id 指定の更新・削除（append_operation）も同じセグメントに追記し、挿入と合わせて追記順に反映する。
+      反映前の更新・削除は pending_operations() で参照できる
+    """
+
+    def __init__(
+        self,
+        spool_dir: str,
+        writer=insert_documents_idempotent,
+        operator=apply_operation_idempotent,
+        fsync_policy: str = "interval",
+        fsync_interval: float = 1.0,
+        segment_max_bytes: int = 4 * 1024 * 1024,
+        replay_interval: float = 0.5,
+        batch_size: int = 500,
+        max_attempts: int = 5
+    ):
+        if fsync_policy not in FSYNC_POLICIES:
+            raise ValueError(f"fsync_policy は {FSYNC_POLICIES} のいずれかです: {fsync_policy}")
+
+        self.spool_dir = spool_dir
+        self.writer = writer
+        self.operator = operator
+        self.fsync_policy = fsync_policy
+        self.fsync_interval = fsync_interval
+        self.segment_max_bytes = segment_max_bytes
+        self.replay_interval = replay_interval
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.quarantine_path = os.path.join(spool_dir, QUARANTINE_FILE)
+
+        os.makedirs(spool_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pending = {}
+        self._pending_ops = {}
+        self._segment_seq = self._last_segment_seq()
+        self._active_path = None
+        self._active_file = None
+        self._active_bytes = 0
+        self._last_fsync = time.monotonic()
+        self._attempts = {}  # セグメント -> 連続失敗回数 # segment -> consecutive failures
+        self._written = set()  # この実行中に書いたセグメント # segments written during this run
+        self._adopted = {}   # 引き取ったセグメント -> レコード # adopted segment -> records
+
+        self.appended = 0
+        self.replayed = 0
+        self.replay_failures = 0
+        self.quarantined = 0
+
+        # 前回のプロセスが残したセグメントを引き取り、未反映の文書を読み込みに含める
+        # Adopt segments left by a previous process so their unapplied documents are visible to reads
+        self._sealed_segments()
+
+    # 文書をスプールに追記し、採番した _id を返す
+    # Append a document to the spool and return its assigned _id
+    def append(self, collection_name: str, document: dict) -> ObjectId:
+        return self.append_many(collection_name, [document])[0]
+
+    # 複数文書を1回の書き込み（fsync も1回）で追記する
+    # Append several documents with a single write (and a single fsync)
+    def append_many(self, collection_name: str, documents: list[dict]) -> list[ObjectId]:
+        records = []
+        for document in documents:
+            doc = dict(document)
+            doc.setdefault("_id", ObjectId())
+            records.append({"op": "insert", "collection": collection_name, "doc": doc})
+        self._append_records(records)
+        return [record["doc"]["_id"] for record in records]
+
+    # _id 指定の更新（op="update"）・削除（op="delete"）を追記する。先に追記した挿入の後に反映される
+    # Append an _id-targeted update (op="update") or delete (op="delete"); applied after inserts appended earlier
+    def append_operation(self, collection_name: str, op: str, filter: dict, update: dict | None = None, upsert: bool = False):
+        if op not in ("update", "delete"):
+            raise ValueError(f"未対応の操作です: {op}")  # Unsupported operation
+        record = {"op": op, "id": ObjectId(), "collection": collection_name, "filter": filter}
+        if op == "update":
+            record["update"] = update
+            record["upsert"] = upsert
+        self._append_records([record])
+
+    def _append_records(self, records: list[dict]):
+        data = "".join(json_util.dumps(record, ensure_ascii=False) + "\n" for record in records).encode("utf-8")
+
+        with self._lock:
+            if self._active_file is None or self._active_bytes >= self.segment_max_bytes:
+                self._open_new_segment()
+            self._active_file.write(data)
+            self._active_file.flush()
+            self._active_bytes += len(data)
+            self._maybe_fsync()
+            self._track(records)
+            self.appended += len(records)
+
+        self._ensure_started()
+
+    # 未反映のレコードを pending に載せる／外す（ロック取得済みで呼ぶ）
+    # Add records to / remove them from pending (caller holds the lock)
+    def _track(self, records: list[dict]):
+        for record in records:
+            target = self._pending if record["op"] == "insert" else self._pending_ops
+            entries = target.setdefault(record["collection"], OrderedDict())
+            entries.setdefault(_record_key(record), record["doc"] if record["op"] == "insert" else record)
+
+    def _untrack(self, records: list[dict]):
+        for record in records:
+            target = self._pending if record["op"] == "insert" else self._pending_ops
+            target.get(record["collection"], {}).pop(_record_key(record), None)
+
+    # まだ MongoDB に反映されていない文書（追記順）
+    # Documents not yet applied to MongoDB, in append order
+    def pending(self, collection_name: str) -> list[dict]:
+        with self._lock:
+            return [dict(doc) for doc in self._pending.get(collection_name, {}).values()]
+
+    # まだ反映されていない更新・削除のレコード（追記順）
+    # Update and delete records not yet applied, in append order
+    def pending_operations(self, collection_name: str) -> list[dict]:
+        with self._lock:
+            return [dict(record) for record in self._pending_ops.get(collection_name, {}).values()]
+
+    def _maybe_fsync(self):
+        if self.fsync_policy == "always":
+            os.fsync(self._active_file.fileno())
+        elif self.fsync_policy == "interval" and time.monotonic() - self._last_fsync >= self.fsync_interval:
+            os.fsync(self._active_file.fileno())
+            self._last_fsync = time.monotonic()
+
+    def _segment_path(self, seq: int) -> str:
+        return os.path.join(self.spool_dir, f"segment-{os.getpid()}-{seq:08d}.log")
+
+    def _last_segment_seq(self) -> int:
+        seqs = [0]
+        for name in os.listdir(self.spool_dir):
+            if name.startswith(f"segment-{os.getpid()}-") and name.endswith(".log"):
+                try:
+                    seqs.append(int(name.rsplit("-", 1)[1][:-4]))
+                except ValueError:
+                    continue
+        return max(seqs)
+
+    # 現在のセグメントを封印し、新しいセグメントに切り替える（ロック取得済みで呼ぶ）
+    # Seal the active segment and open a fresh one (caller holds the lock)
+    def _open_new_segment(self):
+        self._close_active_segment()
+        self._segment_seq += 1
+        self._active_path = self._segment_path(self._segment_seq)
+        self._written.add(self._active_path)
+        self._active_file = open(self._active_path, "ab")
+        if fcntl is not None:
+            fcntl.flock(self._active_file.fileno(), fcntl.LOCK_EX)
+        self._active_bytes = 0
+
+    def _close_active_segment(self):
+        if self._active_file is None:
+            return
+        self._active_file.flush()
+        if self.fsync_policy != "never":
+            os.fsync(self._active_file.fileno())
+        self._active_file.close()  # close でロックも解放される # Closing also releases the lock
+        self._active_file = None
+        self._active_path = None
+        self._active_bytes = 0
+
+    def _seal_active_segment(self):
+        with self._lock:
+            if self._active_file is not None and self._active_bytes > 0:
+                self._close_active_segment()
+
+    # このプロセスが反映するセグメント（自プロセス分と、終了したプロセスが残した分）。
+    # 他の生きているプロセスのセグメントはそのプロセスに任せる（その pending を片付けられるのは本人だけ）。
+    # 初めて見る引き取り対象は、その文書を pending に載せる
+    # Segments this process replays (its own and those left by processes that have exited).
+    # Segments of other live processes are left to them (only they can clear their pending entries).
+    # Newly seen adoptable segments have their documents loaded into pending
+    def _sealed_segments(self) -> list[str]:
+        with self._lock:
+            active = self._active_path
+        names = sorted(
+            name for name in os.listdir(self.spool_dir)
+            if name.startswith("segment-") and name.endswith(".log")
+        )
+        paths = []
+        for name in names:
+            path = os.path.join(self.spool_dir, name)
+            if path == active:
+                continue
+            pid = _segment_pid(name)
+            if pid != os.getpid():
+                # ロックの無い環境では他プロセスの生死を確かめられないため、自プロセス分だけにする
+                # Without locking, other processes' liveness cannot be checked safely, so only own segments
+                if fcntl is None or pid is None or _pid_alive(pid):
+                    continue
+            # この実行中に書いたものでなければ、同じ PID の前回のプロセスか終了したプロセスの残り
+            # Not written during this run: left by an exited process (or an earlier one with the same PID)
+            if path not in self._adopted and path not in self._written:
+                self._adopt(path)
+            paths.append(path)
+        self._forget_vanished()
+        return paths
+
+    def _adopt(self, path: str):
+        try:
+            with open(path, "rb") as f:
+                records = self._read_records(path, f)
+        except FileNotFoundError:
+            return
+        with self._lock:
+            self._track(records)
+            self._adopted[path] = records
+        if records:
+            logger.info(f"[INFO] スプールのセグメントを引き取り: {path}")  # Adopted a spool segment
+
+    # 引き取ったセグメントが他プロセスに反映・削除されていれば、その pending を外す
+    # Drop pending entries of adopted segments that another process has replayed and removed
+    def _forget_vanished(self):
+        with self._lock:
+            vanished = [path for path in self._adopted if not os.path.exists(path)]
+            for path in vanished:
+                self._untrack(self._adopted.pop(path))
+
+    # 開いたセグメントのレコードを追記順に読む
+    # Read an open segment's records in append order
+    def _read_records(self, path: str, f) -> list[dict]:
+        records = []
+        for raw in f:
+            try:
+                record = json_util.loads(raw.decode("utf-8"))
+            except Exception as e:
+                # 書き込み途中でクラッシュした末尾行などは読み飛ばす
+                # Skip torn lines, e.g. a crash in the middle of a write
+                logger.warning(f"[WARN] スプールの破損行をスキップ: {path} | {e}")
+                continue
+            records.append(record)
+        return records
+
+    # 追記順を保ったまま、同じコレクションへの連続した挿入を batch_size 件ずつまとめる
+    # Group consecutive inserts into the same collection by batch_size, keeping append order
+    def _batches(self, records: list[dict]) -> list[list[dict]]:
+        batches = []
+        for record in records:
+            last = batches[-1] if batches else None
+            if (
+                record["op"] == "insert" and last and last[0]["op"] == "insert"
+                and last[0]["collection"] == record["collection"] and len(last) < self.batch_size
+            ):
+                last.append(record)
+            else:
+                batches.append([record])
+        return batches
+
+    def _apply(self, batch: list[dict]):
+        head = batch[0]
+        if head["op"] == "insert":
+            self.writer(head["collection"], [record["doc"] for record in batch])
+        else:
+            self.operator(head["collection"], head)
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="write-spool", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        backoff = self.replay_interval
+        while not self._stop.is_set():
+            self._wakeup.wait(backoff)
+            self._wakeup.clear()
+            if self.replay_once():
+                backoff = self.replay_interval
+            else:
+                backoff = min(backoff * 2, 30.0)
+
+    # 封印済みセグメントを古い順に反映する。全て成功したら True
+    # Replay sealed segments oldest first; True when all of them were applied
+    def replay_once(self) -> bool:
+        self._seal_active_segment()
+        for path in self._sealed_segments():
+            if not self._replay_segment(path):
+                return False
+        return True
+
+    def _replay_segment(self, path: str) -> bool:
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            return True  # 他プロセスが反映済み # Already replayed by another process
+
+        with f:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    return True  # 他プロセスが書き込み中 # Still being written by another process
+            elif not os.path.basename(path).startswith(f"segment-{os.getpid()}-"):
+                return True
+
+            records = self._read_records(path, f)
+
+            try:
+                for batch in self._batches(records):
+                    self._apply(batch)
+            except Exception as e:
+                self.replay_failures += 1
+                attempts = self._attempts[path] = self._attempts.get(path, 0) + 1
+                if isinstance(e, TRANSIENT_ERRORS) or attempts < self.max_attempts:
+                    logger.warning(f"[WARN] スプールの反映に失敗（再試行します）: {path} | {e}")
+                    return False
+                if not self._replay_isolating(path, records):
+                    return False
+            self._attempts.pop(path, None)
+
+        # 反映は冪等なので、削除前に他プロセスが再反映しても問題ない
+        # Replay is idempotent, so another process re-applying before removal is harmless
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+        with self._lock:
+            self._adopted.pop(path, None)
+            self._written.discard(path)
+            self._untrack(records)
+            self.replayed += len(records)
+        return True
+
+    # 1件ずつ反映し、接続以外の理由で失敗するレコードを隔離する。接続断なら中断して False
+    # Apply one record at a time, quarantining those failing for reasons other than the connection;
+    # False (stop and retry later) on a connection error
+    def _replay_isolating(self, path: str, records: list[dict]) -> bool:
+        logger.warning(f"[WARN] スプールの反映が {self.max_attempts} 回失敗、1件ずつ反映します: {path}")  # Applying one by one
+        for record in records:
+            try:
+                self._apply([record])
+            except TRANSIENT_ERRORS as e:
+                logger.warning(f"[WARN] スプールの反映に失敗（再試行します）: {path} | {e}")
+                return False
+            except Exception as e:
+                self._quarantine(record, e)
+        return True
+
+    # 反映できないレコードを隔離ファイルに追記する（内容を確認して手で戻せるよう元の形式のまま残す）
+    # Append a record that cannot be applied to the quarantine file (kept in the spool format for manual recovery)
+    def _quarantine(self, record: dict, error: Exception):
+        with self._lock:
+            with open(self.quarantine_path, "ab") as f:
+                f.write((json_util.dumps({**record, "error": str(error)}, ensure_ascii=False) + "\n").encode("utf-8"))
+                f.flush()
+                os.fsync(f.fileno())
+            self.quarantined += 1
+        logger.error(f"[ERROR] 反映できないレコードを隔離: {record['collection']} {_record_key(record)} | {error}", include_traceback=False)  # Quarantined a record
+
+    # 封印済みセグメントの即時反映を促す
+    # Ask the replayer to drain sealed segments right away
+    def flush(self):
+        self._wakeup.set()
+
+    # 停止前に残りの書き込みを反映する（失敗分はディスクに残り次回起動時に反映）
+    # Replay what is left before stopping (failures stay on disk for the next start)
+    def shutdown(self, timeout: float = 5.0):
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None and self._thread.is_alive():
+            self._thread.join(timeout)
+        self.replay_once()
+
+    def stats(self) -> dict:
+        with self._lock:
+            pending = sum(len(docs) for docs in self._pending.values())
+            pending += sum(len(records) for records in self._pending_ops.values())
+        return {
+            "appended": self.appended,
+            "replayed": self.replayed,
+            "pending": pending,
+            "replay_failures": self.replay_failures,
+            "quarantined": self.quarantined,
+            "segments": len(self._sealed_segments())
+        }
+
+
+_spool = None
+_spool_lock = threading.Lock()
+
+def get_write_spool() -> WriteSpool:
+    global _spool
+    if _spool is None:
+        with _spool_lock:
+            if _spool is None:
+                _spool = WriteSpool(
+                    spool_dir=WRITE_SPOOL_DIR,
+                    fsync_policy=WRITE_SPOOL_FSYNC_POLICY,
+                    fsync_interval=WRITE_SPOOL_FSYNC_INTERVAL,
+                    segment_max_bytes=WRITE_SPOOL_SEGMENT_MAX_BYTES,
+                    replay_interval=WRITE_SPOOL_REPLAY_INTERVAL,
+                    batch_size=WRITE_SPOOL_BATCH_SIZE,
+                    max_attempts=WRITE_SPOOL_MAX_ATTEMPTS
+                )
+                # 前回プロセスの未反映セグメントがあれば起動直後に反映を始める
+                # Start replaying leftovers from a previous process right away
+                _spool._ensure_started()
+                atexit.register(_spool.shutdown)
+    return _spool
+
+# MongoDB への挿入をスプール経由で行う
+# Insert into MongoDB through the spool
+def enqueue_insert(collection_name: str, document: dict) -> ObjectId:
+    return get_write_spool().append(collection_name, document)
+
+def enqueue_insert_many(collection_name: str, documents: list[dict]) -> list[ObjectId]:
+    return get_write_spool().append_many(collection_name, documents)
+
+# _id 指定の更新・削除をスプール経由で行う
+# Update or delete by _id through the spool
+def enqueue_operation(collection_name: str, op: str, filter: dict, update: dict | None = None, upsert: bool = False):
+    get_write_spool().append_operation(collection_name, op, filter, update, upsert)
+
+# 反映前の文書を取得する（読み込み直後の整合性用）
+# Get documents not yet applied (for read-your-writes)
+def pending_documents(collection_name: str) -> list[dict]:
+    if _spool is None:
+        return []
+    return _spool.pending(collection_name)
+
+# 反映前の更新・削除を取得する（読み込み直後の整合性用）
+# Get updates and deletes not yet applied (for read-your-writes)
+def pending_operations(collection_name: str) -> list[dict]:
+    if _spool is None:
+        return []
+    return _spool.pending_operations(collection_name)
+
+def shutdown_write_spool():
+    if _spool is not None:
+        _spool.shutdown()
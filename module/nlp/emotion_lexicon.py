@@ -0,0 +1,127 @@
+# module/nlp/emotion_lexicon.py
+import os
+import threading
+
+from module.nlp.tagger import tokenize
+from module.params import emotion_map
+
+LEXICON_PATH = os.path.join(os.path.dirname(__file__), "data", "ja_emotion_lexicon.tsv")
+
+# 32感情の並び（index_emotion.emotion_order と同じ順）
+# The 32 emotions, in the same order as index_emotion.emotion_order
+EMOTIONS = [emotion_map[en] for en in sorted(emotion_map)]
+EMOTION_INDEX = {name: i for i, name in enumerate(EMOTIONS)}
+
+NEGATIONS = {"ない", "無い", "ぬ", "ず"}   # 直後2語以内にあれば否定 # Negation when within the next two tokens
+NEGATION_WINDOW = 2
+INTENSIFIERS = {"とても", "すごい", "凄い", "めっちゃ", "かなり", "超", "非常", "本当", "大変", "めちゃくちゃ"}
+INTENSIFIER_WEIGHT = 1.5
+NEGATED_PREFIX = "~"
+
+
+# 重みのベクトルを、32感情すべてを含む整数の構成比（合計100、該当なしなら全て0）にする
+# Turn a weight vector into integer 構成比 over all 32 emotions (sums to 100, all zeros when nothing matched)
+def to_composition(vector: list[float]) -> dict[str, int]:
+    total = sum(vector)
+    if total <= 0:
+        return {name: 0 for name in EMOTIONS}
+    shares = [v * 100 / total for v in vector]
+    counts = [int(s) for s in shares]
+    # 端数の大きい順に1ずつ足して合計を100に揃える（最大剰余法）
+    # Largest remainder: hand out the missing points by descending fraction
+    for i in sorted(range(len(shares)), key=lambda i: counts[i] - shares[i])[:100 - sum(counts)]:
+        counts[i] += 1
+    return dict(zip(EMOTIONS, counts))
+
+
+class EmotionLexicon:
+    """
+    日本語の見出し語 → 32感情の重みの辞書。翻訳も英語の感情辞書も使わずに構成比を出す。
+    - 見出し語は MeCab の基本形。読み込み時に (感情番号, 重み) の組へ変換しておく
+    - 否定（〜ない）が続く語は「~見出し語」の値を使い、無ければ数えない
+    - 強調語（とても 等）の直後に辞書の語があれば、その重みを INTENSIFIER_WEIGHT 倍する
+
+    Japanese lemma → weights over the 32 emotions. Produces 構成比 without translation or an English lexicon.
+    - Lemmas are MeCab base forms, compiled into (emotion index, weight) pairs at load time
+    - A lemma followed by a negation (〜ない) uses the "~lemma" entry and is skipped when there is none
+    - An intensifier (とても etc.) directly before a lexicon lemma scales its weights by INTENSIFIER_WEIGHT
+    """
+
+    def __init__(self, entries: dict[str, tuple[tuple[int, float], ...]]):
+        self._entries = entries
+
+    @classmethod
+    def load(cls, path: str = LEXICON_PATH) -> "EmotionLexicon":
+        entries = {}
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                lemma, spec = line.split("\t")
+                pairs = []
+                for part in spec.split(","):
+                    emotion, weight = part.split(":")
+                    pairs.append((EMOTION_INDEX[emotion], float(weight)))
+                entries[lemma] = tuple(pairs)
+        return cls(entries)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, lemma: str) -> bool:
+        return lemma in self._entries
+
+    def score_vector(self, lemmas: list[str]) -> list[float]:
+        vector = [0.0] * len(EMOTIONS)
+        boost = 1.0
+        for i, lemma in enumerate(lemmas):
+            if lemma in INTENSIFIERS and i + 1 < len(lemmas) and lemmas[i + 1] in self._entries:
+                boost = INTENSIFIER_WEIGHT
+                continue
+            negated = any(l in NEGATIONS for l in lemmas[i + 1:i + 1 + NEGATION_WINDOW])
+            entry = self._entries.get(NEGATED_PREFIX + lemma if negated else lemma)
+            if entry:
+                for index, weight in entry:
+                    vector[index] += weight * boost
+            boost = 1.0
+        return vector
+
+    def score_lemmas(self, lemmas: list[str]) -> dict[str, int]:
+        return to_composition(self.score_vector(lemmas))
+
+    def score_text(self, text: str) -> dict[str, int]:
+        return self.score_lemmas(tokenize_lemmas(text))
+
+    def score_texts(self, texts: list[str]) -> list[dict[str, int]]:
+        return [self.score_text(text) for text in texts]
+
+
+# MeCab の基本形の列
+# MeCab base forms
+def tokenize_lemmas(text: str) -> list[str]:
+    return [token.lemma for token in tokenize(text)]
+
+
+_lexicon = None
+_lexicon_lock = threading.Lock()
+
+def get_emotion_lexicon() -> EmotionLexicon:
+    global _lexicon
+    if _lexicon is None:
+        with _lexicon_lock:
+            if _lexicon is None:
+                _lexicon = EmotionLexicon.load()
+    return _lexicon
+
+
+def score_lemmas(lemmas: list[str]) -> dict[str, int]:
+    return get_emotion_lexicon().score_lemmas(lemmas)
+
+
+def score_text(text: str) -> dict[str, int]:
+    return get_emotion_lexicon().score_text(text)
+
+
+def score_texts(texts: list[str]) -> list[dict[str, int]]:
+    return get_emotion_lexicon().score_texts(texts)
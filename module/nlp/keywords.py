@@ -0,0 +1,76 @@
+# module/nlp/keywords.py
+import threading
+
+from module.nlp.tagger import tokenize
+
+DEFAULT_POS = ("名詞",)
+# 品詞細分類で除くもの（数詞） # POS subdivisions to leave out (numerals)
+DEFAULT_EXCLUDE_POS_DETAIL = ("数詞",)
+# キーワードとして意味の薄い名詞 # Nouns too generic to be useful keywords
+DEFAULT_STOPWORDS = frozenset({
+    "こと", "もの", "物", "事", "ため", "為", "よう", "様", "とき", "時", "ところ", "所", "方", "ほう",
+    "感じ", "自分", "さん", "ちゃん", "くん", "君", "中", "前", "後", "今", "何", "なに", "わけ", "訳",
+    "はず", "筈", "つもり", "みたい", "そう", "ん", "の", "ー",
+})
+
+
+class KeywordExtractor:
+    """
+    MeCab の形態素から、品詞・ストップワードで絞り込んだキーワードを出現順・重複なしで返す。
+    Tagger はスレッドごとに使い回す（module.nlp.tagger）。
+
+    Keywords from MeCab morphemes, filtered by part of speech and stop words, deduplicated in
+    first-seen order. Taggers are reused per thread (module.nlp.tagger).
+    """
+
+    def __init__(
+        self,
+        pos: tuple[str, ...] = DEFAULT_POS,
+        exclude_pos_detail: tuple[str, ...] = DEFAULT_EXCLUDE_POS_DETAIL,
+        stopwords: frozenset[str] = DEFAULT_STOPWORDS,
+        min_length: int = 1,
+        use_lemma: bool = False
+    ):
+        self.pos = frozenset(pos)
+        self.exclude_pos_detail = frozenset(exclude_pos_detail)
+        self.stopwords = frozenset(stopwords)
+        self.min_length = min_length
+        self.use_lemma = use_lemma
+
+    def extract(self, text: str, limit: int | None = None) -> list[str]:
+        keywords = {}
+        for token in tokenize(text):
+            if token.pos not in self.pos or token.pos_detail in self.exclude_pos_detail:
+                continue
+            word = token.lemma if self.use_lemma else token.surface
+            if len(word) < self.min_length or word in self.stopwords or word.isdigit():
+                continue
+            keywords.setdefault(word, None)
+        result = list(keywords)
+        return result[:limit] if limit is not None else result
+
+    # 同じ文は1度だけ解析する
+    # Identical texts are analysed once
+    def extract_batch(self, texts: list[str], limit: int | None = None) -> list[list[str]]:
+        results = {text: self.extract(text, limit) for text in dict.fromkeys(texts)}
+        return [list(results[text]) for text in texts]
+
+
+_extractor = None
+_extractor_lock = threading.Lock()
+
+def get_keyword_extractor() -> KeywordExtractor:
+    global _extractor
+    if _extractor is None:
+        with _extractor_lock:
+            if _extractor is None:
+                _extractor = KeywordExtractor()
+    return _extractor
+
+
+def extract_keywords(text: str, limit: int | None = None) -> list[str]:
+    return get_keyword_extractor().extract(text, limit)
+
+
+def extract_keywords_batch(texts: list[str], limit: int | None = None) -> list[list[str]]:
+    return get_keyword_extractor().extract_batch(texts, limit)
@@ -0,0 +1,132 @@
+# module/nlp/message_analysis.py
+import re
+from collections import defaultdict
+
+from nrclex import NRCLex
+
+from module.nlp.emotion_lexicon import score_text, to_composition, EMOTIONS
+from module.nlp.keywords import extract_keywords
+from module.nlp.translation import get_translation_service
+from module.params import EMOTION_ENGINE, HISTORY_ANALYSIS_DECAY, HISTORY_ANALYSIS_MAX_KEYWORDS
+
+# 形式を変えたら上げる（古い形式の分析結果は読み込み時に計算し直す）
+# Bump when the format changes (older analyses are recomputed when read)
+ANALYSIS_VERSION = 1
+
+# NRCLex の英語キー → 日本語の感情名
+# NRCLex English keys → Japanese emotion names
+NRCLEX_KEY_MAPPING = {
+    'fear': '恐れ', 'anger': '怒り', 'anticip': '期待', 'trust': '信頼',
+    'surprise': '驚き', 'positive': '積極性', 'negative': '悲観',
+    'sadness': '悲しみ', 'disgust': '嫌悪', 'joy': '喜び',
+}
+
+_JA_CHARS = re.compile(r"[぀-ヿ㐀-鿿ｦ-ﾟ]")
+_LATIN_CHARS = re.compile(r"[A-Za-z]")
+
+
+# 文字種の割合による簡易判定（"ja" / "en" / "other"、文字が無ければ ""）
+# Rough detection from character classes ("ja" / "en" / "other", "" when there are no letters)
+def detect_language(text: str) -> str:
+    ja = len(_JA_CHARS.findall(text or ""))
+    latin = len(_LATIN_CHARS.findall(text or ""))
+    if ja == 0 and latin == 0:
+        return "other" if (text or "").strip() else ""
+    return "ja" if ja * 2 >= latin else "en"
+
+
+# EMOTION_ENGINE に従って1件の構成比を出す（英語の発言は翻訳せずに NRCLex へ渡す）
+# 構成比 of one message per EMOTION_ENGINE (English messages go to NRCLex untranslated)
+def score_emotion(text: str, lang: str, engine: str = EMOTION_ENGINE) -> dict:
+    if engine == "lexicon":
+        return score_text(text)
+    if lang != "en":
+        text = get_translation_service().translate(text)
+    return {NRCLEX_KEY_MAPPING.get(k, k): v for k, v in NRCLex(text).affect_frequencies.items()}
+
+
+# 1件のメッセージの分析結果（score=False なら構成比を含めず、読むときに analysis_for が補う）
+# Analysis of one message (with score=False the 構成比 is left out and analysis_for fills it in when read)
+def analyze_message(text: str, engine: str = EMOTION_ENGINE, score: bool = True) -> dict:
+    lang = detect_language(text)
+    analysis = {
+        "version": ANALYSIS_VERSION,
+        "engine": engine,
+        "lang": lang,
+        "keywords": extract_keywords(text)
+    }
+    if score:
+        analysis["構成比"] = score_emotion(text, lang, engine)
+    return analysis
+
+
+# append_history で保存する分析結果。lexicon は手元で済むのでその場で採点する。
+# nrclex は翻訳（外部サービス）が要るため構成比を後回しにし、翻訳だけを背景で先読みしておく
+# The analysis stored by append_history. The lexicon is local, so it scores right away.
+# nrclex needs a translation (an online service), so its 構成比 is deferred and only the translation is prefetched
+def analyze_for_history(text: str, engine: str = EMOTION_ENGINE) -> dict:
+    if engine == "lexicon":
+        return analyze_message(text, engine)
+    analysis = analyze_message(text, engine, score=False)
+    if analysis["lang"] not in ("en", ""):
+        get_translation_service().prefetch([text])
+    return analysis
+
+
+def is_current(analysis, engine: str = EMOTION_ENGINE) -> bool:
+    return isinstance(analysis, dict) and analysis.get("version") == ANALYSIS_VERSION and analysis.get("engine") == engine
+
+
+# 保存済みの分析結果を使い、無い（旧形式の）メッセージだけをここで分析する。構成比が後回しなら補う
+# Use the stored analysis; only messages without one (legacy entries) are analysed here. A deferred 構成比 is filled in
+def analysis_for(text: str, stored=None, engine: str = EMOTION_ENGINE) -> dict:
+    if not is_current(stored, engine):
+        return analyze_message(text, engine)
+    if "構成比" not in stored:
+        return {**stored, "構成比": score_emotion(text, stored.get("lang", ""), engine)}
+    return stored
+
+
+def aggregate_analyses(
+    analyses: list[dict],
+    decay: float = HISTORY_ANALYSIS_DECAY,
+    max_keywords: int = HISTORY_ANALYSIS_MAX_KEYWORDS,
+    engine: str = EMOTION_ENGINE
+) -> dict:
+    """
+    新しい順に並んだメッセージ単位の分析結果を、1ターン分の分析にまとめる。
+    i 番目（0 が最新）の重みは decay ** i。
+    - 構成比: 重み付き平均（lexicon は32感情の整数・合計100に揃える）
+    - keywords: 含むメッセージの重みの合計が大きい順（同点は新しい方を先に）
+    - lang: 重みの合計が最も大きい言語
+
+    Combines per-message analyses (newest first) into one turn-level analysis.
+    The i-th message (0 is the newest) is weighted decay ** i.
+    - 構成比: weighted mean (lexicon is rounded to integers over the 32 emotions, summing to 100)
+    - keywords: by the summed weight of the messages containing them (ties: newer first)
+    - lang: the language with the largest summed weight
+    """
+    composition = defaultdict(float)
+    keyword_weights = {}
+    lang_weights = defaultdict(float)
+    total = 0.0
+    for i, analysis in enumerate(analyses):
+        weight = decay ** i
+        total += weight
+        for emotion, value in (analysis.get("構成比") or {}).items():
+            composition[emotion] += weight * value
+        for keyword in analysis.get("keywords") or []:
+            keyword_weights[keyword] = keyword_weights.get(keyword, 0.0) + weight
+        if analysis.get("lang"):
+            lang_weights[analysis["lang"]] += weight
+
+    if engine == "lexicon":
+        emotion = to_composition([composition.get(name, 0.0) for name in EMOTIONS])
+    else:
+        emotion = {k: round(v / total, 4) for k, v in composition.items()} if total else {}
+    keywords = sorted(keyword_weights, key=lambda k: -keyword_weights[k])[:max_keywords]
+    return {
+        "構成比": emotion,
+        "keywords": keywords,
+        "lang": max(lang_weights, key=lang_weights.get) if lang_weights else ""
+    }
@@ -0,0 +1,54 @@
+# module/nlp/tagger.py
+import threading
+from typing import NamedTuple
+
+import MeCab
+
+
+class Token(NamedTuple):
+    surface: str
+    pos: str          # 品詞 # Part of speech (e.g. 名詞)
+    pos_detail: str   # 品詞細分類1 # First POS subdivision (e.g. 固有名詞)
+    lemma: str        # 基本形（無ければ表層形） # Base form (the surface when absent)
+
+
+_local = threading.local()
+
+
+# スレッドごとに1つの Tagger を作って使い回す（Tagger はスレッド間で共有しない）
+# One Tagger per thread, reused across calls (a Tagger is never shared between threads)
+def get_tagger() -> MeCab.Tagger:
+    tagger = getattr(_local, "tagger", None)
+    if tagger is None:
+        tagger = _local.tagger = MeCab.Tagger()
+    return tagger
+
+
+# 起動時に辞書を読み込んでおき、最初の会話で待たせない
+# Load the dictionary at startup so the first conversation does not pay for it
+def warm_up():
+    tokenize("辞書の読み込み")
+
+
+# 基本形は UniDic なら書字形基本形、IPADIC なら原形
+# The base form is the UniDic orthographic base or the IPADIC base form
+def _lemma(surface: str, fields: list[str]) -> str:
+    if len(fields) > 10:
+        lemma = fields[10] if fields[10] != "*" else fields[7]
+    elif len(fields) > 6:
+        lemma = fields[6]
+    else:
+        lemma = "*"
+    return surface if lemma == "*" else lemma
+
+
+def tokenize(text: str) -> list[Token]:
+    tokens = []
+    node = get_tagger().parseToNode(text or "")
+    while node:
+        surface = node.surface
+        if surface:
+            fields = node.feature.split(",")
+            tokens.append(Token(surface, fields[0], fields[1] if len(fields) > 1 else "*", _lemma(surface, fields)))
+        node = node.next
+    return tokens
@@ -0,0 +1,325 @@
+# module/nlp/translation.py
+import json
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from collections import Counter, OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+GLOSSARY_PATH = os.path.join(os.path.dirname(__file__), "data", "ja_en_glossary.json")
+ONLINE_BATCH_MAX_CHARS = 450  # 無料 API の1リクエスト上限（500文字）に収める # Stay under the free API's 500-character request limit
+
+
+# キャッシュキー用の正規化（全角/半角の統一・前後の空白除去・連続空白の圧縮）
+# Normalization for cache keys (NFKC width folding, trimmed and collapsed whitespace)
+def normalize_text(text: str) -> str:
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", text or "")).strip()
+
+
+class OnlineBackend:
+    """
+    translate ライブラリ（オンラインサービス）による翻訳。Translator は1度だけ作る。
+    Translation through the translate library (online service); the Translator is built once.
+    """
+
+    name = "online"
+
+    def __init__(self, from_lang: str = "ja", to_lang: str = "en"):
+        from translate import Translator
+        self._translator = Translator(from_lang=from_lang, to_lang=to_lang)
+
+    def translate(self, text: str) -> str:
+        return self._translator.translate(text)
+
+    # 短い文は改行でつないで1リクエストにまとめ、行数が合わなければ1件ずつ訳し直す
+    # Join short texts with newlines into one request; translate one by one if the line count comes back different
+    def translate_batch(self, texts: list[str]) -> list[str]:
+        results = []
+        chunk = []
+        for text in texts:
+            if chunk and len("\n".join(chunk + [text])) > ONLINE_BATCH_MAX_CHARS:
+                results.extend(self._translate_chunk(chunk))
+                chunk = []
+            chunk.append(text)
+        if chunk:
+            results.extend(self._translate_chunk(chunk))
+        return results
+
+    def _translate_chunk(self, chunk: list[str]) -> list[str]:
+        if len(chunk) > 1:
+            lines = self.translate("\n".join(chunk)).split("\n")
+            if len(lines) == len(chunk):
+                return [line.strip() for line in lines]
+        return [self.translate(text) for text in chunk]
+
+
+class GlossaryBackend:
+    """
+    ネットワーク不要の用語集による近似翻訳。最長一致で見つかった語の英訳を空白区切りで返す。
+    感情分析（NRCLex）に渡すための語の列であり、文としての翻訳ではない。
+
+    Network-free approximate translation from a glossary. Returns the English words of the
+    longest-match terms found, separated by spaces. This is a word list for emotion scoring
+    (NRCLex), not a sentence translation.
+    """
+
+    name = "glossary"
+
+    def __init__(self, glossary: dict | None = None, path: str = GLOSSARY_PATH):
+        if glossary is None:
+            with open(path, "r", encoding="utf-8") as f:
+                glossary = json.load(f)
+        self._glossary = glossary
+        self._max_len = max((len(term) for term in glossary), default=0)
+
+    def translate(self, text: str) -> str:
+        words = []
+        i = 0
+        while i < len(text):
+            for length in range(min(self._max_len, len(text) - i), 0, -1):
+                english = self._glossary.get(text[i:i + length])
+                if english:
+                    words.append(english)
+                    i += length
+                    break
+            else:
+                i += 1
+        return " ".join(words)
+
+    def translate_batch(self, texts: list[str]) -> list[str]:
+        return [self.translate(text) for text in texts]
+
+
+class TranslationService:
+    """
+    ja → en 翻訳のキャッシュ層。キーは normalize_text 後の文字列。
+    - メモリ上の LRU（maxsize 件まで）と、persistent_path 指定時の SQLite のキー・値キャッシュ
+    - translate_batch は重複を除き、キャッシュに無いものだけをまとめて backend に渡す
+    - backend が失敗したとき、または timeout 秒以内に返らないときは fallback（用語集など）で訳す。
+      その結果はメモリにだけ置き、永続化しない
+    - 訳している最中（先読みを含む）の文を別の呼び出しが求めたら、backend を呼ばずにその結果を待つ
+
+    Caching layer for ja → en translation, keyed by the normalize_text form.
+    - In-memory LRU (up to maxsize entries) plus an SQLite key-value cache when persistent_path is set
+    - translate_batch dedupes and sends only the cache misses to the backend, in one batch
+    - When the backend fails or does not answer within timeout seconds, the fallback (e.g. the glossary)
+      translates; those results stay in memory only
+    - A text already being translated (including by a prefetch) is awaited instead of sent to the backend again
+    """
+
+    def __init__(
+        self,
+        backend,
+        fallback=None,
+        maxsize: int = 4096,
+        persistent_path: str | None = None,
+        timeout: float | None = None
+    ):
+        self.backend = backend
+        self.fallback = fallback
+        self.maxsize = maxsize
+        self.timeout = timeout
+        # 期限付きの呼び出しは専用スレッドで行い、応答しないサービスに呼び出し元を巻き込まない
+        # Timed calls run on dedicated threads so an unresponsive service cannot hold the caller
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="translation") if timeout else None
+        self._prefetcher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="translation-prefetch")
+        self._memory = OrderedDict()
+        self._inflight = {}  # 訳している最中の文 -> Future # text being translated -> Future
+        self._lock = threading.Lock()
+        self._conn = None
+        if persistent_path:
+            directory = os.path.dirname(persistent_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(persistent_path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS translation_cache (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            self._conn.commit()
+        self.counts = Counter()
+
+    def _key(self, normalized: str) -> str:
+        return f"{self.backend.name}:{normalized}"
+
+    def _lookup(self, normalized: str) -> str | None:
+        key = self._key(normalized)
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.counts["memory_hits"] += 1
+                return self._memory[key]
+            if self._conn is not None:
+                row = self._conn.execute("SELECT value FROM translation_cache WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    self._store_memory(key, row[0])
+                    self.counts["persistent_hits"] += 1
+                    return row[0]
+            self.counts["misses"] += 1
+            return None
+
+    def _store_memory(self, key: str, value: str):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.maxsize:
+            self._memory.popitem(last=False)
+
+    def _store(self, pairs: list[tuple[str, str]], persist: bool):
+        with self._lock:
+            for normalized, value in pairs:
+                self._store_memory(self._key(normalized), value)
+            if persist and self._conn is not None and pairs:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO translation_cache VALUES (?, ?)",
+                    [(self._key(n), v) for n, v in pairs]
+                )
+                self._conn.commit()
+
+    def translate(self, text: str) -> str:
+        return self.translate_batch([text])[0]
+
+    def translate_batch(self, texts: list[str]) -> list[str]:
+        normalized = [normalize_text(t) for t in texts]
+        found, waiting, owned = self._claim(normalized)
+        if owned:
+            found.update(self._translate_owned(owned))
+
+        retry = []
+        for n, future in waiting.items():
+            self.counts["inflight_waits"] += 1
+            try:
+                found[n] = future.result(timeout=self.timeout)
+            except Exception:
+                retry.append(n)  # 待ちきれなければ自分で訳す # Translate it here if the wait fails
+        if retry:
+            found.update(self._translate(retry))
+
+        return [found[n] for n in normalized]
+
+    # キャッシュに無い文を、訳している最中のもの（待つ）と、ここで訳すもの（Future を登録する）に分ける
+    # Split cache misses into texts already in flight (to wait on) and texts to translate here (Future registered)
+    def _claim(self, normalized: list[str]) -> tuple[dict, dict, list]:
+        found, waiting, owned = {}, {}, []
+        for n in dict.fromkeys(normalized):
+            if not n:
+                found[n] = ""
+                continue
+            cached = self._lookup(n)
+            if cached is not None:
+                found[n] = cached
+                continue
+            with self._lock:
+                future = self._inflight.get(n)
+                if future is not None:
+                    waiting[n] = future
+                elif self._key(n) in self._memory:
+                    # 引いた後に別の呼び出しが訳し終えていた # Another call finished it after the lookup
+                    found[n] = self._memory[self._key(n)]
+                else:
+                    self._inflight[n] = Future()
+                    owned.append(n)
+        return found, waiting, owned
+
+    # 登録した Future は必ず完了させる（待っている呼び出しを取り残さない）
+    # Always complete the registered Futures so no waiting call is left behind
+    def _translate_owned(self, owned: list[str]) -> dict:
+        try:
+            translated = self._translate(owned)
+        except BaseException as e:
+            self._release(owned, e)
+            raise
+        with self._lock:
+            for n in owned:
+                self._inflight.pop(n).set_result(translated[n])
+        return translated
+
+    def _release(self, owned: list[str], error: BaseException):
+        with self._lock:
+            for n in owned:
+                self._inflight.pop(n).set_exception(error)
+
+    def _translate(self, misses: list[str]) -> dict:
+        try:
+            translated = self._call_backend(misses)
+            persist = True
+            self.counts["backend_calls"] += 1
+        except Exception as e:
+            if isinstance(e, FutureTimeoutError):
+                self.counts["timeouts"] += 1
+            if self.fallback is None:
+                raise
+            from module.utils.utils import logger  # 遅延importで循環参照を回避
+            logger.warning(f"[WARN] 翻訳に失敗、{self.fallback.name} で代替します: {e}")  # Translation failed, using the fallback
+            translated = self.fallback.translate_batch(misses)
+            persist = False
+            self.counts["fallbacks"] += 1
+        pairs = list(zip(misses, translated))
+        self._store(pairs, persist)
+        return dict(pairs)
+
+    # 背景スレッドで訳してキャッシュに載せておく。訳す文はここで（呼び出し元のスレッドで）登録するため、
+    # 直後に同じ文を求めた呼び出しは backend を呼び直さずに先読みの結果を待つ
+    # Translate on a background thread to warm the cache. The texts are claimed here, on the caller's thread,
+    # so a call asking for the same text right after waits for the prefetch instead of calling the backend again
+    def prefetch(self, texts: list[str]):
+        found, waiting, owned = self._claim([normalize_text(t) for t in texts])
+        self.counts["prefetches"] += 1
+        if not owned:
+            return
+
+        def run():
+            try:
+                self._translate_owned(owned)
+            except Exception as e:
+                from module.utils.utils import logger  # 遅延importで循環参照を回避
+                logger.warning(f"[WARN] 翻訳の先読みに失敗: {e}")  # Translation prefetch failed
+        try:
+            self._prefetcher.submit(run)
+        except RuntimeError as e:  # 停止処理中 # Shutting down
+            self._release(owned, e)
+
+    def _call_backend(self, texts: list[str]) -> list[str]:
+        if self._executor is None:
+            return self.backend.translate_batch(texts)
+        return self._executor.submit(self.backend.translate_batch, texts).result(timeout=self.timeout)
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self.counts["memory_hits"] + self.counts["persistent_hits"]
+            lookups = hits + self.counts["misses"]
+            return {
+                "backend": self.backend.name,
+                "size": len(self._memory),
+                "persistent": self._conn is not None,
+                **{k: self.counts[k] for k in ("memory_hits", "persistent_hits", "misses", "backend_calls", "fallbacks", "timeouts", "prefetches", "inflight_waits")},
+                "hit_rate": round(hits / lookups, 3) if lookups else 0.0
+            }
+
+
+def create_backend(name: str):
+    if name == "online":
+        return OnlineBackend()
+    if name == "glossary":
+        return GlossaryBackend()
+    raise ValueError(f"unknown translation backend: {name}")
+
+
+_service = None
+_service_lock = threading.Lock()
+
+def get_translation_service() -> TranslationService:
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                from module.params import (
+                    TRANSLATION_BACKEND, TRANSLATION_FALLBACK, TRANSLATION_CACHE_MAXSIZE, TRANSLATION_CACHE_PATH, TRANSLATION_TIMEOUT
+                )
+                _service = TranslationService(
+                    create_backend(TRANSLATION_BACKEND),
+                    fallback=create_backend(TRANSLATION_FALLBACK) if TRANSLATION_FALLBACK else None,
+                    maxsize=TRANSLATION_CACHE_MAXSIZE,
+                    persistent_path=TRANSLATION_CACHE_PATH,
+                    timeout=TRANSLATION_TIMEOUT if TRANSLATION_BACKEND == "online" else None
+                )
+    return _service
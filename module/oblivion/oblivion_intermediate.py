@@ -1,21 +1,19 @@
 # module/oblivion/oblivion_intermediate.py
 from datetime import datetime, timedelta
 
-from module.mongo.mongo_client import get_mongo_client
+from module.mongo.repository import find_emotion_data_by_category, insert_oblivion_entries
 from module.utils.utils import logger
+from module.utils.turn_context import current_session_id
 
 
-def get_expired_intermediate_emotions():
+def get_expired_intermediate_emotions(session_id: str | None = None):
     """
     MongoDBから"intermediate"カテゴリの感情データを全件取得し、
     各履歴内の日付が3か月以上前のものがあるドキュメントのみ抽出する。
     """
+    session_id = session_id or current_session_id()
     try:
-        client = get_mongo_client()
-        db = client["emotion_db"]
-        collection = db["emotion_data"]
-
-        intermediate_docs = list(collection.find({"category": "intermediate"}))
+        intermediate_docs = find_emotion_data_by_category("intermediate", session_id)
         expired_docs = []
         threshold = datetime.now() - timedelta(days=90)
 
@@ -39,19 +37,15 @@ def get_expired_intermediate_emotions():
         return []
 
 
-def save_oblivion_intermediate_entries():
+def save_oblivion_intermediate_entries(session_id: str | None = None):
     """
     "intermediate"カテゴリの感情データから、3か月以上前の履歴を抽出し、
     必要な情報のみを emotion_oblivion コレクションに保存する。
     """
+    session_id = session_id or current_session_id()
     try:
-        client = get_mongo_client()
-        db = client["emotion_db"]
-        source_collection = db["emotion_data"]
-        target_collection = db["emotion_oblivion"]
-
         threshold = datetime.now() - timedelta(days=90)
-        intermediate_docs = list(source_collection.find({"category": "intermediate"}))
+        intermediate_docs = find_emotion_data_by_category("intermediate", session_id)
         oblivion_entries = []
 
         for doc in intermediate_docs:
@@ -76,8 +70,8 @@ def save_oblivion_intermediate_entries():
                     logger.warning(f"[WARN] 履歴の日付形式が不正: {date_str} | {e}")
 
         if oblivion_entries:
-            result = target_collection.insert_many(oblivion_entries)
-            logger.info(f"✅ 忘却記録（intermediate）を {len(result.inserted_ids)} 件保存しました")
+            inserted_count = insert_oblivion_entries(oblivion_entries, session_id)
+            logger.info(f"✅ 忘却記録（intermediate）を {inserted_count} 件保存しました")
         else:
             logger.info("⛔ 忘却対象データ（intermediate）はありませんでした")
 
@@ -9,39 +9,39 @@ from module.oblivion.oblivion_index import remove_index_entries_by_date, remove_
 from module.utils.utils import logger
 
 #intermediateカテゴリに関する忘却処理をまとめて呼び出す。
-def run_intermediate_oblivion_process():
+def run_intermediate_oblivion_process(session_id: str | None = None):
     logger.info("📦 [START] intermediate忘却プロセスの実行")
-    expired = get_expired_intermediate_emotions()
+    expired = get_expired_intermediate_emotions(session_id)
     logger.info(f"🔍 忘却候補の中期感情数: {len(expired)}")
-    save_oblivion_intermediate_entries()
+    save_oblivion_intermediate_entries(session_id)
     logger.info("✅ [DONE] intermediate忘却処理が完了しました")
 
 #shortカテゴリに関する忘却処理をまとめて呼び出す。
-def run_short_oblivion_process():
+def run_short_oblivion_process(session_id: str | None = None):
     logger.info("📦 [START] short忘却プロセスの実行")
-    expired = get_expired_short_term_emotions()
+    expired = get_expired_short_term_emotions(session_id)
     logger.info(f"🔍 忘却候補の短期感情数: {len(expired)}")
-    save_oblivion_short_entries()
+    save_oblivion_short_entries(session_id)
     logger.info("✅ [DONE] short忘却処理が完了しました")
 
 
 #emotion_index と emotion_data から、oblivion の日付に一致する履歴を削除する。
-def run_index_and_data_removal_process():
+def run_index_and_data_removal_process(session_id: str | None = None):
     logger.info("🗑️ [START] インデックス・履歴削除プロセスを実行")
-    remove_index_entries_by_date()
-    remove_history_entries_by_date()
+    remove_index_entries_by_date(session_id)
+    remove_history_entries_by_date(session_id)
     logger.info("✅ [DONE] emotion_index / emotion_data からの履歴削除が完了しました")
 
 
-#全体的な忘却プロセスの実行（順序制御あり）
-def run_oblivion_cleanup_all():
-    run_short_oblivion_process()
-    run_intermediate_oblivion_process()
-    run_index_and_data_removal_process()
+#全体的な忘却プロセスの実行（順序制御あり）。session_id 未指定時はターンのセッション（ターン外では既定のセッション）
+def run_oblivion_cleanup_all(session_id: str | None = None):
+    run_short_oblivion_process(session_id)
+    run_intermediate_oblivion_process(session_id)
+    run_index_and_data_removal_process(session_id)
 
     logger.info("🗑️ [START] oblivion期限付きデータの削除")
-    delete_expired_oblivion_entries()
-    delete_expired_short_oblivion_entries()
+    delete_expired_oblivion_entries(session_id)
+    delete_expired_short_oblivion_entries(session_id)
     logger.info("✅ [DONE] emotion_oblivion の古いデータを削除しました")
 
 
@@ -1,22 +1,20 @@
 #module/oblivion/oblivion_purge.py
 from datetime import datetime, timedelta
 
-from module.mongo.mongo_client import get_mongo_client
+from module.mongo.repository import find_oblivion_dates, delete_oblivion_entries
 from module.utils.utils import logger
+from module.utils.turn_context import current_session_id
 
 
 #emotion_oblivion に保存されたデータのうち、"date" が6か月以上前のものを完全削除する。
-def delete_expired_oblivion_entries():
+def delete_expired_oblivion_entries(session_id: str | None = None):
+    session_id = session_id or current_session_id()
     try:
-        client = get_mongo_client()
-        db = client["emotion_db"]
-        collection = db["emotion_oblivion"]
-
         threshold = datetime.now() - timedelta(days=180)
         expired_ids = []
 
         # 全件走査して、dateがしきい値より古いものを抽出
-        all_entries = list(collection.find({}))
+        all_entries = find_oblivion_dates(session_id=session_id)
         for doc in all_entries:
             date_str = doc.get("date")
             if not date_str:
@@ -29,8 +27,8 @@ def delete_expired_oblivion_entries():
                 logger.warning(f"[WARN] 日付解析失敗: {date_str} | {e}")
 
         if expired_ids:
-            result = collection.delete_many({"_id": {"$in": expired_ids}})
-            logger.info(f"🗑️ 6か月以上経過した忘却データを {result.deleted_count} 件削除しました")
+            deleted_count = delete_oblivion_entries(expired_ids)
+            logger.info(f"🗑️ 6か月以上経過した忘却データを {deleted_count} 件削除しました")
         else:
             logger.info("⏳ 削除対象となる6か月以上前の忘却データはありませんでした")
 
@@ -38,17 +36,14 @@ def delete_expired_oblivion_entries():
         logger.error(f"[ERROR] emotion_oblivion の期限切れ削除に失敗: {e}")
 
 #emotion_oblivion に保存された shortカテゴリのデータのうち、"date" が14日以上前のものを完全削除する。
-def delete_expired_short_oblivion_entries():
+def delete_expired_short_oblivion_entries(session_id: str | None = None):
+    session_id = session_id or current_session_id()
     try:
-        client = get_mongo_client()
-        db = client["emotion_db"]
-        collection = db["emotion_oblivion"]
-
         threshold = datetime.now() - timedelta(days=14)
         expired_ids = []
 
         # shortカテゴリ限定で処理
-        short_entries = list(collection.find({"category": "short"}))
+        short_entries = find_oblivion_dates(["short"], session_id)
 
         for doc in short_entries:
             date_str = doc.get("date")
@@ -62,8 +57,8 @@ def delete_expired_short_oblivion_entries():
                 logger.warning(f"[WARN] 日付解析失敗: {date_str} | {e}")
 
         if expired_ids:
-            result = collection.delete_many({"_id": {"$in": expired_ids}})
-            logger.info(f"🗑️ shortカテゴリの忘却データを {result.deleted_count} 件削除しました（14日以上経過）")
+            deleted_count = delete_oblivion_entries(expired_ids)
+            logger.info(f"🗑️ shortカテゴリの忘却データを {deleted_count} 件削除しました（14日以上経過）")
         else:
             logger.info("⏳ 削除対象となる14日以上前のshortデータはありませんでした")
 
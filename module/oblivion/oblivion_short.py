@@ -2,21 +2,19 @@
 from datetime import datetime, timedelta
 
 from module.emotion.emotion_stats import load_current_emotion
-from module.mongo.mongo_client import get_mongo_client
+from module.mongo.repository import find_emotion_data_by_category, insert_oblivion_entries
 from module.utils.utils import logger
+from module.utils.turn_context import current_session_id
 
 
-def get_expired_short_term_emotions():
+def get_expired_short_term_emotions(session_id: str | None = None):
     """
     MongoDBから"short"カテゴリの感情データを全件取得し、
     各履歴内の日付が7日以上前のものがあるドキュメントのみ抽出する。
     """
+    session_id = session_id or current_session_id()
     try:
-        client = get_mongo_client()
-        db = client["emotion_db"]
-        collection = db["emotion_data"]
-
-        short_docs = list(collection.find({"category": "short"}))
+        short_docs = find_emotion_data_by_category("short", session_id)
         expired_docs = []
         threshold = datetime.now() - timedelta(days=7)
 
@@ -40,19 +38,15 @@ def get_expired_short_term_emotions():
         return []
 
 
-def save_oblivion_short_entries():
+def save_oblivion_short_entries(session_id: str | None = None):
     """
     "short"カテゴリの感情データから、1週間以上前の履歴を抽出し、
     必要な情報のみを emotion_oblivion コレクションに保存する。
     """
+    session_id = session_id or current_session_id()
     try:
-        client = get_mongo_client()
-        db = client["emotion_db"]
-        source_collection = db["emotion_data"]
-        target_collection = db["emotion_oblivion"]
-
         threshold = datetime.now() - timedelta(days=7)
-        short_docs = list(source_collection.find({"category": "short"}))
+        short_docs = find_emotion_data_by_category("short", session_id)
         oblivion_entries = []
 
         for doc in short_docs:
@@ -77,8 +71,8 @@ def save_oblivion_short_entries():
                     logger.warning(f"[WARN] 履歴の日付形式が不正: {date_str} | {e}")
 
         if oblivion_entries:
-            result = target_collection.insert_many(oblivion_entries)
-            logger.info(f"✅ 忘却記録を {len(result.inserted_ids)} 件保存しました")
+            inserted_count = insert_oblivion_entries(oblivion_entries, session_id)
+            logger.info(f"✅ 忘却記録を {inserted_count} 件保存しました")
         else:
             logger.info("⛔ 忘却対象データはありませんでした")
 
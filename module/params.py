@@ -1,4 +1,9 @@
 # module/params.py
+import os
+
+# プロジェクト直下。ファイルの既定パスはここを基準にし、起動ディレクトリに依存させない
+# Project root; default file paths are anchored here so they do not depend on the working directory
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 # OpenAI設定
 # OpenAI settings
@@ -23,15 +28,138 @@ DEFAULT_MAIN_EMOTION = "未定義" # 未定義 # Undefined
 
 # データ保存設定
 # Data storage settings
-USE_MONGODB = True
+# False の場合は組み込みストレージ（SQLite）を使う。環境変数 USE_MONGODB=false で切り替え可能
+# When False the embedded store (SQLite) is used; switch with the USE_MONGODB=false env var
+USE_MONGODB = os.getenv("USE_MONGODB", "true").lower() not in ("false", "0", "no")
+LOCAL_DB_PATH = os.getenv("LOCAL_DB_PATH", os.path.join(PROJECT_DIR, "local_data", "emotion_db.sqlite3"))
 MONGODB_URI = "your-mongo-uri-here"
 EMOTION_DB_NAME = "emotion_db"
 EMOTION_COLLECTION_NAME = "emotion_index"
 
+# MongoDB接続設定（プロセス内で1つの MongoClient を共有）
+# MongoDB connection settings (one shared MongoClient per process)
+MONGO_MAX_POOL_SIZE = 50
+MONGO_MIN_POOL_SIZE = 2
+MONGO_MAX_IDLE_TIME_MS = 60000
+MONGO_SERVER_SELECTION_TIMEOUT_MS = 5000
+MONGO_CONNECT_TIMEOUT_MS = 5000
+MONGO_SOCKET_TIMEOUT_MS = 10000
+MONGO_HEARTBEAT_FREQUENCY_MS = 10000  # 生死判定に使うハートビート間隔 # Heartbeat interval used for liveness
+MONGO_COMPRESSORS = "zlib"            # zstd/snappy はライブラリ導入時に追加 # Add zstd/snappy when installed
+MONGO_RETRY_WRITES = True
+MONGO_RETRY_READS = True
+MONGO_APP_NAME = "yumia"
+MIGRATE_ON_STARTUP = True               # 起動時にインデックスを作成する # Create indexes at startup
+VERIFY_QUERY_PLANS_ON_STARTUP = False   # 起動時に explain() で実行計画を検証する # Check query plans with explain() at startup
+
+# 書き込みスプール設定（MongoDB書き込みの write-behind）
+# Write spool settings (write-behind for MongoDB writes)
+WRITE_SPOOL_DIR = os.getenv("WRITE_SPOOL_DIR", os.path.join(PROJECT_DIR, "spool"))  # セグメントファイルの保存先 # Directory for segment files
+WRITE_SPOOL_FSYNC_POLICY = "interval"         # "always" / "interval" / "never"
+WRITE_SPOOL_FSYNC_INTERVAL = 1.0              # 秒。interval時のfsync間隔 # Seconds between fsyncs for "interval"
+WRITE_SPOOL_SEGMENT_MAX_BYTES = 4 * 1024 * 1024  # これを超えたら新しいセグメントへ # Rotate segments above this size
+WRITE_SPOOL_REPLAY_INTERVAL = 0.5             # 秒。リプレイヤーの実行間隔 # Seconds between replays
+WRITE_SPOOL_BATCH_SIZE = 500                  # 1回の bulk_write 件数 # Documents per bulk_write
+WRITE_SPOOL_MAX_ATTEMPTS = 5                  # 連続失敗がこの回数で1件ずつ反映し、失敗する文書を隔離 # Failures before per-document replay and quarantine
+
+# サーバー設定
+# Server settings
+CHAT_THREADPOOL_SIZE = 100  # ブロッキング処理を実行するスレッド数の上限 # Max threads for blocking work
+
+# セッション設定
+# Session settings
+DEFAULT_SESSION_ID = "default"  # session_id 未指定時（および導入前の既存データ）のセッション # Session used when none is given (and for pre-existing data)
+SESSION_CACHE_SIZE = 1024       # セッション別キャッシュに保持するセッション数 # Sessions kept in the per-session cache
+SESSION_CACHE_TTL = 30.0        # セッション別キャッシュの有効期間（秒） # Per-session cache lifetime in seconds
+
+# emotion_index のプロセス内キャッシュ（差分読み込み）
+# In-process emotion_index cache (incremental loading)
+INDEX_CACHE_ENABLED = True
+INDEX_CACHE_MAX_SESSIONS = 64       # 保持するセッション数 # Sessions kept in the cache
+INDEX_CACHE_OVERLAP_SECONDS = 60.0  # 差分読み込みで遡る秒数（スプール経由の遅い挿入を拾う） # Look-back for late spooled inserts
+INDEX_CHANGES_KEPT = 100            # 版番号ごとに残す変更 _id の履歴数（これより遅れたキャッシュは全件を読み直す） # Version change records kept (caches further behind reload everything)
+
+# プロンプト設定
+# Prompt settings
+PROMPT_RELOAD_INTERVAL = 2.0  # prompt/ の更新確認の間隔（秒） # Seconds between checks for edits under prompt/
+
+# 入力トークン予算（超えた分は優先度の低い区画から削る）
+# Input token budget (sections are reduced lowest-priority first beyond it)
+LLM_INPUT_TOKEN_BUDGET = 6000
+
+# LLM 応答キャッシュ
+# LLM response cache
+LLM_CACHE_ENABLED = True
+LLM_CACHE_MAXSIZE = 512                          # メモリ上に保持する応答数 # Completions kept in memory
+LLM_CACHE_TTL = 300.0                            # 有効期間（秒） # Lifetime in seconds
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH") or None  # 指定時は SQLite の永続層も使う # Enables the SQLite persistent tier
+
+# OpenAI 呼び出しの流量制御
+# Admission control for OpenAI calls
+LLM_MAX_CONCURRENCY = 8     # 同時に実行する呼び出し数 # Concurrent calls
+LLM_MAX_QUEUE = 32          # 待ち行列の上限（超えたら即座に 503） # Queue limit (503 immediately beyond it)
+LLM_QUEUE_TIMEOUT = 20.0    # 待ち時間の上限（秒） # Max wait in seconds
+
+# OpenAI 呼び出しの期限・再試行・サーキットブレーカー
+# Deadlines, retries and circuit breaker for OpenAI calls
+LLM_REQUEST_TIMEOUT = 30.0        # 1回の呼び出しの上限（秒） # Per-attempt limit in seconds
+LLM_CALL_DEADLINE = 60.0          # 再試行を含む全体の期限（秒） # Overall deadline including retries
+LLM_MAX_RETRIES = 2               # 再試行回数 # Retries after the first attempt
+LLM_RETRY_BASE_DELAY = 0.5        # バックオフの基準（秒） # Backoff base in seconds
+LLM_RETRY_MAX_DELAY = 4.0         # バックオフの上限（秒） # Backoff cap in seconds
+LLM_BREAKER_FAILURES = 5          # 連続失敗でブレーカーを開く回数 # Consecutive failures that open the breaker
+LLM_BREAKER_RESET_TIMEOUT = 30.0  # 開いてから試験呼び出しまでの時間（秒） # Seconds before a trial call
+# プロバイダー障害時に返す応答（ローカルの感情分析は感情データとしてだけ使う）
+# Reply returned on provider failure (the local emotion analysis is only kept as emotion data)
+LLM_DEGRADED_RESPONSE = "ただいま応答を生成できません。しばらくしてから再度お試しください。"
+
+# LLM バックエンドの切り替え（環境変数 LLM_BACKEND）
+# LLM backend selection (LLM_BACKEND env var)
+# "openai": 実際の API / the real API
+# "fake":   ネットワーク不要の擬似応答 / network-free fake completions
+# "record": 実際の API の応答をカセットに記録 / record real completions to the cassette
+# "replay": カセットの記録だけを返す / serve recorded completions only
+LLM_BACKEND = os.getenv("LLM_BACKEND", "openai")
+LLM_FAKE_LATENCY = os.getenv("LLM_FAKE_LATENCY", "lognormal:800:0.4")    # 書式は fake_llm.LatencyModel # See fake_llm.LatencyModel
+LLM_FAKE_CHUNK_DELAY_MS = float(os.getenv("LLM_FAKE_CHUNK_DELAY_MS", "15"))  # ストリームのチャンク間隔 # Delay between stream chunks
+LLM_FAKE_SEED = int(os.getenv("LLM_FAKE_SEED", "0"))
+LLM_CASSETTE_PATH = os.getenv("LLM_CASSETTE_PATH", os.path.join(PROJECT_DIR, "cassettes", "llm_completions.jsonl"))
+
+# 履歴ベース感情分析の ja → en 翻訳
+# ja → en translation for the history-based emotion analysis
+# "online": translate ライブラリ（オンライン） / the translate library (online)
+# "glossary": 同梱の用語集（オフライン・決定的） / the bundled glossary (offline, deterministic)
+TRANSLATION_BACKEND = os.getenv("TRANSLATION_BACKEND", "online")
+TRANSLATION_FALLBACK = os.getenv("TRANSLATION_FALLBACK", "glossary") or None   # 失敗時の代替 # Used when the backend fails
+TRANSLATION_CACHE_MAXSIZE = 4096                                               # メモリ上の件数 # Entries kept in memory
+TRANSLATION_CACHE_PATH = os.getenv("TRANSLATION_CACHE_PATH", os.path.join(PROJECT_DIR, "local_data", "translation_cache.sqlite3")) or None
+TRANSLATION_TIMEOUT = float(os.getenv("TRANSLATION_TIMEOUT", "3"))           # 秒。超えたら代替で訳す # Seconds before the fallback takes over
+
+# 履歴ベース感情分析（LLM 障害時の代替）の方式
+# Engine for the history-based emotion analysis (the fallback when the LLM is unavailable)
+# "nrclex":  ja → en 翻訳 + NRCLex（10感情） / ja → en translation + NRCLex (10 emotions)
+# "lexicon": 同梱の日本語感情辞書（翻訳不要・32感情） / the bundled Japanese emotion lexicon (no translation, 32 emotions)
+EMOTION_ENGINE = os.getenv("EMOTION_ENGINE", "nrclex")
+
+# 履歴ベース感情分析の集計（メッセージごとの分析結果を新しいものほど重く合算する）
+# Aggregation for the history-based analysis (per-message results, newer messages weigh more)
+HISTORY_ANALYSIS_DECAY = 0.6          # 1件古くなるごとの重みの倍率 # Weight multiplier per step back in history
+HISTORY_ANALYSIS_MAX_KEYWORDS = 20    # 集計結果に残すキーワード数 # Keywords kept in the aggregated result
+
 # デバッグ・ログ設定
 # Debug/log settings
 DEBUG_MODE = True
 
+# ログ送信設定（app_log へのバックグラウンド一括書き込み）
+# Log sink settings (background batched writes to app_log)
+LOG_QUEUE_MAXSIZE = 10000     # キュー上限。超えた分は破棄 # Queue capacity; overflow is dropped
+LOG_BATCH_SIZE = 200          # 1回の insert_many 件数 # Entries per insert_many
+LOG_FLUSH_INTERVAL = 1.0      # 秒。件数に満たなくてもこの間隔で書き込む # Seconds between flushes
+LOG_HIGH_WATERMARK = 0.8      # キュー使用率がこれを超えたら DEBUG/INFO を間引く # Sample DEBUG/INFO above this fill ratio
+LOG_SAMPLE_EVERY = 10         # 間引き時に残す割合（N件に1件） # Keep one in N entries while sampling
+LOG_FALLBACK_INTERVAL = 10.0  # 秒。破棄・書き込み失敗したログを標準エラーに出す間隔の単位 # Window for the stderr fallback of lost logs
+LOG_FALLBACK_LINES = 20       # 上の間隔ごとに標準エラーへ出す最大件数 # Lost entries printed to stderr per window
+
 # 感情辞書
 # Emotion dictionary
 emotion_map = {
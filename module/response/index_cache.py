@@ -0,0 +1,241 @@
+# module/response/index_cache.py
+import threading
+from collections import Counter, OrderedDict, defaultdict
+from datetime import timedelta
+
+from bson import ObjectId
+
+import module.mongo.repository as repository
+
+CATEGORIES = ("long", "intermediate", "short")
+
+
+class CategoryEntries(list):
+    """
+    1カテゴリのインデックス文書の一覧と、キーワード → _id の転置インデックス。
+    新しい文書は末尾に追加し、変更された文書は replace で同じ位置のまま差し替える（無くなった文書は取り除く）。
+
+    Index documents of one category plus an inverted index from keyword to _id.
+    New documents are appended; changed ones are swapped in place by replace (vanished ones are dropped).
+    """
+
+    def __init__(self, docs=()):
+        super().__init__()
+        self.postings = defaultdict(list)  # キーワード -> _id # keyword -> _id
+        self._positions = {}               # _id -> 一覧内の位置 # position in the list
+        for doc in docs:
+            self.append(doc)
+
+    def append(self, doc: dict):
+        self._positions[doc["_id"]] = len(self)
+        super().append(doc)
+        self._index(doc)
+
+    def _index(self, doc: dict):
+        for keyword in self._keywords(doc):
+            self.postings[keyword].append(doc["_id"])
+
+    def _unindex(self, doc: dict):
+        for keyword in self._keywords(doc):
+            posting = self.postings[keyword]
+            posting.remove(doc["_id"])
+            if not posting:
+                del self.postings[keyword]
+
+    @staticmethod
+    def _keywords(doc: dict) -> list[str]:
+        return [k for k in dict.fromkeys(doc.get("キーワード") or []) if isinstance(k, str)]
+
+    # ids の文書を fresh（読み直したこのカテゴリの文書、_id -> 文書）で差し替え、fresh に無いものは取り除く。
+    # fresh のうち一覧に無かったものは末尾に追加する
+    # Swap the documents in ids for their fresh copies (re-read documents of this category, _id -> document),
+    # dropping those missing from fresh; fresh documents not in the list yet are appended
+    def replace(self, ids, fresh: dict):
+        removed = set()
+        for doc_id in ids:
+            position = self._positions.get(doc_id)
+            if position is None:
+                continue
+            self._unindex(self[position])
+            if doc_id in fresh:
+                super().__setitem__(position, fresh[doc_id])
+                self._index(fresh[doc_id])
+            else:
+                removed.add(doc_id)
+        if removed:
+            super().__setitem__(slice(None), [doc for doc in self if doc["_id"] not in removed])
+            self._positions = {doc["_id"]: position for position, doc in enumerate(self)}
+        for doc_id, doc in fresh.items():
+            if doc_id not in self._positions:
+                self.append(doc)
+
+    # 入力キーワードの転置リストの和集合を、一致したキーワード数の多い順（同数なら一覧の順）に返す
+    # Union of the input keywords' posting lists, by number of matching keywords (ties in list order)
+    def match_keywords(self, keywords: list[str]) -> list[dict]:
+        overlap = Counter()
+        for keyword in {k for k in keywords if isinstance(k, str)}:
+            overlap.update(self.postings.get(keyword, ()))
+        ranked = sorted(overlap, key=lambda i: (-overlap[i], self._positions[i]))
+        return [self[self._positions[i]] for i in ranked]
+
+
+class _SessionIndex:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = {}         # _id -> インデックス文書 # index document
+        self.high_water = None    # 読み込み済みの最大 _id # Largest _id loaded so far
+        self.version = None       # 読み込み時の版番号 # Version number at load time
+        self.categorized = None   # カテゴリ別の CategoryEntries # CategoryEntries per category
+
+
+class IndexCache:
+    """
+    emotion_index をセッションごとにプロセス内に保持し、カテゴリ別の一覧を返す。
+    - 初回は全件を読み込み、以後は high-water の _id より新しい文書だけを読み込む
+    - 書き込みスプール経由の挿入は遅れて届くため、high-water から overlap_seconds 遡って読み直し、_id で重複を除く。
+      それより遅れて反映した挿入は、反映時にその _id を付けて版番号が上がる（repository.insert_many_idempotent）
+    - 忘却でインデックスが書き換わると版番号が上がる。版番号ごとに記録された変更 _id
+      （repository.get_index_changes）の文書だけを読み直して差し替え、記録が足りないときだけ全件を読み直す
+    保持するセッション数は maxsize まで（LRU）。
+
+    Keeps emotion_index per session in-process and returns per-category lists.
+    - The first call loads everything; later calls load only documents newer than the high-water _id
+    - Inserts through the write spool arrive late, so reads reach back overlap_seconds from the
+      high-water mark and dedupe by _id. Inserts replayed later than that bump the version with their _ids
+      when they land (repository.insert_many_idempotent)
+    - When oblivion rewrites the index the version goes up. Only the documents whose _ids were recorded for each
+      version (repository.get_index_changes) are re-read and swapped in; everything is reloaded only when
+      the record does not reach back far enough
+    Holds up to maxsize sessions (LRU).
+    """
+
+    def __init__(self, maxsize: int = 64, overlap_seconds: float = 60.0):
+        self.maxsize = maxsize
+        self.overlap_seconds = overlap_seconds
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.counts = Counter()
+
+    def _session(self, session_id: str) -> _SessionIndex:
+        with self._lock:
+            state = self._sessions.get(session_id)
+            if state is None:
+                state = self._sessions[session_id] = _SessionIndex()
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.maxsize:
+                self._sessions.popitem(last=False)
+            return state
+
+    def _since(self, high_water: ObjectId) -> ObjectId:
+        return ObjectId.from_datetime(high_water.generation_time - timedelta(seconds=self.overlap_seconds))
+
+    # 新しい文書を一覧と転置インデックスに加える（読み込み済みのものは無視）
+    # Add new documents to the lists and the inverted index (already loaded ones are ignored)
+    def _add(self, state: _SessionIndex, docs: list[dict]) -> int:
+        added = 0
+        for doc in docs:
+            if doc["_id"] in state.entries:
+                continue
+            state.entries[doc["_id"]] = doc
+            if doc.get("category") in state.categorized:
+                state.categorized[doc["category"]].append(doc)
+            if isinstance(doc["_id"], ObjectId) and (state.high_water is None or doc["_id"] > state.high_water):
+                state.high_water = doc["_id"]
+            added += 1
+        return added
+
+    # state.version の後に変更された _id（記録が足りない・_id 不明の変更を含むなら None）
+    # _ids changed after state.version (None when the record falls short or includes a change of unknown _ids)
+    @staticmethod
+    def _changed_ids(state: _SessionIndex, version: int, changes: list) -> list | None:
+        behind = version - state.version
+        if behind <= 0 or behind > len(changes):
+            return None
+        ids = []
+        for change in changes[-behind:]:
+            if change is None:
+                return None
+            ids.extend(change)
+        return list(dict.fromkeys(ids))
+
+    # 変更された文書だけを読み直し、各カテゴリの一覧と転置インデックスをその場で差し替える
+    # Re-read only the changed documents and swap them into each category list and inverted index in place
+    def _reload_changed(self, state: _SessionIndex, session_id: str, ids: list):
+        docs = repository.find_index_entries_by_ids(ids, session_id)
+        for doc_id in ids:
+            state.entries.pop(doc_id, None)
+        for category, entries in state.categorized.items():
+            entries.replace(ids, {doc["_id"]: doc for doc in docs if doc.get("category") == category})
+        for doc in docs:
+            state.entries[doc["_id"]] = doc
+            if isinstance(doc["_id"], ObjectId) and doc["_id"] > state.high_water:
+                state.high_water = doc["_id"]
+        self.counts["changed_entries"] += len(ids)
+
+    def _refresh(self, state: _SessionIndex, session_id: str):
+        version = repository.get_index_version(session_id)
+        if state.version is not None and state.high_water is not None and version != state.version:
+            version, changes = repository.get_index_changes(session_id)
+            changed = self._changed_ids(state, version, changes)
+            if changed is not None:
+                self._reload_changed(state, session_id, changed)
+                state.version = version
+                self.counts["partial_reloads"] += 1
+
+        if state.version is None or version != state.version or state.high_water is None:
+            docs = repository.find_index_entries(session_id)
+            state.entries = {}
+            state.categorized = {category: CategoryEntries() for category in CATEGORIES}
+            state.high_water = None
+            state.version = version
+            self._add(state, docs)
+            self.counts["full_loads"] += 1
+        else:
+            docs = repository.find_index_entries_since(self._since(state.high_water), session_id)
+            self.counts["incremental_loads"] += 1
+            self.counts["new_entries"] += self._add(state, docs)
+
+    # カテゴリ別の一覧（{"long": CategoryEntries, "intermediate": ..., "short": ...}）。呼び出し側は変更しないこと
+    # Per-category lists ({"long": CategoryEntries, "intermediate": ..., "short": ...}); callers must not modify them
+    def categorized(self, session_id: str) -> dict:
+        state = self._session(session_id)
+        with state.lock:
+            self._refresh(state, session_id)
+            return state.categorized
+
+    # このプロセスで保存したインデックス文書をすぐに反映する（未読み込みのセッションは次回の読み込みに任せる）
+    # Reflect an index document saved by this process right away (sessions not loaded yet pick it up on load)
+    def add(self, session_id: str, doc: dict):
+        with self._lock:
+            state = self._sessions.get(session_id)
+        if state is None:
+            return
+        with state.lock:
+            if state.categorized is not None:
+                self._add(state, [doc])
+
+    def invalidate(self, session_id: str | None = None):
+        with self._lock:
+            if session_id is None:
+                self._sessions.clear()
+            else:
+                self._sessions.pop(session_id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            sessions = len(self._sessions)
+            entries = sum(len(state.entries) for state in self._sessions.values())
+        return {"sessions": sessions, "entries": entries, **dict(self.counts)}
+
+
+_index_cache = None
+_index_cache_lock = threading.Lock()
+
+def get_index_cache() -> IndexCache:
+    global _index_cache
+    if _index_cache is None:
+        with _index_cache_lock:
+            if _index_cache is None:
+                from module.params import INDEX_CACHE_MAX_SESSIONS, INDEX_CACHE_OVERLAP_SECONDS
+                _index_cache = IndexCache(maxsize=INDEX_CACHE_MAX_SESSIONS, overlap_seconds=INDEX_CACHE_OVERLAP_SECONDS)
+    return _index_cache
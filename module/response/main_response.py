@@ -2,36 +2,20 @@
 import json
 import os
 import re
+from concurrent.futures import ThreadPoolExecutor
 from bson import ObjectId
 
 import module.response.response_index as response_index
 import module.response.response_long as long_history
 import module.response.response_intermediate as intermediate_history
 import module.response.response_short as short_history
-from module.mongo.mongo_client import get_mongo_client
 from module.llm.llm_client import generate_gpt_response_from_history
 from module.utils.utils import logger
+from module.utils.turn_context import current_session_id
 
-
-client = get_mongo_client()
-if client is None:
-    raise ConnectionError("[ERROR] MongoDBクライアントの取得に失敗しました")
-db = client["emotion_db"]
-
-def get_mongo_collection(category, emotion_label):
-    try:
-        client = get_mongo_client()
-        if client is None:
-            raise ConnectionError("MongoDBクライアントの取得に失敗しました")
-
-        db = client["emotion_db"]
-        collection_name = f"{category}_{emotion_label}"
-        return db[collection_name]
-    except Exception as e:
-        logger.error(f"[ERROR] MongoDBコレクション取得失敗: {e}")
-        return None
-
-import json
+# short / intermediate / long のカテゴリ走査を並行実行するためのスレッドプール
+# Threadpool that scans the short / intermediate / long categories concurrently
+_category_executor = ThreadPoolExecutor(max_workers=3, thread_name_prefix="category-scan")
 
 
 def try_parse_json(text: str | tuple) -> dict | str:
@@ -112,7 +96,7 @@ def find_response_by_emotion() -> dict:
         }
 
     #構成比とキーワードからインデックス応答を取得する統合関数。
-def get_best_match(emotion_structure: dict) -> dict | None:
+def get_best_match(emotion_structure: dict, categorized_index: dict | None = None) -> dict | None:
     logger.info("[START] get_best_match")
 
     # 🔹 emotion_structure から構成比とキーワードを抽出
@@ -121,9 +105,10 @@ def get_best_match(emotion_structure: dict) -> dict | None:
     logger.info(f"[INFO] 構成比: {composition}")
     logger.info(f"[INFO] キーワード: {keywords}")
 
-    # 🔹 MongoDBからインデックスを読み込み、カテゴリ分け
-    categorized_index = response_index.load_and_categorize_index()
-    logger.info("[INFO] カテゴリ別インデックスの読み込み完了")
+    # 🔹 MongoDBからインデックスを読み込み、カテゴリ分け（読み込み済みなら再利用）
+    if categorized_index is None:
+        categorized_index = response_index.load_and_categorize_index()
+        logger.info("[INFO] カテゴリ別インデックスの読み込み完了")
 
     # 🔹 各カテゴリでフィルタリングと構成比マッチング
     for category in ["long", "intermediate", "short"]:
@@ -145,11 +130,20 @@ def get_best_match(emotion_structure: dict) -> dict | None:
     return None
 
     #各カテゴリ（short → intermediate → long）から指定された感情名と日付に一致する履歴を取得して返す。
-def collect_all_category_responses(emotion_name: str, date_str: str) -> dict:
+def collect_all_category_responses(emotion_name: str, date_str: str, session_id: str | None = None) -> dict:
     logger.info(f"[START] collect_all_category_responses - 感情: {emotion_name}, 日付: {date_str}")
 
+    # 3カテゴリの取得は互いに独立しているため並行して実行する。
+    # ワーカースレッドにはターンの文脈が引き継がれないので、セッションは明示的に渡す
+    # The three category reads are independent, so run them concurrently.
+    # Worker threads do not inherit the turn context, so the session is passed explicitly
+    session_id = session_id or current_session_id()
+    short_future = _category_executor.submit(short_history.get_all_short_category_data, session_id)
+    intermediate_future = _category_executor.submit(intermediate_history.get_all_intermediate_category_data, session_id)
+    long_future = _category_executor.submit(long_history.get_all_long_category_data, session_id)
+
     # short
-    all_short_data = short_history.get_all_short_category_data()
+    all_short_data = short_future.result()
     logger.debug(f"[INFO] shortカテゴリのデータ件数: {len(all_short_data)}")
     short_match = short_history.search_short_history(
         all_data=all_short_data,
@@ -163,7 +157,7 @@ def collect_all_category_responses(emotion_name: str, date_str: str) -> dict:
         logger.debug(f"[NO MATCH] shortカテゴリで一致データなし")
 
     # intermediate
-    all_intermediate_data = intermediate_history.get_all_intermediate_category_data()
+    all_intermediate_data = intermediate_future.result()
     logger.debug(f"[INFO] intermediateカテゴリのデータ件数: {len(all_intermediate_data)}")
     intermediate_match = intermediate_history.search_intermediate_history(
         all_data=all_intermediate_data,
@@ -177,7 +171,7 @@ def collect_all_category_responses(emotion_name: str, date_str: str) -> dict:
         logger.debug(f"[NO MATCH] intermediateカテゴリで一致データなし")
 
     # long
-    all_long_data = long_history.get_all_long_category_data()
+    all_long_data = long_future.result()
     logger.debug(f"[INFO] longカテゴリのデータ件数: {len(all_long_data)}")
     long_match = long_history.search_long_history(
         all_data=all_long_data,
@@ -5,9 +5,11 @@ import re
 from bson import ObjectId
 
 from module.utils.utils import logger
-from module.mongo.mongo_client import get_mongo_client
+from module.mongo.repository import find_index_entries
 from module.llm.llm_client import generate_gpt_response_from_history
-from module.params import emotion_map
+from module.params import emotion_map, INDEX_CACHE_ENABLED
+from module.response.index_cache import get_index_cache, CategoryEntries
+from module.utils.turn_context import turn_cached, current_session_id
 
 # 構成比とキーワードを受け取る検索インターフェース
 # Search interface that receives composition and keywords
@@ -29,16 +31,10 @@ def normalize_composition_vector(partial_composition: dict) -> dict:
 
 # MongoDBからemotion_indexを取得
 # Load emotion_index from MongoDB
-def load_index():
+def load_index(session_id: str | None = None):
     logger.debug("📥 [STEP] MongoDBからemotion_indexを取得します...")
     try:
-        client = get_mongo_client()
-        if client is None:
-            raise ConnectionError("MongoDBクライアントの取得に失敗しました")
-        # Failed to obtain MongoDB client
-        db = client["emotion_db"]
-        collection = db["emotion_index"]
-        data = list(collection.find({}))
+        data = find_index_entries(session_id or current_session_id())
         logger.info(f"✅ [SUCCESS] emotion_index データ件数: {len(data)}")
         # Number of emotion_index records
         return data
@@ -47,11 +43,24 @@ def load_index():
         # Failed to retrieve from MongoDB
         return []
 
-# 取得したemotion_indexをカテゴリごとに分類
-# Categorize loaded emotion_index data by category
-def load_and_categorize_index():
+# 取得したemotion_indexをカテゴリごとに分類（1ターン内では1回だけ読み込む）
+# Categorize loaded emotion_index data by category (loaded at most once per turn)
+def load_and_categorize_index(session_id: str | None = None):
+    session_id = session_id or current_session_id()
+    return turn_cached(("categorized_index", session_id), _load_and_categorize_index, session_id)
+
+def _load_and_categorize_index(session_id: str):
+    if INDEX_CACHE_ENABLED:
+        # プロセス内キャッシュから取得し、前回以降の追加分だけを読み込む
+        # Served from the in-process cache, loading only what was added since the last call
+        try:
+            return get_index_cache().categorized(session_id)
+        except Exception as e:
+            logger.warning(f"❌ [ERROR] インデックスキャッシュの更新に失敗: {e}")  # Index cache refresh failed
+            return {"long": [], "intermediate": [], "short": []}
+
     logger.info("📂 [STEP] インデックスをカテゴリごとに分類します...")
-    all_index = load_index()
+    all_index = load_index(session_id)
     categorized = {"long": [], "intermediate": [], "short": []}
 
     for item in all_index:
@@ -67,9 +76,16 @@ def load_and_categorize_index():
 
 # キーワードフィルタリング処理
 # Perform keyword filtering on categorized emotion_index
+# キャッシュの一覧（CategoryEntries）は転置インデックスで候補を引き、一致したキーワード数の多い順に返す
+# Cached lists (CategoryEntries) look candidates up in the inverted index, ranked by matching keyword count
 def filter_by_keywords(index_data, input_keywords):
     logger.info(f"🔍 キーワードフィルタ適用: {input_keywords}")
-    filtered = [item for item in index_data if set(item.get("キーワード", [])) & set(input_keywords)]
+    if isinstance(index_data, CategoryEntries):
+        filtered = index_data.match_keywords(input_keywords)
+    else:
+        keywords = set(k for k in input_keywords if isinstance(k, str))
+        overlaps = [(len(set(item.get("キーワード", [])) & keywords), item) for item in index_data]
+        filtered = [item for count, item in sorted(overlaps, key=lambda o: -o[0]) if count]
     logger.info(f"🎯 一致件数: {len(filtered)}")
     return filtered
 
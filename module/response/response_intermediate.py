@@ -2,23 +2,16 @@
 import json
 from bson import ObjectId
 
-from module.mongo.mongo_client import get_mongo_client
+from module.mongo.repository import find_emotion_data_by_category
 from module.response.response_index import find_best_match_by_composition
 from module.utils.utils import logger
+from module.utils.turn_context import current_session_id
 
-# MongoDBのemotion_dataから、categoryが"intermediate"の全データを取得する。
-# Retrieve all data from MongoDB emotion_data where category is "intermediate".
-def get_all_intermediate_category_data():
+# MongoDBのemotion_dataから、categoryが"intermediate"の全データを取得する（検索に使う emotion / category / data.履歴 のみ）。
+# Retrieve all data from MongoDB emotion_data where category is "intermediate" (only emotion / category / data.履歴 used by the search).
+def get_all_intermediate_category_data(session_id: str | None = None):
     try:
-        client = get_mongo_client()
-        if client is None:
-            raise ConnectionError("MongoDBクライアントの取得に失敗しました")
-        # Failed to obtain MongoDB client
-
-        db = client["emotion_db"]
-        collection = db["emotion_data"]
-
-        data = list(collection.find({"category": "intermediate"}))
+        data = find_emotion_data_by_category("intermediate", session_id or current_session_id())
         logger.info(f"✅ intermediateカテゴリのデータ件数: {len(data)}")
         # Number of records in intermediate category
         return data
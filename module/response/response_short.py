@@ -2,23 +2,16 @@
 import json
 from bson import ObjectId
 
-from module.mongo.mongo_client import get_mongo_client
+from module.mongo.repository import find_emotion_data_by_category
 from module.response.response_index import find_best_match_by_composition
 from module.utils.utils import logger
+from module.utils.turn_context import current_session_id
 
-# MongoDBのemotion_dataから、categoryが"short"の全データを取得する。
-# Retrieve all data from MongoDB emotion_data where category is "short".
-def get_all_short_category_data():
+# MongoDBのemotion_dataから、categoryが"short"の全データを取得する（検索に使う emotion / category / data.履歴 のみ）。
+# Retrieve all data from MongoDB emotion_data where category is "short" (only emotion / category / data.履歴 used by the search).
+def get_all_short_category_data(session_id: str | None = None):
     try:
-        client = get_mongo_client()
-        if client is None:
-            raise ConnectionError("MongoDBクライアントの取得に失敗しました")
-        # Failed to obtain MongoDB client
-
-        db = client["emotion_db"]
-        collection = db["emotion_data"]
-
-        short_data = list(collection.find({"category": "short"}))
+        short_data = find_emotion_data_by_category("short", session_id or current_session_id())
         logger.info(f"✅ shortカテゴリのデータ件数: {len(short_data)}")
         # Number of records in short category
         return short_data
@@ -0,0 +1,199 @@
+# module/utils/log_sink.py
+import atexit
+import queue
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+
+# MongoDB の app_log へ一括書き込みする（バックグラウンドスレッドから呼ばれる）
+# Write a batch into MongoDB app_log (called from the background thread)
+def write_logs_to_mongo(entries: list[dict]):
+    from module.mongo.repository import insert_app_logs  # 遅延importで循環参照を回避
+    insert_app_logs(entries)
+
+
+class LogSink:
+    """
+    ログを有界キューに積み、バックグラウンドスレッドが insert_many でまとめて書き込む。
+    - batch_size 件たまるか flush_interval 秒経過でフラッシュ
+    - キューが high_watermark を超えたら DEBUG/INFO を sample_every 件に1件だけ残す
+    - キューが満杯なら破棄し、レベル別にカウントする
+    - 破棄したログ（WARNING 以上）と書き込みに失敗したバッチは標準エラーに出す。
+      fallback_interval 秒ごとに fallback_lines 件までとし、超えた分は件数だけを次に出す
+    """
+
+    SAMPLED_LEVELS = ("DEBUG", "INFO")
+
+    def __init__(
+        self,
+        writer=write_logs_to_mongo,
+        maxsize: int = 10000,
+        batch_size: int = 200,
+        flush_interval: float = 1.0,
+        high_watermark: float = 0.8,
+        sample_every: int = 10,
+        fallback_interval: float = 10.0,
+        fallback_lines: int = 20
+    ):
+        self.writer = writer
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.high_watermark = high_watermark
+        self.sample_every = max(sample_every, 1)
+        self.fallback_interval = fallback_interval
+        self.fallback_lines = fallback_lines
+
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._sample_counter = 0
+        self._fallback_window = None  # 標準エラーへの出力の現在の区間の開始 # Start of the current stderr window
+        self._fallback_used = 0
+        self._fallback_suppressed = 0
+
+        self.dropped = Counter()
+        self.sampled_out = Counter()
+        self.written = 0
+        self.write_failures = 0
+
+    # ログ1件をキューに積む（呼び出し元スレッドはブロックしない）
+    # Enqueue a single log entry without blocking the caller
+    def submit(self, level: str, message: str) -> bool:
+        self._ensure_started()
+
+        if level in self.SAMPLED_LEVELS and self._queue.qsize() >= self.maxsize * self.high_watermark:
+            with self._lock:
+                self._sample_counter += 1
+                keep = self._sample_counter % self.sample_every == 0
+            if not keep:
+                self.sampled_out[level] += 1
+                return False
+
+        entry = {
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "level": level,
+            "message": message
+        }
+        try:
+            self._queue.put_nowait(entry)
+            return True
+        except queue.Full:
+            self.dropped[level] += 1
+            if level not in self.SAMPLED_LEVELS:
+                self._fallback([entry], "ログキューが満杯のため破棄")  # Dropped because the log queue is full
+            return False
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="log-sink", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._collect_batch()
+            if batch:
+                self._write(batch)
+        # 停止時に残りを書き出す
+        # Drain whatever is left on shutdown
+        self._drain()
+
+    # batch_size 件たまるか flush_interval 秒経過するまで集める
+    # Collect until batch_size entries or flush_interval seconds have passed
+    def _collect_batch(self) -> list[dict]:
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self._stop.is_set():
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _drain(self):
+        while True:
+            batch = []
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not batch:
+                return
+            self._write(batch)
+
+    def _write(self, batch: list[dict]):
+        try:
+            self.writer(batch)
+            self.written += len(batch)
+        except Exception as e:
+            # ログ書き込みの失敗はログに残せないので標準エラーに出す
+            # A failed log write cannot be logged, so it goes to stderr
+            self.write_failures += 1
+            self.dropped["WRITE_FAILED"] += len(batch)
+            self._fallback(batch, f"MongoDBログ記録失敗: {e}")  # Failed to write logs to MongoDB
+
+    # 失ったログを標準エラーに出す。fallback_interval 秒ごとに fallback_lines 件までで、
+    # 出さなかった件数は次の区間の最初に出す
+    # Print lost entries to stderr, at most fallback_lines per fallback_interval seconds;
+    # the number left out is reported at the start of the next window
+    def _fallback(self, entries: list[dict], reason: str):
+        now = time.monotonic()
+        with self._lock:
+            suppressed = 0
+            if self._fallback_window is None or now - self._fallback_window >= self.fallback_interval:
+                suppressed, self._fallback_suppressed = self._fallback_suppressed, 0
+                self._fallback_window = now
+                self._fallback_used = 0
+            shown = entries[:max(self.fallback_lines - self._fallback_used, 0)]
+            self._fallback_used += len(shown)
+            self._fallback_suppressed += len(entries) - len(shown)
+
+        lines = []
+        if suppressed:
+            lines.append(f"[log-sink] 出力を省略したログ: {suppressed} 件")  # Lost entries left out of stderr
+        if shown:
+            lines.append(f"[log-sink] {reason}")
+            lines.extend(f"{e['timestamp']} [{e['level']}] {e['message']}" for e in shown)
+        if lines:
+            try:
+                sys.stderr.write("\n".join(lines) + "\n")
+                sys.stderr.flush()
+            except Exception:
+                pass  # 標準エラーにも書けなければ諦める # Give up if stderr is unavailable too
+
+    # キュー内のログを全て書き出して停止する
+    # Write out everything queued and stop the flusher
+    def shutdown(self, timeout: float = 5.0):
+        self._stop.set()
+        thread = self._thread
+        if thread is not None and thread.is_alive():
+            thread.join(timeout)
+        else:
+            self._drain()
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "write_failures": self.write_failures,
+            "dropped": dict(self.dropped),
+            "sampled_out": dict(self.sampled_out)
+        }
+
+
+def create_log_sink(**kwargs) -> LogSink:
+    sink = LogSink(**kwargs)
+    atexit.register(sink.shutdown)
+    return sink
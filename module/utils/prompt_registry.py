@@ -0,0 +1,93 @@
+# module/utils/prompt_registry.py
+import hashlib
+import os
+import threading
+import time
+
+SYSTEM_PROMPT = "system_prompt"
+DIALOGUE_PROMPT = "dialogue_prompt"
+EMOTION_PROMPT = "emotion_prompt"
+
+
+class PromptRegistry:
+    """
+    prompt/ 配下の *.txt を一度だけ読み込んでメモリに保持する。
+    - 応答生成で使う system + dialogue の固定部分は事前に連結しておく
+    - check_interval 秒ごとに mtime（stat のみ）を確認し、変更・追加・削除があれば読み直す
+    - version は全プロンプト内容のハッシュで、読み直すたびに更新される
+
+    Loads every *.txt under prompt/ once and keeps it in memory.
+    - The static system + dialogue prefix used for generation is assembled ahead of time
+    - Every check_interval seconds the mtimes are checked (stat only) and edits, additions
+      or removals trigger a reload
+    - version is a hash of all prompt contents, refreshed on every reload
+    """
+
+    def __init__(self, prompt_dir: str, check_interval: float = 2.0):
+        self.prompt_dir = prompt_dir
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._prompts = {}
+        self._mtimes = {}
+        self._dialogue_prefix = ""
+        self.version = ""
+        self.reloads = 0
+        self._next_check = 0.0
+        self._load()
+
+    def _scan_mtimes(self) -> dict:
+        mtimes = {}
+        for name in os.listdir(self.prompt_dir):
+            if name.endswith(".txt"):
+                mtimes[name[:-4]] = os.stat(os.path.join(self.prompt_dir, name)).st_mtime_ns
+        return mtimes
+
+    def _load(self):
+        mtimes = self._scan_mtimes()
+        prompts = {}
+        for name in mtimes:
+            with open(os.path.join(self.prompt_dir, f"{name}.txt"), "r", encoding="utf-8") as f:
+                prompts[name] = f.read().strip()
+
+        digest = hashlib.sha256()
+        for name in sorted(prompts):
+            digest.update(name.encode("utf-8") + b"\0" + prompts[name].encode("utf-8") + b"\0")
+
+        self._prompts = prompts
+        self._mtimes = mtimes
+        self._dialogue_prefix = prompts.get(SYSTEM_PROMPT, "") + "\n\n" + prompts.get(DIALOGUE_PROMPT, "")
+        self.version = digest.hexdigest()[:12]
+        self.reloads += 1
+
+    # 前回の確認から check_interval 秒以上たっていれば mtime を確認する
+    # Check mtimes when at least check_interval seconds have passed since the last check
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        with self._lock:
+            if now < self._next_check:
+                return
+            self._next_check = now + self.check_interval
+            from module.utils.utils import logger  # 遅延importで循環参照を回避
+            try:
+                if self._scan_mtimes() != self._mtimes:
+                    self._load()
+                    logger.info(f"🔁 プロンプトを再読み込みしました (version={self.version})")  # Prompts reloaded
+            except OSError as e:
+                # 編集途中などで読めない場合は、次の確認まで現在の内容を使い続ける
+                # If files are unreadable (e.g. mid-edit), keep the current contents until the next check
+                logger.warning(f"[WARN] プロンプトの再読み込みに失敗: {e}")  # Failed to reload prompts
+
+    def get(self, name: str) -> str:
+        self._maybe_reload()
+        return self._prompts[name]
+
+    # system_prompt + dialogue_prompt（事前連結済み）
+    # system_prompt + dialogue_prompt (pre-assembled)
+    def dialogue_prefix(self) -> str:
+        self._maybe_reload()
+        return self._dialogue_prefix
+
+    def stats(self) -> dict:
+        return {"version": self.version, "prompts": sorted(self._prompts), "reloads": self.reloads}
@@ -0,0 +1,82 @@
+# module/utils/session_cache.py
+import threading
+import time
+from collections import Counter, OrderedDict
+
+
+class SessionCache:
+    """
+    ターンをまたいで使うセッション別キャッシュ（LRU + TTL）。
+    保持するセッション数は maxsize まで、各値は ttl 秒で期限切れになる。
+    プロセス内のキャッシュなので、複数ワーカーではセッションを同じワーカーに振り分ける前提とし、
+    それ以外のワーカーで書き込まれた場合の古さは ttl で抑える。
+
+    Per-session cache shared across turns (LRU + TTL). Holds up to maxsize sessions and each
+    value expires after ttl seconds. It lives in-process, so multi-worker deployments are
+    expected to route a session to one worker; ttl bounds staleness from writes elsewhere.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 30.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._sessions = OrderedDict()  # session_id -> {key: (expires_at, value)}
+        self._lock = threading.Lock()
+        self.hits = Counter()
+        self.misses = Counter()
+
+    def _get(self, session_id: str, key):
+        with self._lock:
+            entries = self._sessions.get(session_id)
+            if entries is None or key not in entries:
+                return False, None
+            expires_at, value = entries[key]
+            if expires_at < time.monotonic():
+                del entries[key]
+                return False, None
+            self._sessions.move_to_end(session_id)
+            return True, value
+
+    def set(self, session_id: str, key, value):
+        with self._lock:
+            entries = self._sessions.setdefault(session_id, {})
+            entries[key] = (time.monotonic() + self.ttl, value)
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.maxsize:
+                self._sessions.popitem(last=False)
+
+    # キャッシュに無ければ loader() を呼んで保存する（例外時は保存しない）
+    # Call loader() and store the result on a miss (nothing is stored on exceptions)
+    def get_or_load(self, session_id: str, key, loader):
+        found, value = self._get(session_id, key)
+        if found:
+            self.hits[key] += 1
+            return value
+        self.misses[key] += 1
+        value = loader()
+        self.set(session_id, key, value)
+        return value
+
+    def invalidate(self, session_id: str, key=None):
+        with self._lock:
+            if key is None:
+                self._sessions.pop(session_id, None)
+            elif session_id in self._sessions:
+                self._sessions[session_id].pop(key, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            sessions = len(self._sessions)
+        return {"sessions": sessions, "hits": dict(self.hits), "misses": dict(self.misses)}
+
+
+_session_cache = None
+_session_cache_lock = threading.Lock()
+
+def get_session_cache() -> SessionCache:
+    global _session_cache
+    if _session_cache is None:
+        with _session_cache_lock:
+            if _session_cache is None:
+                from module.params import SESSION_CACHE_SIZE, SESSION_CACHE_TTL
+                _session_cache = SessionCache(maxsize=SESSION_CACHE_SIZE, ttl=SESSION_CACHE_TTL)
+    return _session_cache
@@ -0,0 +1,126 @@
+# module/utils/stage_graph.py
+import asyncio
+import inspect
+import time
+from contextlib import contextmanager
+
+from fastapi.concurrency import run_in_threadpool
+
+from module.utils.utils import logger
+
+# ステージ所要時間の購読者（ベンチマークなどの計測用）。fn(graph_name, stage, duration_ms) の形で呼ばれる
+# Subscribers to stage timings (for benchmarks and other measurement); called as fn(graph_name, stage, duration_ms)
+_timing_observers = []
+
+def add_timing_observer(fn):
+    _timing_observers.append(fn)
+
+def remove_timing_observer(fn):
+    if fn in _timing_observers:
+        _timing_observers.remove(fn)
+
+def record_stage_timing(graph_name: str, stage: str, duration_ms: float):
+    for fn in list(_timing_observers):
+        fn(graph_name, stage, duration_ms)
+
+# グラフの外で行う処理（LLM 呼び出し・保存・忘却など）も同じ形で計測する
+# Time work done outside a graph (LLM call, persistence, oblivion, ...) the same way
+@contextmanager
+def timed_stage(stage: str, graph_name: str = "chat"):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage_timing(graph_name, stage, round((time.perf_counter() - start) * 1000, 2))
+
+
+class StageGraph:
+    """
+    依存関係つきの処理段（ステージ）を並行実行する。
+    各ステージは fn(results) の形で呼ばれ、results には完了済みの依存ステージの結果が入る。
+    同期関数はスレッドプール、async 関数はそのまま await する。
+    実行後は各ステージの所要時間とクリティカルパスをログに出す。
+
+    Runs stages concurrently according to their dependencies. Each stage is called as
+    fn(results), where results holds the outputs of its finished dependencies. Sync functions
+    run in the threadpool, async ones are awaited. Stage timings and the critical path are logged.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._stages = {}
+        self.timings = {}
+
+    def add(self, name: str, fn, deps: list[str] | tuple = ()):
+        if name in self._stages:
+            raise ValueError(f"ステージ名が重複しています: {name}")  # Duplicate stage name
+        for dep in deps:
+            if dep not in self._stages:
+                raise ValueError(f"未定義の依存ステージです: {name} → {dep}")  # Unknown dependency
+        self._stages[name] = (fn, tuple(deps))
+        return self
+
+    async def run(self) -> dict:
+        results = {}
+        tasks = {}
+        origin = time.perf_counter()
+
+        async def run_stage(name: str):
+            fn, deps = self._stages[name]
+            if deps:
+                await asyncio.gather(*(tasks[d] for d in deps))
+            start = time.perf_counter()
+            inputs = {d: results[d] for d in deps}
+            if inspect.iscoroutinefunction(fn):
+                value = await fn(inputs)
+            else:
+                value = await run_in_threadpool(fn, inputs)
+            end = time.perf_counter()
+            results[name] = value
+            self.timings[name] = {
+                "start_ms": round((start - origin) * 1000, 2),
+                "end_ms": round((end - origin) * 1000, 2),
+                "duration_ms": round((end - start) * 1000, 2)
+            }
+            record_stage_timing(self.name, name, self.timings[name]["duration_ms"])
+            return value
+
+        # 登録順 = 依存解決済みの順なので、そのままタスク化できる
+        # Registration order already respects dependencies, so tasks can be created in order
+        for name in self._stages:
+            tasks[name] = asyncio.ensure_future(run_stage(name))
+        try:
+            await asyncio.gather(*tasks.values())
+        except Exception:
+            for task in tasks.values():
+                task.cancel()
+            raise
+
+        self._log_summary(time.perf_counter() - origin)
+        return results
+
+    # 最後に終わったステージから、最も遅く終わった依存をたどったものをクリティカルパスとする
+    # The critical path follows, from the last stage to finish, the dependency that finished latest
+    def critical_path(self) -> list[str]:
+        if not self.timings:
+            return []
+        current = max(self.timings, key=lambda n: self.timings[n]["end_ms"])
+        path = [current]
+        while True:
+            deps = self._stages[current][1]
+            if not deps:
+                break
+            current = max(deps, key=lambda n: self.timings[n]["end_ms"])
+            path.append(current)
+        return list(reversed(path))
+
+    def _log_summary(self, elapsed: float):
+        path = self.critical_path()
+        path_ms = sum(self.timings[n]["duration_ms"] for n in path)
+        total_ms = sum(t["duration_ms"] for t in self.timings.values())
+        logger.info(
+            f"⏱️ [{self.name}] 経過 {elapsed * 1000:.1f}ms / 全ステージ合計 {total_ms:.1f}ms / "
+            f"クリティカルパス {' → '.join(path)} ({path_ms:.1f}ms)"
+        )  # Elapsed / sum of all stages / critical path
+        for name, t in self.timings.items():
+            logger.debug(f"⏱️ [{self.name}] {name}: {t['duration_ms']}ms (start={t['start_ms']}ms)")
@@ -0,0 +1,128 @@
+# module/utils/turn_context.py
+import contextvars
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from uuid import uuid4
+
+from module.params import DEFAULT_SESSION_ID
+
+_current_turn = contextvars.ContextVar("current_turn", default=None)
+
+
+class TurnContext:
+    """
+    1回の /chat ターンの間だけ有効なキャッシュ。
+    同じ読み込み・計算はターン内で1回だけ実行し、2回目以降は結果を再利用する。
+    同じキーを並行ステージが同時に要求した場合は、先に始めた方の結果を待つ。
+
+    Cache that lives for a single /chat turn. Each read or computation runs at most once per
+    turn; later calls reuse the result. Concurrent stages asking for the same key wait for
+    the first one instead of repeating the work.
+    """
+
+    def __init__(self, session_id: str | None = None):
+        self.turn_id = uuid4().hex
+        self.session_id = session_id or DEFAULT_SESSION_ID
+        self._values = {}
+        self._key_locks = {}
+        self._lock = threading.Lock()
+        self._buffers = {}
+        self._finalizers = []
+        self.hits = Counter()
+        self.misses = Counter()
+
+    def _key_lock(self, key) -> threading.Lock:
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def memoize(self, key, fn, *args, **kwargs):
+        if key in self._values:
+            self.hits[key] += 1
+            return self._values[key]
+        with self._key_lock(key):
+            if key in self._values:
+                self.hits[key] += 1
+                return self._values[key]
+            value = fn(*args, **kwargs)  # 例外時はキャッシュしない # Exceptions are not cached
+            self._values[key] = value
+            self.misses[key] += 1
+            return value
+
+    # 書き込み直後の値をキャッシュに反映する（write-through）
+    # Reflect a value just written into the cache (write-through)
+    def set(self, key, value):
+        with self._key_lock(key):
+            self._values[key] = value
+
+    def invalidate(self, key):
+        with self._key_lock(key):
+            self._values.pop(key, None)
+
+    # ターン終了時にまとめて書き込む値をためる。key への最初の追加なら True を返す
+    # Buffer values to be written together at the end of the turn; True on the first value for key
+    def append(self, key, value) -> bool:
+        with self._lock:
+            buffer = self._buffers.setdefault(key, [])
+            buffer.append(value)
+            return len(buffer) == 1
+
+    def buffered(self, key) -> list:
+        with self._lock:
+            return list(self._buffers.get(key, []))
+
+    def drain(self, key) -> list:
+        with self._lock:
+            return self._buffers.pop(key, [])
+
+    # turn_scope を抜けるときに呼ぶ関数を登録する（例外は各関数で処理すること）
+    # Register a function called when turn_scope exits (each function handles its own errors)
+    def add_finalizer(self, fn):
+        with self._lock:
+            self._finalizers.append(fn)
+
+    def close(self):
+        with self._lock:
+            finalizers, self._finalizers = self._finalizers, []
+        for fn in finalizers:
+            fn()
+
+    def stats(self) -> dict:
+        return {"hits": dict(self.hits), "misses": dict(self.misses)}
+
+
+def current_turn() -> TurnContext | None:
+    return _current_turn.get()
+
+# ターン内ならそのセッション、ターン外では既定のセッション
+# The turn's session inside a turn, the default session outside one
+def current_session_id() -> str:
+    ctx = _current_turn.get()
+    return ctx.session_id if ctx is not None else DEFAULT_SESSION_ID
+
+# with turn_scope(session_id) as ctx: の中がそのセッションのひとつのターンになる
+# Everything inside `with turn_scope(session_id) as ctx:` belongs to one turn of that session
+@contextmanager
+def turn_scope(session_id: str | None = None):
+    ctx = TurnContext(session_id)
+    token = _current_turn.set(ctx)
+    try:
+        yield ctx
+    finally:
+        try:
+            ctx.close()
+        finally:
+            _current_turn.reset(token)
+
+# ターン内ならキャッシュを使い、ターン外（背景タスク等）では毎回実行する
+# Use the turn cache inside a turn; outside one (background tasks etc.) just call fn
+def turn_cached(key, fn, *args, **kwargs):
+    ctx = current_turn()
+    if ctx is None:
+        return fn(*args, **kwargs)
+    return ctx.memoize(key, fn, *args, **kwargs)
+
+def turn_cache_set(key, value):
+    ctx = current_turn()
+    if ctx is not None:
+        ctx.set(key, value)
@@ -2,11 +2,9 @@
 import os
 from datetime import datetime
 from dotenv import load_dotenv
-import certifi
-import json
 import openai
-from pymongo import DESCENDING
 import traceback
+from uuid import uuid4
 
 load_dotenv()
 print("📌 [STEP] utils.py 読み込み開始")
@@ -21,30 +19,33 @@ LEVEL_ORDER = {
     "ERROR": 40
 }
 
-import traceback  # ← 必須
-
-# ✅ log_to_mongo を最初に定義
+from module.params import (
+    LOG_QUEUE_MAXSIZE, LOG_BATCH_SIZE, LOG_FLUSH_INTERVAL, LOG_HIGH_WATERMARK, LOG_SAMPLE_EVERY,
+    LOG_FALLBACK_INTERVAL, LOG_FALLBACK_LINES, PROMPT_RELOAD_INTERVAL
+)
+from module.utils.log_sink import create_log_sink
+from module.utils.prompt_registry import PromptRegistry, SYSTEM_PROMPT, DIALOGUE_PROMPT, EMOTION_PROMPT
+
+# ✅ ログはキューに積み、バックグラウンドで app_log に insert_many する
+# Logs are queued and written to app_log with insert_many in the background
+log_sink = create_log_sink(
+    maxsize=LOG_QUEUE_MAXSIZE,
+    batch_size=LOG_BATCH_SIZE,
+    flush_interval=LOG_FLUSH_INTERVAL,
+    high_watermark=LOG_HIGH_WATERMARK,
+    sample_every=LOG_SAMPLE_EVERY,
+    fallback_interval=LOG_FALLBACK_INTERVAL,
+    fallback_lines=LOG_FALLBACK_LINES
+)
+
+# ✅ log_to_mongo を最初に定義（出力はシンクに任せ、呼び出し側では標準出力に書かない）
+# Output is left to the sink; nothing is printed on the caller's path
 def log_to_mongo(level: str, message: str):
-    print(f"[CALL] log_to_mongo: {level} - {message}")
-    try:
-        from module.mongo.mongo_client import get_mongo_client  # ← 遅延importで安全
-        client = get_mongo_client()
-        if client:
-            db = client["emotion_db"]
-            collection = db["app_log"]
-            log_entry = {
-                "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                "level": level,
-                "message": message
-            }
-            collection.insert_one(log_entry)
-    except Exception as e:
-        print(f"[ERROR] MongoDBログ記録失敗: {e}")
+    log_sink.submit(level, message)
 
 # ✅ logger定義（errorだけtraceback対応）
 class MongoLogger:
     def log(self, level: str, message: str):
-        print(f"[LOG WRAPPER] 呼び出しレベル: {level} / 閾値: {LOG_LEVEL_THRESHOLD}")
         if LEVEL_ORDER[level] >= LEVEL_ORDER[LOG_LEVEL_THRESHOLD]:
             log_to_mongo(level, message)
 
@@ -61,45 +62,34 @@ class MongoLogger:
         self.log("ERROR", full_message)
 
 logger = MongoLogger()
-print(f"📌 [CHECK] logger の型: {type(logger)}")
 
 # 🔽 logger初期化後にMongo依存インポート
-from module.mongo.mongo_client import get_mongo_client
+import module.mongo.repository as repository
+from module.utils.turn_context import current_turn, current_session_id
+from module.nlp.message_analysis import analyze_for_history, analysis_for
 
+TURN_HISTORY_KEY = "dialogue_history"
 
-# MongoDBにログを保存
-def log_to_mongo(level: str, message: str):
-    print(f"[CALL] log_to_mongo: {level} - {message}")
-    try:
-        client = get_mongo_client()
-        if client:
-            db = client["emotion_db"]
-            collection = db["app_log"]
-            log_entry = {
-                "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                "level": level,
-                "message": message
-            }
-            collection.insert_one(log_entry)
-    except Exception as e:
-        print(f"[ERROR] MongoDBログ記録失敗: {e}")
 
 # 履歴を取得
-def load_history(limit: int = 100) -> list[dict]:
-    client = get_mongo_client()
-    if client is None:
-        raise ConnectionError("MongoDBクライアントの取得に失敗しました")
-
-    db = client["emotion_db"]
-    collection = db["dialogue_history"]
-    cursor = collection.find().sort("timestamp", DESCENDING).limit(limit)
+def load_history(limit: int = 100, before_seq: int | None = None, session_id: str | None = None) -> list[dict]:
+    session_id = session_id or current_session_id()
+    docs = repository.find_recent_dialogue(limit, before_seq=before_seq, session_id=session_id)
+    # ターン内でまだ書き込んでいないメッセージも含める
+    # Include this turn's messages that are not written yet
+    turn = current_turn()
+    if turn is not None and turn.session_id == session_id:
+        buffered = [e for e in turn.buffered(TURN_HISTORY_KEY) if before_seq is None or e["seq"] < before_seq]
+        docs = sorted(docs + buffered, key=lambda d: d.get("seq") or 0, reverse=True)[:limit]
 
     history = []
-    for doc in cursor:
+    for doc in docs:
         history.append({
             "timestamp": doc.get("timestamp"),
+            "seq": doc.get("seq"),
             "role": doc.get("role"),
-            "message": doc.get("message")
+            "message": doc.get("message"),
+            "analysis": doc.get("analysis")
         })
     return history
 
@@ -107,43 +97,106 @@ def load_history(limit: int = 100) -> list[dict]:
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 PROMPT_DIR = os.path.join(BASE_DIR, "..", "..", "prompt")
 
-# プロンプト読み込み関数
+# プロンプト読み込み関数（prompt_registry がメモリに保持し、ファイルの更新は mtime で検知して反映する）
+# Prompt loaders (held in memory by prompt_registry; file edits are picked up via mtime)
+prompt_registry = PromptRegistry(PROMPT_DIR, check_interval=PROMPT_RELOAD_INTERVAL)
+
 def load_emotion_prompt():
-    prompt_path = os.path.join(PROMPT_DIR, "emotion_prompt.txt")
-    with open(prompt_path, "r", encoding="utf-8") as f:
-        return f.read().strip()
+    return prompt_registry.get(EMOTION_PROMPT)
 
 def load_dialogue_prompt():
-    prompt_path = os.path.join(PROMPT_DIR, "dialogue_prompt.txt")
-    with open(prompt_path, "r", encoding="utf-8") as f:
-        return f.read().strip()
-
-_cached_system_prompt = None
+    return prompt_registry.get(DIALOGUE_PROMPT)
 
 def load_system_prompt_cached():
-    global _cached_system_prompt
-    if _cached_system_prompt is None:
-        prompt_path = os.path.join(PROMPT_DIR, "system_prompt.txt")
-        with open(prompt_path, "r", encoding="utf-8") as f:
-            _cached_system_prompt = f.read().strip()
-    return _cached_system_prompt
-
-# 会話履歴保存
-def append_history(role, message):
+    return prompt_registry.get(SYSTEM_PROMPT)
+
+# 応答生成用の system + dialogue プロンプト（事前連結済み）
+# System + dialogue prompt for generation (pre-assembled)
+def load_dialogue_system_prompt():
+    return prompt_registry.dialogue_prefix()
+
+# ターン内ではメッセージをためておき、ターン終了時（flush_history）に1回の書き込みで保存する。
+# ターン外（背景タスク等）では1件のターンとして即座に保存する。
+# Inside a turn messages are buffered and saved in one write when the turn ends (flush_history).
+# Outside a turn (background tasks etc.) each message is saved at once as a turn of its own.
+def append_history(role, message, session_id: str | None = None):
     try:
+        turn = current_turn()
+        if turn is not None and session_id not in (None, turn.session_id):
+            turn = None  # 別セッション宛てはターンにためず即座に保存 # Another session's message is saved at once
+        session_id = session_id or current_session_id()
         entry = {
+            "turn_id": turn.turn_id if turn is not None else uuid4().hex,
+            "seq": repository.next_dialogue_seq(),
             "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
             "role": role,
-            "message": message
+            "message": message,
+            "analysis": _analyze_for_history(message)
         }
-        client = get_mongo_client()
-        if client:
-            db = client["emotion_db"]
-            collection = db["dialogue_history"]
-            collection.insert_one(entry)
-            logger.info(f"[INFO] 履歴をMongoDBに保存: {entry}")
+        if turn is None:
+            repository.insert_dialogue_turn([entry], session_id)
+            logger.info(f"[INFO] 履歴を保存: {entry['seq']} {role}")  # Saved history entry
+            return
+        if turn.append(TURN_HISTORY_KEY, entry):
+            turn.add_finalizer(flush_history)
+        logger.debug(f"[DEBUG] 履歴をターン内に保留: {entry['seq']} {role}")  # Buffered history entry in the turn
+    except Exception as e:
+        logger.error(f"[ERROR] 履歴保存に失敗: {e}")
+
+# 追加時に1度だけ分析し、以後のターンは保存済みの結果を使う（失敗しても履歴は保存する）。
+# 外部の翻訳は待たない（nrclex の構成比は読むときに先読み済みの訳で補う）
+# Analysed once when appended so later turns reuse it (the history is saved even if this fails).
+# Never waits on online translation (nrclex 構成比 is filled in on read from the prefetched translation)
+def _analyze_for_history(message) -> dict | None:
+    if not isinstance(message, str):
+        return None
+    try:
+        return analyze_for_history(message)
+    except Exception as e:
+        logger.error(f"[ERROR] メッセージ分析に失敗: {e}")  # Message analysis failed
+        return None
+
+# 履歴1件（load_history の要素）の分析結果。読むときに補った分（後回しにした構成比・旧形式の分析）は保存し直し、
+# 以後の読み込みでは計算し直さない。ターン内でまだ書き込んでいないメッセージは、ためている履歴を書き換える
+# Analysis of one history entry (an element of load_history). What is filled in on read (a deferred 構成比, or a
+# legacy entry's analysis) is saved back so later reads do not recompute it; messages still buffered in the turn
+# have the buffered entry updated instead
+def history_analysis(text: str, entry: dict, session_id: str | None = None) -> dict:
+    stored = entry.get("analysis")
+    analysis = analysis_for(text, stored)
+    seq = entry.get("seq")
+    if analysis is stored or seq is None:
+        return analysis
+
+    session_id = session_id or current_session_id()
+    try:
+        turn = current_turn()
+        if turn is not None and turn.session_id == session_id:
+            for buffered in turn.buffered(TURN_HISTORY_KEY):
+                if buffered["seq"] == seq:
+                    buffered["analysis"] = analysis
+                    return analysis
+        repository.set_dialogue_analysis(seq, analysis, session_id)
+    except Exception as e:
+        logger.error(f"[ERROR] 分析結果の保存に失敗: {e}")  # Failed to save the analysis
+    return analysis
+
+# ターン内にためた履歴を1回の一括書き込みで保存する
+# Save the history buffered in this turn with a single bulk write
+def flush_history() -> int:
+    turn = current_turn()
+    if turn is None:
+        return 0
+    entries = turn.drain(TURN_HISTORY_KEY)
+    if not entries:
+        return 0
+    try:
+        repository.insert_dialogue_turn(entries, turn.session_id)
+        logger.info(f"[INFO] 1ターン分の履歴を保存: {len(entries)} 件 (session_id={turn.session_id}, turn_id={turn.turn_id})")  # Saved one turn of history
+        return len(entries)
     except Exception as e:
         logger.error(f"[ERROR] 履歴保存に失敗: {e}")
+        return 0
 
 # テスト用出力
 if __name__ == "__main__":
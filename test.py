@@ -1,14 +1,8 @@
-import MeCab
+from module.nlp.keywords import extract_keywords
+from module.nlp.tagger import tokenize
 
-mecab = MeCab.Tagger()
-result = mecab.parseToNode("私は日本語を勉強しています。")
-taglist = []
-while result:
-    Part_of_speech = result.surface
-    tag = result.feature.split(",")[0]
-    if tag == "名詞":
-        taglist.append(Part_of_speech)
-    print(Part_of_speech)
-    print(tag)
-    result = result.next
-print(taglist)
\ No newline at end of file
+text = "私は日本語を勉強しています。"
+for token in tokenize(text):
+    print(token.surface)
+    print(token.pos)
+print(extract_keywords(text))
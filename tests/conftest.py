@@ -0,0 +1,11 @@
+# tests/conftest.py
+import os
+import tempfile
+
+# テストが作業ツリー内にキャッシュを作らず、外部の翻訳サービスにも接続しないようにする（module.params の読み込み前に設定）
+# Keep test caches out of the working tree and off the online translator (set before module.params is imported)
+_tmp_dir = tempfile.mkdtemp(prefix="emotion-tests-")
+os.environ.setdefault("TRANSLATION_CACHE_PATH", os.path.join(_tmp_dir, "translation_cache.sqlite3"))
+os.environ.setdefault("TRANSLATION_BACKEND", "glossary")
+os.environ.setdefault("LOCAL_DB_PATH", os.path.join(_tmp_dir, "emotion_db.sqlite3"))
+os.environ.setdefault("WRITE_SPOOL_DIR", os.path.join(_tmp_dir, "spool"))
@@ -0,0 +1,87 @@
+import pytest
+
+import module.mongo.repository as repository
+from module.mongo.local_store import LocalDatabase
+from module.mongo.migrations import migrate_dialogue_seq
+from module.utils.turn_context import turn_scope
+from module.utils.utils import append_history, load_history
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    database = LocalDatabase(str(tmp_path / "emotion_db.sqlite3"))
+    monkeypatch.setattr(repository, "USE_MONGODB", False)
+    monkeypatch.setattr(repository, "get_local_database", lambda: database)
+    yield database
+    database.close()
+
+
+# seq は同一時刻でも単調増加すること
+def test_next_dialogue_seq_is_strictly_increasing():
+    seqs = [repository.next_dialogue_seq() for _ in range(1000)]
+    assert seqs == sorted(set(seqs))
+
+
+# ターン内の発言は読み込みに見え、ターン終了時に1回の書き込みでまとめて保存されること
+def test_turn_history_is_buffered_and_written_once(db, monkeypatch):
+    calls = []
+    original = repository.insert_dialogue_turn
+    monkeypatch.setattr(repository, "insert_dialogue_turn", lambda entries, *args: calls.append(len(entries)) or original(entries, *args))
+
+    with turn_scope() as turn:
+        append_history("user", "こんにちは")
+        append_history("assistant", "こんにちは、ご主人。")
+        assert [h["message"] for h in load_history(3)] == ["こんにちは、ご主人。", "こんにちは"]
+        assert db["dialogue_history"].count_documents({}) == 0
+
+    assert calls == [2]
+    docs = list(db["dialogue_history"].find({}))
+    assert {d["turn_id"] for d in docs} == {turn.turn_id}
+    assert [h["role"] for h in load_history(3)] == ["assistant", "user"]
+
+
+# before_seq より古い履歴だけを seq 降順で返すこと
+def test_load_history_before_seq_pages_backwards(db):
+    for i in range(5):
+        append_history("user", f"m{i}")
+    newest = load_history(2)
+    assert [h["message"] for h in newest] == ["m4", "m3"]
+    older = load_history(2, before_seq=newest[-1]["seq"])
+    assert [h["message"] for h in older] == ["m2", "m1"]
+
+
+# seq の無い旧形式の履歴に timestamp 順で seq を補うこと
+def test_backfill_dialogue_seq_orders_legacy_entries(db):
+    collection = db["dialogue_history"]
+    collection.insert_one({"timestamp": "2025-01-01 10:00:00", "role": "user", "message": "a"})
+    collection.insert_one({"timestamp": "2025-01-01 10:00:00", "role": "assistant", "message": "b"})
+    collection.insert_one({"timestamp": "2024-12-31 09:00:00", "role": "user", "message": "old"})
+
+    assert repository.backfill_dialogue_seq() == 3
+    assert repository.backfill_dialogue_seq() == 0
+    assert [d["message"] for d in repository.find_recent_dialogue(3)] == ["b", "a", "old"]
+
+
+# seq の補完は一度だけ実行され、完了が meta に記録されること
+def test_migrate_dialogue_seq_runs_once(db):
+    db["dialogue_history"].insert_one({"timestamp": "2025-01-01 10:00:00", "role": "user", "message": "a"})
+    assert migrate_dialogue_seq() == 1
+    assert repository.is_migration_done("dialogue_seq")
+
+    db["dialogue_history"].insert_one({"timestamp": "2025-01-01 11:00:00", "role": "user", "message": "b"})
+    assert migrate_dialogue_seq() == 0
+    assert db["dialogue_history"].count_documents({"seq": {"$exists": False}}) == 1
+
+
+# セッションごとに履歴が分かれ、既定のセッションは session_id の無い既存データも含むこと
+def test_history_is_partitioned_by_session(db):
+    db["dialogue_history"].insert_one({"seq": 1, "role": "user", "message": "legacy"})
+    with turn_scope("alice"):
+        append_history("user", "from alice")
+    with turn_scope("bob"):
+        append_history("user", "from bob")
+    append_history("user", "from default")
+
+    assert [h["message"] for h in load_history(10, session_id="alice")] == ["from alice"]
+    assert [h["message"] for h in load_history(10, session_id="bob")] == ["from bob"]
+    assert [h["message"] for h in load_history(10)] == ["from default", "legacy"]
@@ -0,0 +1,32 @@
+from module.nlp.emotion_lexicon import EMOTIONS, EmotionLexicon, get_emotion_lexicon, score_text, score_texts, to_composition
+
+
+# 構成比は32感情すべてを含み、合計が100になること
+def test_score_text_returns_full_composition():
+    result = score_text("今日はとても嬉しかった")
+    assert list(result) == EMOTIONS
+    assert len(result) == 32
+    assert sum(result.values()) == 100
+    assert max(result, key=result.get) == "喜び"
+
+
+# 辞書に無い文は全て0になること
+def test_score_text_without_matches_is_all_zero():
+    assert set(score_text("こんにちは").values()) == {0}
+
+
+# 否定形は「~見出し語」の値を使い、無ければ数えないこと
+def test_negation_uses_negated_entry():
+    lexicon = EmotionLexicon({"嬉しい": ((0, 1.0),), "~嬉しい": ((1, 1.0),), "楽しい": ((2, 1.0),)})
+    assert lexicon.score_vector(["嬉しい", "ない"])[:3] == [0.0, 1.0, 0.0]
+    assert lexicon.score_vector(["楽しい", "ない"])[:3] == [0.0, 0.0, 0.0]
+
+
+# 端数は合計100になるよう配分され、バッチ版は1件ずつと同じ結果になること
+def test_rounding_and_batch():
+    composition = to_composition([1.0, 1.0, 1.0] + [0.0] * 29)
+    assert sum(composition.values()) == 100
+    assert sorted(composition.values())[-3:] == [33, 33, 34]
+    texts = ["不安で眠れない", "懐かしい思い出"]
+    assert score_texts(texts) == [score_text(t) for t in texts]
+    assert len(get_emotion_lexicon()) > 200
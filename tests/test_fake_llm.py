@@ -0,0 +1,59 @@
+import json
+import re
+
+import openai
+import pytest
+
+from module.llm.fake_llm import CassetteClient, CassetteMissError, FakeChatClient, LatencyModel
+
+MESSAGES = [{"role": "system", "content": "system"}, {"role": "user", "content": "ユーザー発言: こんにちは\n"}]
+PARAMS = {"model": "gpt-4o", "temperature": 0.7}
+
+
+def _emotion_block(text):
+    return json.loads(re.search(r"```json\s*({.*?})\s*```", text, re.DOTALL).group(1))
+
+
+# 同じ入力には同じ応答を返し、構成比は合計100の ```json ブロックで返すこと
+def test_fake_completion_is_deterministic_and_parseable():
+    client = FakeChatClient()
+    first = client.chat.completions.create(messages=MESSAGES, **PARAMS).choices[0].message.content
+    second = client.chat.completions.create(messages=MESSAGES, **PARAMS).choices[0].message.content
+
+    assert first == second
+    data = _emotion_block(first)
+    assert sum(data["構成比"].values()) == 100
+    assert data["主感情"] == next(iter(data["構成比"]))
+    assert data["keywords"] == ["こんにちは"]
+
+
+# ストリームのチャンクをつなぐと非ストリームの応答と一致すること
+def test_fake_stream_matches_completion():
+    client = FakeChatClient()
+    chunks = client.chat.completions.create(messages=MESSAGES, stream=True, **PARAMS)
+    streamed = "".join(c.choices[0].delta.content for c in chunks)
+    assert streamed == client.chat.completions.create(messages=MESSAGES, **PARAMS).choices[0].message.content
+
+
+# 待ち時間が timeout を超えたら APITimeoutError を送出すること
+def test_fake_latency_respects_timeout(monkeypatch):
+    monkeypatch.setattr("module.llm.fake_llm.time.sleep", lambda seconds: None)
+    client = FakeChatClient(LatencyModel("fixed:5000"))
+    with pytest.raises(openai.APITimeoutError):
+        client.chat.completions.create(messages=MESSAGES, timeout=1.0, **PARAMS)
+
+
+# 記録したカセットは replay で再生でき、記録に無い呼び出しは失敗すること
+def test_cassette_record_then_replay(tmp_path):
+    path = str(tmp_path / "cassette.jsonl")
+    inner = FakeChatClient()
+    recorder = CassetteClient(inner, path, mode="record")
+    recorded = recorder.chat.completions.create(messages=MESSAGES, timeout=5, **PARAMS).choices[0].message.content
+    recorder.chat.completions.create(messages=MESSAGES, **PARAMS)
+    assert inner.calls == 1 and recorder.recorded == 1
+
+    player = CassetteClient(None, path, mode="replay")
+    chunks = player.chat.completions.create(messages=MESSAGES, stream=True, **PARAMS)
+    assert "".join(c.choices[0].delta.content for c in chunks) == recorded
+    with pytest.raises(CassetteMissError):
+        player.chat.completions.create(messages=MESSAGES, **{**PARAMS, "temperature": 0.1})
@@ -0,0 +1,132 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from bson import ObjectId
+
+import module.mongo.repository as repository
+from module.mongo.local_store import LocalDatabase
+from module.response.index_cache import CategoryEntries, IndexCache
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    database = LocalDatabase(str(tmp_path / "emotion_db.sqlite3"))
+    monkeypatch.setattr(repository, "USE_MONGODB", False)
+    monkeypatch.setattr(repository, "get_local_database", lambda: database)
+    yield database
+    database.close()
+
+
+def _entry(category, keywords=("天気",), _id=None):
+    doc = {"date": "20250101000000", "構成比": {"喜び": 100}, "キーワード": list(keywords), "emotion": "Joy", "category": category}
+    if _id is not None:
+        doc["_id"] = _id
+    return doc
+
+
+# 初回は全件、以後は追加分だけを読み込むこと
+def test_incremental_refresh_loads_only_new_entries(db):
+    cache = IndexCache()
+    repository.insert_index_entry(_entry("short"), "s1")
+    assert len(cache.categorized("s1")["short"]) == 1
+
+    late_id = ObjectId()  # スプール経由で遅れて届く挿入 # an insert that arrives late through the spool
+    repository.insert_index_entry(_entry("long"), "s1")
+    assert len(cache.categorized("s1")["long"]) == 1
+    repository.insert_index_entry(_entry("long", _id=late_id), "s1")
+    categorized = cache.categorized("s1")
+
+    assert len(categorized["long"]) == 2
+    assert cache.counts["full_loads"] == 1
+    assert cache.counts["incremental_loads"] == 2
+    assert cache.categorized("s1") is categorized  # 変更が無ければ作り直さない # not rebuilt without changes
+
+
+# 遡り幅より遅れてスプールから反映した挿入は、版番号が上がって次の読み込みでその文書だけ読まれること
+def test_replay_later_than_overlap_is_visible(db):
+    cache = IndexCache(overlap_seconds=60)
+    repository.insert_index_entry(_entry("short"), "s1")
+    assert len(cache.categorized("s1")["long"]) == 0
+
+    stale_id = ObjectId.from_datetime(datetime.now(timezone.utc) - timedelta(minutes=10))
+    repository.insert_many_idempotent(repository.EMOTION_INDEX, [{**_entry("long", _id=stale_id), "session_id": "s1"}])
+
+    assert [d["_id"] for d in cache.categorized("s1")["long"]] == [stale_id]
+    assert cache.counts["full_loads"] == 1
+    assert cache.counts["partial_reloads"] == 1
+
+
+# 変更 _id の分からない版番号の更新では全件を読み直し、セッションは混ざらないこと
+def test_version_bump_forces_full_reload(db):
+    cache = IndexCache()
+    repository.insert_index_entry(_entry("short"), "s1")
+    repository.insert_index_entry(_entry("short"), "s2")
+    cache.categorized("s1")
+
+    repository.bump_index_version("s1")
+    assert len(cache.categorized("s1")["short"]) == 1
+    assert cache.counts["full_loads"] == 2
+    assert repository.get_index_version("s1") == 1
+    assert repository.get_index_version("s2") == 0
+
+
+# 忘却で書き換わった文書だけを読み直し、一覧の位置を保ったまま転置インデックスを差し替えること
+def test_changed_entries_are_swapped_in_place(db):
+    cache = IndexCache()
+    first = repository.insert_index_entry(_entry("short", ["天気"]), "s1")
+    second = repository.insert_index_entry(_entry("short", ["天気", "散歩"]), "s1")
+    gone = repository.insert_index_entry(_entry("short", ["散歩"]), "s1")
+    cache.categorized("s1")
+
+    db["emotion_index"].update_one({"_id": first}, {"$set": {"キーワード": ["音楽"]}})
+    db["emotion_index"].delete_many({"_id": {"$in": [gone]}})
+    repository.bump_index_version("s1", [first, gone])
+
+    short = cache.categorized("s1")["short"]
+    assert [d["_id"] for d in short] == [first, second]
+    assert short.match_keywords(["天気", "散歩"]) == [short[1]]
+    assert short.match_keywords(["音楽"]) == [short[0]]
+    assert "散歩" in short.postings and gone not in short.postings["散歩"]
+    assert cache.counts["full_loads"] == 1
+    assert cache.counts["partial_reloads"] == 1
+
+
+# 変更の記録より遅れたキャッシュは全件を読み直すこと
+def test_falls_back_to_full_reload_beyond_kept_changes(db, monkeypatch):
+    monkeypatch.setattr(repository, "INDEX_CHANGES_KEPT", 1)
+    cache = IndexCache()
+    doc_id = repository.insert_index_entry(_entry("short"), "s1")
+    cache.categorized("s1")
+
+    repository.bump_index_version("s1", [doc_id])
+    repository.bump_index_version("s1", [doc_id])
+    assert repository.get_index_changes("s1") == (2, [[doc_id]])
+    assert len(cache.categorized("s1")["short"]) == 1
+    assert cache.counts["full_loads"] == 2
+    assert "partial_reloads" not in cache.counts
+
+
+# 転置インデックスは一致したキーワード数の多い順（同数なら一覧の順）に候補を返すこと
+def test_inverted_index_ranks_by_keyword_overlap():
+    docs = [
+        _entry("short", ["天気"], ObjectId()),
+        _entry("short", ["音楽"], ObjectId()),
+        _entry("short", ["天気", "散歩"], ObjectId()),
+    ]
+    entries = CategoryEntries(docs)
+    assert entries.match_keywords(["散歩", "天気"]) == [docs[2], docs[0]]
+    assert entries.match_keywords(["料理"]) == []
+
+
+# このプロセスで保存したインデックスは、読み込み前でも転置インデックスに反映されること
+def test_add_updates_loaded_session(db):
+    cache = IndexCache()
+    repository.insert_index_entry(_entry("long", ["旅行"]), "s1")
+    cache.categorized("s1")
+
+    doc = _entry("long", ["旅行", "写真"], ObjectId())
+    cache.add("s1", doc)
+    cache.add("s2", _entry("long", ["旅行"], ObjectId()))  # 未読み込みのセッションは無視 # ignored until loaded
+
+    assert cache.categorized("s1")["long"].match_keywords(["写真"]) == [doc]
+    assert cache.stats()["sessions"] == 1
@@ -0,0 +1,33 @@
+import threading
+
+from module.nlp.keywords import KeywordExtractor, extract_keywords, extract_keywords_batch
+from module.nlp.tagger import get_tagger
+
+
+# 名詞だけを出現順・重複なしで返し、ストップワードと数詞を除くこと
+def test_extract_keywords_filters_and_dedupes():
+    keywords = extract_keywords("今日は東京の天気が良いので散歩した。天気のこと、3時に話そう")
+    assert keywords == ["今日", "東京", "天気", "散歩"]
+
+
+# 品詞の指定と件数の上限が効くこと
+def test_extractor_pos_filter_and_limit():
+    extractor = KeywordExtractor(pos=("形容詞",), use_lemma=True)
+    assert extractor.extract("空が青くて美しかった") == ["青い", "美しい"]
+    assert extract_keywords("東京と大阪と京都", limit=2) == ["東京", "大阪"]
+
+
+# バッチ版は1件ずつと同じ結果を返すこと
+def test_extract_keywords_batch_matches_single():
+    texts = ["音楽を聴く", "旅行の計画", "音楽を聴く"]
+    assert extract_keywords_batch(texts) == [extract_keywords(t) for t in texts]
+
+
+# Tagger はスレッドごとに1つで、同じスレッドでは使い回されること
+def test_tagger_is_thread_local():
+    taggers = []
+    thread = threading.Thread(target=lambda: taggers.append(get_tagger()))
+    thread.start()
+    thread.join()
+    assert get_tagger() is get_tagger()
+    assert taggers[0] is not get_tagger()
@@ -0,0 +1,68 @@
+import threading
+import time
+
+import pytest
+
+from module.llm.dispatcher import LLMDispatcher, LLMBusyError
+
+
+def _wait_until(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.005)
+
+
+# 待ち行列が満杯なら即座に retry_after 付きで拒否すること
+def test_dispatcher_rejects_when_queue_is_full():
+    dispatcher = LLMDispatcher(max_concurrency=1, max_queue=0, initial_service_time=2.0)
+    dispatcher.acquire("a")
+
+    with pytest.raises(LLMBusyError) as exc:
+        dispatcher.acquire("b")
+    assert exc.value.reason == "queue_full"
+    assert exc.value.retry_after_header == "2"
+    assert dispatcher.is_saturated()
+
+    dispatcher.release()
+    assert dispatcher.stats()["in_flight"] == 0
+    assert dispatcher.stats()["rejected"] == 1
+
+
+# 待ちが多いセッションがあっても、空いた枠はセッションごとに順番に渡ること
+def test_dispatcher_rotates_slots_across_sessions():
+    dispatcher = LLMDispatcher(max_concurrency=1, max_queue=10)
+    dispatcher.acquire("holder")
+    order = []
+
+    def worker(session, name):
+        with dispatcher.slot(session):
+            order.append(name)
+
+    threads = []
+    for session, name in [("a", "a1"), ("a", "a2"), ("a", "a3"), ("b", "b1")]:
+        t = threading.Thread(target=worker, args=(session, name))
+        t.start()
+        threads.append(t)
+        _wait_until(lambda: dispatcher.stats()["queued"] == len(threads))
+
+    assert dispatcher.stats()["queued_by_session"] == {"a": 3, "b": 1}
+    dispatcher.release()
+    for t in threads:
+        t.join(2.0)
+
+    assert order == ["a1", "b1", "a2", "a3"]
+    assert dispatcher.stats()["in_flight"] == 0
+
+
+# 待ち時間の上限を超えたら待ち行列から外して拒否すること
+def test_dispatcher_times_out_waiting_callers():
+    dispatcher = LLMDispatcher(max_concurrency=1, max_queue=5, queue_timeout=0.05)
+    dispatcher.acquire()
+
+    with pytest.raises(LLMBusyError) as exc:
+        dispatcher.acquire("late")
+    assert exc.value.reason == "queue_timeout"
+    assert dispatcher.stats()["queued"] == 0
+    assert dispatcher.stats()["timed_out"] == 1
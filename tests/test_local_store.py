@@ -0,0 +1,116 @@
+import sqlite3
+
+import pytest
+from bson import json_util
+from pymongo import InsertOne
+from pymongo.errors import BulkWriteError
+
+import module.mongo.local_store as local_store
+from module.mongo.local_store import LocalDatabase
+
+
+@pytest.fixture
+def db(tmp_path):
+    database = LocalDatabase(str(tmp_path / "emotion_db.sqlite3"))
+    yield database
+    database.close()
+
+
+# 配列内のドット区切りパス検索と projection
+def test_local_store_matches_nested_history(db):
+    collection = db["emotion_data"]
+    collection.insert_one({"emotion": "Joy", "category": "short",
+                           "data": {"履歴": [{"date": "20250101000000"}, {"date": "20250102000000"}]}})
+    collection.insert_one({"emotion": "Fear", "category": "long", "data": {"履歴": []}})
+
+    found = collection.find_one({"data.履歴.date": "20250102000000"}, {"_id": 0, "emotion": 1})
+    assert found == {"emotion": "Joy"}
+    assert [d["emotion"] for d in collection.find({"category": {"$in": ["long"]}}, {"emotion": 1})] == ["Fear"]
+
+
+# timestamp の降順ソートと件数制限
+def test_local_store_sort_and_limit(db):
+    collection = db["dialogue_history"]
+    for i in range(5):
+        collection.insert_one({"timestamp": f"2025-01-01 00:00:0{i}", "message": str(i)})
+
+    latest = list(collection.find({}, {"message": 1}).sort("timestamp", -1).limit(2))
+    assert [d["message"] for d in latest] == ["4", "3"]
+    assert collection.find_one({}, sort=[("timestamp", -1)])["message"] == "4"
+
+
+# $set 更新と delete_many
+def test_local_store_update_and_delete(db):
+    collection = db["emotion_index"]
+    doc_id = collection.insert_one({"履歴": [{"date": "a"}, {"date": "b"}]}).inserted_id
+
+    result = collection.update_one({"_id": doc_id}, {"$set": {"履歴": [{"date": "b"}]}})
+    assert result.modified_count == 1
+    assert collection.find_one({"_id": doc_id})["履歴"] == [{"date": "b"}]
+
+    assert collection.delete_many({"_id": {"$in": [doc_id]}}).deleted_count == 1
+    assert collection.find_one({}) is None
+
+
+# 同じ _id の再挿入は重複キーエラー（スプールの冪等反映が成功扱いにできる形）
+def test_local_store_duplicate_key(db):
+    collection = db["current_emotion"]
+    doc_id = collection.insert_one({"emotion_vector": {}}).inserted_id
+
+    with pytest.raises(BulkWriteError) as e:
+        collection.bulk_write([InsertOne({"_id": doc_id, "emotion_vector": {}})], ordered=False)
+    assert e.value.details["writeErrors"][0]["code"] == 11000
+
+
+# session_id / seq の絞り込み・並べ替え・件数制限は複合インデックスを使う SQL で行うこと
+def test_local_store_pushes_session_seq_query_into_sql(db):
+    collection = db["dialogue_history"]
+    collection.create_index([("session_id", 1), ("seq", -1)], name="session_seq_desc")
+    collection.insert_many([{"session_id": f"s{i % 2}", "seq": i, "message": str(i)} for i in range(10)])
+    collection.insert_one({"seq": 100, "message": "legacy"})
+
+    query = {"session_id": "s1", "seq": {"$lt": 9}}
+    assert [d["seq"] for d in collection.find(query).sort("seq", -1).limit(2)] == [7, 5]
+    legacy = {"session_id": {"$in": ["s0", None]}}
+    assert [d["message"] for d in collection.find(legacy).sort("seq", -1).limit(2)] == ["legacy", "8"]
+
+    clauses, params, exact = collection._where(query)
+    plan = db.conn.execute(
+        f'EXPLAIN QUERY PLAN SELECT body FROM "dialogue_history" WHERE {" AND ".join(clauses)} ORDER BY seq DESC LIMIT 2',
+        params
+    ).fetchall()
+    assert exact and any("dialogue_history_session_seq_desc" in row[-1] for row in plan)
+
+
+# 列の足りない旧形式のテーブルは、開いたときに列を追加して本文から値を埋めること
+def test_local_store_migrates_old_table(tmp_path):
+    path = str(tmp_path / "old.sqlite3")
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE "dialogue_history" (id TEXT PRIMARY KEY, category TEXT, timestamp TEXT, body TEXT NOT NULL)')
+    conn.execute('INSERT INTO "dialogue_history" VALUES (?, NULL, NULL, ?)',
+                 ("0" * 24, json_util.dumps({"_id": {"$oid": "0" * 24}, "session_id": "s1", "seq": 3})))
+    conn.commit()
+    conn.close()
+
+    database = LocalDatabase(path)
+    try:
+        collection = database["dialogue_history"]
+        assert database.conn.execute('SELECT session_id, seq FROM "dialogue_history"').fetchall() == [("s1", 3)]
+        assert collection.find_one({"session_id": "s1", "seq": {"$gte": 3}})["seq"] == 3
+    finally:
+        database.close()
+
+
+# _id の等値・$in は主キーで引き、他の行を読み込まないこと（update_one / delete_many も同じ）
+def test_local_store_id_lookups_use_primary_key(db, monkeypatch):
+    collection = db["emotion_index"]
+    ids = collection.insert_many([{"n": i} for i in range(50)]).inserted_ids
+
+    decoded = []
+    loads = local_store.json_util.loads
+    monkeypatch.setattr(local_store.json_util, "loads", lambda body: decoded.append(1) or loads(body))
+
+    assert collection.update_one({"_id": ids[3]}, {"$set": {"n": -3}}).modified_count == 1
+    assert collection.delete_many({"_id": {"$in": ids[:2]}}).deleted_count == 2
+    assert len(decoded) == 3
+    assert collection.find_one({"_id": ids[3]})["n"] == -3
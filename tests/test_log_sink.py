@@ -0,0 +1,68 @@
+import threading
+
+from module.utils.log_sink import LogSink
+
+
+# 書き込み先を差し替えて、バッチ単位で渡されることを確認
+def test_log_sink_writes_in_batches():
+    batches = []
+    sink = LogSink(writer=batches.append, batch_size=5, flush_interval=0.05)
+
+    for i in range(12):
+        assert sink.submit("INFO", f"message {i}")
+    sink.shutdown()
+
+    assert sum(len(b) for b in batches) == 12
+    assert all(len(b) <= 5 for b in batches)
+    assert batches[0][0]["level"] == "INFO"
+    assert sink.stats()["written"] == 12
+
+
+# キュー満杯時は破棄してカウントする
+def test_log_sink_drops_when_full():
+    release = threading.Event()
+    sink = LogSink(writer=lambda batch: release.wait(), maxsize=2, batch_size=1,
+                   flush_interval=0.01, high_watermark=1.0)
+
+    results = [sink.submit("ERROR", f"m{i}") for i in range(10)]
+    release.set()
+    sink.shutdown()
+
+    assert not all(results)
+    assert sink.stats()["dropped"]["ERROR"] == results.count(False)
+
+
+# 高水位を超えると DEBUG/INFO は間引かれ、WARNING 以上は残る
+def test_log_sink_samples_low_levels_under_pressure():
+    release = threading.Event()
+    sink = LogSink(writer=lambda batch: release.wait(), maxsize=100, batch_size=1,
+                   flush_interval=0.01, high_watermark=0.0, sample_every=4)
+
+    kept = [sink.submit("DEBUG", "d") for _ in range(8)]
+    assert kept.count(True) == 2
+    assert sink.stats()["sampled_out"]["DEBUG"] == 6
+    assert sink.submit("WARNING", "w")
+
+    release.set()
+    sink.shutdown()
+
+
+# 書き込みに失敗したログは標準エラーに出し、区間ごとの上限を超えた分は件数だけを次の区間で出す
+def test_log_sink_falls_back_to_stderr_with_rate_limit(capsys):
+    def failing_writer(batch):
+        raise ConnectionError("down")
+
+    sink = LogSink(writer=failing_writer, batch_size=5, flush_interval=0.01, fallback_interval=60, fallback_lines=3)
+    for i in range(5):
+        sink.submit("ERROR", f"message {i}")
+    sink.shutdown()
+
+    err = capsys.readouterr().err
+    assert "down" in err
+    assert [f"message {i}" in err for i in range(5)] == [True, True, True, False, False]
+    assert sink.stats()["dropped"]["WRITE_FAILED"] == 5
+
+    sink._fallback_window -= 60
+    sink._fallback([{"timestamp": "t", "level": "ERROR", "message": "later"}], "test")
+    err = capsys.readouterr().err
+    assert "2 件" in err and "later" in err
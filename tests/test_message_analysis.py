@@ -0,0 +1,94 @@
+import pytest
+
+import module.mongo.repository as repository
+import module.utils.utils as utils
+from module.mongo.local_store import LocalDatabase
+import module.nlp.message_analysis as message_analysis
+from module.nlp.message_analysis import (
+    aggregate_analyses, analysis_for, analyze_for_history, analyze_message, detect_language
+)
+from module.utils.turn_context import turn_scope
+from module.utils.utils import append_history, history_analysis, load_history
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    database = LocalDatabase(str(tmp_path / "emotion_db.sqlite3"))
+    monkeypatch.setattr(repository, "USE_MONGODB", False)
+    monkeypatch.setattr(repository, "get_local_database", lambda: database)
+    monkeypatch.setattr(utils, "analyze_for_history", lambda text: analyze_for_history(text, engine="lexicon"))
+    yield database
+    database.close()
+
+
+# 追加時に分析結果が履歴と一緒に保存され、読み込み時に返ること
+def test_analysis_is_stored_with_history(db):
+    append_history("user", "旅行の思い出が懐かしい")
+    analysis = load_history(1)[0]["analysis"]
+    assert analysis["keywords"] == ["旅行", "思い出"]
+    assert analysis["lang"] == "ja"
+    assert max(analysis["構成比"], key=analysis["構成比"].get) == "感傷"
+
+
+# 保存済みの結果は再計算せず、旧形式のメッセージだけ分析すること
+def test_analysis_for_reuses_stored_result():
+    stored = analyze_message("嬉しい", engine="lexicon")
+    assert analysis_for("別の文", stored, engine="lexicon") is stored
+    assert analysis_for("不安です", None, engine="lexicon")["構成比"]["不安"] == 100
+
+
+# nrclex では追加時に翻訳を待たず（先読みのみ）、構成比は読むときに補うこと
+def test_nrclex_defers_translation_off_append(monkeypatch):
+    prefetched, scored = [], []
+
+    class Service:
+        def prefetch(self, texts):
+            prefetched.extend(texts)
+
+    monkeypatch.setattr(message_analysis, "get_translation_service", lambda: Service())
+    monkeypatch.setattr(message_analysis, "score_emotion", lambda text, lang, engine: scored.append(text) or {"喜び": 1.0})
+    stored = analyze_for_history("旅行が楽しみ", engine="nrclex")
+    assert "構成比" not in stored
+    assert stored["keywords"] == ["旅行", "楽しみ"]
+    assert prefetched == ["旅行が楽しみ"] and scored == []
+
+    assert analysis_for("旅行が楽しみ", stored, engine="nrclex")["構成比"] == {"喜び": 1.0}
+    assert scored == ["旅行が楽しみ"]
+
+
+# 読むときに補った構成比は保存し直され、次の読み込みでは計算し直さないこと（ターン内の保留分も含む）
+def test_filled_composition_is_saved_back(db, monkeypatch):
+    scored = []
+    monkeypatch.setattr(utils, "analyze_for_history", lambda text: analyze_message(text, engine="nrclex", score=False))
+    monkeypatch.setattr(utils, "analysis_for", lambda text, stored: analysis_for(text, stored, engine="nrclex"))
+    monkeypatch.setattr(message_analysis, "score_emotion", lambda text, lang, engine: scored.append(text) or {"喜び": 1.0})
+
+    append_history("user", "旅行が楽しみ")
+    with turn_scope():
+        append_history("assistant", "楽しんできてね")
+        for entry in load_history(2):
+            assert history_analysis(entry["message"], entry)["構成比"] == {"喜び": 1.0}
+
+    assert scored == ["楽しんできてね", "旅行が楽しみ"]
+    for entry in load_history(2):
+        assert entry["analysis"]["構成比"] == {"喜び": 1.0}
+        history_analysis(entry["message"], entry)
+    assert len(scored) == 2
+
+
+# 新しいメッセージほど重く集計されること
+def test_aggregate_weights_recent_messages():
+    newest = analyze_message("とても嬉しい", engine="lexicon")
+    oldest = analyze_message("悲しい天気", engine="lexicon")
+    result = aggregate_analyses([newest, oldest], decay=0.5, engine="lexicon")
+    assert sum(result["構成比"].values()) == 100
+    assert result["構成比"]["喜び"] > result["構成比"]["悲しみ"] > 0
+    assert result["keywords"] == ["天気"]
+    assert result["lang"] == "ja"
+
+
+# 文字種から言語を判定すること
+def test_detect_language():
+    assert detect_language("こんにちは") == "ja"
+    assert detect_language("hello there") == "en"
+    assert detect_language("") == ""
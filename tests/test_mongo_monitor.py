@@ -0,0 +1,31 @@
+from pymongo import MongoClient, monitoring
+
+from module.mongo.mongo_client import MongoMonitor, _TopologyListener
+
+
+def _failed(monitor, address):
+    monitor.failed(monitoring.ServerHeartbeatFailedEvent(0.01, ConnectionError("down"), address, False))
+
+
+# トポロジーから外れたサーバーの失敗記録は、サーバーの終了イベントで取り除かれること
+def test_closed_server_is_pruned():
+    monitor = MongoMonitor()
+    monitor.succeeded(monitoring.ServerHeartbeatSucceededEvent(0.01, {}, ("a", 27017), False))
+    _failed(monitor, ("b", 27017))
+    monitor.closed(monitoring.ServerClosedEvent(("b", 27017), None))
+    assert set(monitor.servers) == {("a", 27017)}
+    assert monitor.is_healthy()
+
+
+# トポロジーの変化で、残っているサーバー以外の記録が取り除かれ、健全性が戻ること
+def test_topology_change_prunes_departed_servers():
+    monitor = MongoMonitor()
+    _failed(monitor, ("old", 27017))
+    assert not monitor.is_healthy()
+    monitor.prune({("new", 27017)})
+    assert monitor.servers == {}
+    assert monitor.is_healthy()
+
+    # ドライバがリスナーとして受け付けること # the driver accepts both listeners
+    client = MongoClient("mongodb://localhost:1", connect=False, event_listeners=[monitor, _TopologyListener(monitor)])
+    client.close()
@@ -0,0 +1,34 @@
+import os
+
+from module.utils.prompt_registry import PromptRegistry
+
+
+def _write(path, text, mtime_ns):
+    path.write_text(text, encoding="utf-8")
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+# system + dialogue は事前に連結され、ファイル更新後は読み直されて version も変わること
+def test_registry_hot_reloads_on_mtime_change(tmp_path):
+    _write(tmp_path / "system_prompt.txt", "system\n", 1_000_000_000)
+    _write(tmp_path / "dialogue_prompt.txt", "dialogue", 1_000_000_000)
+    registry = PromptRegistry(str(tmp_path), check_interval=0)
+
+    assert registry.dialogue_prefix() == "system\n\ndialogue"
+    version = registry.version
+
+    _write(tmp_path / "dialogue_prompt.txt", "dialogue v2", 2_000_000_000)
+    assert registry.get("dialogue_prompt") == "dialogue v2"
+    assert registry.dialogue_prefix() == "system\n\ndialogue v2"
+    assert registry.version != version
+    assert registry.reloads == 2
+
+
+# 確認間隔内はファイルを見に行かないこと
+def test_registry_throttles_mtime_checks(tmp_path):
+    _write(tmp_path / "system_prompt.txt", "old", 1_000_000_000)
+    registry = PromptRegistry(str(tmp_path), check_interval=3600)
+    registry.get("system_prompt")
+
+    _write(tmp_path / "system_prompt.txt", "new", 2_000_000_000)
+    assert registry.get("system_prompt") == "old"
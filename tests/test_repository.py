@@ -0,0 +1,73 @@
+import pytest
+
+import module.mongo.repository as repository
+import module.mongo.write_spool as write_spool
+from module.mongo.local_store import LocalDatabase
+from module.mongo.write_spool import WriteSpool
+
+
+# MongoDB 使用時の経路（スプール経由）を、組み込みストレージを MongoDB 代わりにして確かめる
+@pytest.fixture
+def spooled(tmp_path, monkeypatch):
+    database = LocalDatabase(str(tmp_path / "db.sqlite3"))
+    spool = WriteSpool(str(tmp_path / "spool"), fsync_policy="never", replay_interval=3600)
+    monkeypatch.setattr(repository, "USE_MONGODB", True)
+    monkeypatch.setattr(repository, "_collection", lambda name: database[name])
+    monkeypatch.setattr(write_spool, "_spool", spool)
+    yield database, spool
+    database.close()
+
+
+# スプール内の感情データもカテゴリ・日付の読み込みに含まれ、_id 指定の履歴更新は挿入の後に反映される
+def test_emotion_data_reads_and_updates_see_spooled_documents(spooled):
+    database, spool = spooled
+    doc_id = repository.insert_emotion_data(
+        {"emotion": "喜び", "category": "short", "data": {"履歴": [{"date": "20250101000000"}]}}, "s-1"
+    )
+
+    assert [d["_id"] for d in repository.find_emotion_data_by_category("short", "s-1")] == [doc_id]
+    assert repository.find_emotion_labels_by_category("short", "s-1") == [{"emotion": "喜び"}]
+    assert repository.find_emotion_data_by_category("short", "s-2") == []
+    assert repository.find_emotion_data_by_history_date("20250101000000", "s-1")["_id"] == doc_id
+
+    assert repository.set_emotion_data_history(doc_id, [])
+    assert repository.find_emotion_data_by_history_date("20250101000000", "s-1") is None
+    assert repository.find_emotion_data_by_category("short", "s-1")[0]["data"]["履歴"] == []
+
+    assert spool.replay_once()
+    assert database["emotion_data"].find_one({"_id": doc_id})["data"]["履歴"] == []
+    assert repository.find_emotion_data_by_category("short", "s-1")[0]["data"]["履歴"] == []
+
+
+# 忘却記録の挿入・削除は障害中もスプールに積まれ、反映前から読み込みに効く
+def test_oblivion_writes_go_through_the_spool(spooled, monkeypatch):
+    database, spool = spooled
+
+    def unreachable(name):
+        raise ConnectionError("down")
+
+    monkeypatch.setattr(repository, "_collection", unreachable)
+    assert repository.insert_oblivion_entries([{"date": "1", "category": "short"}, {"date": "2", "category": "short"}], "s-1") == 2
+    repository.bump_index_version("s-1")
+
+    monkeypatch.setattr(repository, "_collection", lambda name: database[name])
+    ids = [d["_id"] for d in repository.find_oblivion_dates(["short"], "s-1")]
+    assert len(ids) == 2
+    assert repository.delete_oblivion_entries(ids[:1]) == 1
+    assert [d["_id"] for d in repository.find_oblivion_dates(session_id="s-1")] == ids[1:]
+
+    assert spool.replay_once()
+    assert [d["_id"] for d in database["emotion_oblivion"].find({})] == ids[1:]
+    assert repository.get_index_version("s-1") == 1
+
+
+# 読むときに補った分析結果は、スプール内の履歴にも反映前から効くこと
+def test_dialogue_analysis_update_overlays_spooled_entry(spooled):
+    database, spool = spooled
+    repository.insert_dialogue_turn([{"seq": 1, "role": "user", "message": "旅行が楽しみ", "analysis": {"version": 1}}], "s-1")
+
+    assert repository.set_dialogue_analysis(1, {"version": 1, "構成比": {"喜び": 1.0}}, "s-1")
+    assert repository.find_recent_dialogue(3, session_id="s-1")[0]["analysis"]["構成比"] == {"喜び": 1.0}
+
+    assert spool.replay_once()
+    assert database["dialogue_history"].find_one({"seq": 1})["analysis"]["構成比"] == {"喜び": 1.0}
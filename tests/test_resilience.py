@@ -0,0 +1,104 @@
+import httpx
+import openai
+import pytest
+
+import module.llm.resilience as resilience
+from module.llm.fake_llm import CassetteMissError
+from module.llm.resilience import CircuitBreaker, CircuitOpenError, call_with_resilience
+
+
+def _timeout_error():
+    return openai.APITimeoutError(request=httpx.Request("POST", "https://api.openai.com/v1/chat/completions"))
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    monkeypatch.setattr(resilience.time, "sleep", lambda seconds: None)
+
+
+# 再試行可能な失敗は再試行し、成功すればブレーカーは閉じたままであること
+def test_retries_transient_failures_then_succeeds():
+    breaker = CircuitBreaker(failure_threshold=5)
+    attempts = []
+
+    def fn(timeout):
+        attempts.append(timeout)
+        if len(attempts) < 3:
+            raise _timeout_error()
+        return "ok"
+
+    assert call_with_resilience(fn, breaker, request_timeout=10, max_retries=2) == "ok"
+    assert len(attempts) == 3 and all(t <= 10 for t in attempts)
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+# 連続失敗でブレーカーが開き、開いている間はプロバイダーを呼ばないこと
+def test_breaker_opens_and_fails_fast():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    calls = []
+
+    def fn(timeout):
+        calls.append(timeout)
+        raise _timeout_error()
+
+    with pytest.raises(openai.APITimeoutError):
+        call_with_resilience(fn, breaker, max_retries=5)
+    assert len(calls) == 2
+    assert breaker.is_open()
+
+    with pytest.raises(CircuitOpenError):
+        call_with_resilience(fn, breaker)
+    assert len(calls) == 2
+
+
+# 期限後の試験呼び出しは1件だけ通し、成功すれば閉じること
+def test_breaker_half_open_allows_single_trial(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(resilience.time, "monotonic", lambda: now[0])
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10)
+    breaker.record_failure()
+    assert not breaker.allow()
+
+    now[0] += 11
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+# 試験呼び出しが結果を記録せずに終わっても（BaseException やカセットの記録漏れ）、枠は返され、ブレーカーは開かないこと
+def test_half_open_trial_slot_is_released_without_outcome(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(resilience.time, "monotonic", lambda: now[0])
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10)
+    breaker.record_failure()
+    now[0] += 11
+
+    def interrupted(timeout):
+        raise KeyboardInterrupt
+
+    def missing(timeout):
+        raise CassetteMissError("no recording")
+
+    with pytest.raises(KeyboardInterrupt):
+        call_with_resilience(interrupted, breaker)
+    with pytest.raises(CassetteMissError):
+        call_with_resilience(missing, breaker)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.stats()["opened"] == 1
+    assert call_with_resilience(lambda timeout: "ok", breaker) == "ok"
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+# カセットの記録漏れは失敗として数えず、ブレーカーを開かないこと
+def test_cassette_miss_does_not_trip_breaker():
+    breaker = CircuitBreaker(failure_threshold=1)
+
+    def missing(timeout):
+        raise CassetteMissError("no recording")
+
+    for _ in range(3):
+        with pytest.raises(CassetteMissError):
+            call_with_resilience(missing, breaker)
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.stats()["consecutive_failures"] == 0
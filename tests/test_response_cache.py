@@ -0,0 +1,45 @@
+from module.llm.response_cache import ResponseCache, make_cache_key
+
+MESSAGES = [{"role": "system", "content": "あなたはAIです"}, {"role": "user", "content": "こんにちは"}]
+PARAMS = {"model": "gpt-4o", "temperature": 0.7, "top_p": 1.0, "max_tokens": 1500}
+
+
+# 同じ内容なら同じキー、パラメータが違えば別のキーになること
+def test_cache_key_depends_on_messages_and_params():
+    assert make_cache_key(MESSAGES, PARAMS) == make_cache_key(list(MESSAGES), dict(reversed(PARAMS.items())))
+    assert make_cache_key(MESSAGES, PARAMS) != make_cache_key(MESSAGES, {**PARAMS, "temperature": 0.2})
+
+
+# 上限を超えたら最も使われていないものから追い出すこと
+def test_cache_evicts_least_recently_used():
+    cache = ResponseCache(maxsize=2, ttl=60)
+    cache.set("a", "A")
+    cache.set("b", "B")
+    assert cache.get("a") == "A"
+    cache.set("c", "C")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "A" and cache.get("c") == "C"
+    assert cache.stats()["evictions"] == 1
+
+
+# TTL を過ぎたものは返さないこと
+def test_cache_expires_entries(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("module.llm.response_cache.time.time", lambda: now[0])
+    cache = ResponseCache(maxsize=10, ttl=5)
+    cache.set("k", "v")
+    now[0] += 6
+    assert cache.get("k") is None
+
+
+# 永続層は新しいインスタンス（再起動後）からも読めること
+def test_persistent_tier_survives_restart(tmp_path):
+    path = str(tmp_path / "llm_cache.sqlite3")
+    ResponseCache(maxsize=10, ttl=60, persistent_path=path).set("k", "保存済みの応答")
+
+    cache = ResponseCache(maxsize=10, ttl=60, persistent_path=path)
+    assert cache.get("k") == "保存済みの応答"
+    assert cache.get("k") == "保存済みの応答"
+    assert cache.stats()["persistent_hits"] == 1
+    assert cache.stats()["memory_hits"] == 1
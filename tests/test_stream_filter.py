@@ -0,0 +1,41 @@
+from module.llm.stream_filter import DisplayStreamFilter
+
+
+def _run(chunks):
+    f = DisplayStreamFilter()
+    return "".join(f.feed(c) for c in chunks), f
+
+
+# ```json フェンスがチャンク境界で分割されても表示に漏れないこと
+def test_fenced_json_split_across_chunks_is_withheld():
+    visible, f = _run(["こんにちは", "、元気です。\n`", "``js", 'on\n{"主感情": "喜び"}\n```'])
+    assert visible == "こんにちは、元気です。\n"
+    assert f.withheld
+
+
+# 行頭の { で始まる裸の JSON ブロック以降も表示しないこと
+def test_bare_json_block_is_withheld():
+    visible, _ = _run(["了解", "しました。\n  {", '"構成比": {"喜び": 100}}'])
+    assert visible == "了解しました。\n"
+
+
+# 文中の { は JSON の始まりとみなさず表示すること
+def test_brace_inside_sentence_is_shown():
+    visible, f = _run(["集合は {1, 2}", " です"])
+    assert visible == "集合は {1, 2} です"
+    assert not f.withheld
+
+
+# JSON が無ければ全文をそのまま流すこと
+def test_plain_text_passes_through():
+    visible, f = _run(["a", "b`c", "d"])
+    assert visible == "ab`cd"
+    assert not f.withheld
+
+
+# ストリームの終わりに、保留していた末尾のバッククォートを出すこと
+def test_flush_releases_held_back_tail():
+    visible, f = _run(["コードは `x", "` と ``"])
+    assert visible == "コードは `x` と "
+    assert f.flush() == "``"
+    assert f.flush() == ""
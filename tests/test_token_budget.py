@@ -0,0 +1,40 @@
+from module.llm.token_budget import PromptSection, estimate_tokens, fit_sections, truncate_to_tokens, TRUNCATION_MARK
+
+
+# 日本語は1文字1トークン、英単語は約4文字で1トークンと見積もること
+def test_estimate_tokens_mixed_text():
+    assert estimate_tokens("こんにちは") == 5
+    assert estimate_tokens("hello world") == 4
+    assert estimate_tokens("") == 0
+
+
+# 予算内なら何も削らないこと
+def test_fit_sections_leaves_prompt_untouched_within_budget():
+    sections = [PromptSection("system", "システム", priority=100), PromptSection("memo", "メモ", priority=10, truncatable=True)]
+    report = fit_sections(sections, budget=100)
+
+    assert report["actions"] == []
+    assert [s.text for s in sections] == ["システム", "メモ"]
+    assert report["total"] == 6
+
+
+# 記憶は後ろから要約 → 削除の順に減らし、優先度の高い区画には手を付けないこと
+def test_fit_sections_reduces_lowest_priority_first():
+    memories = PromptSection(
+        "memories", priority=20, header="記憶",
+        items=["一番目の長い記憶です", "二番目の長い記憶です"], summaries=["一番目", "二番目"]
+    )
+    user = PromptSection("user_input", "ユーザーの発言", priority=80, truncatable=True)
+    report = fit_sections([memories, user], budget=12)
+
+    assert report["actions"] == ["memories:summarized", "memories:summarized", "memories:dropped"]
+    assert memories.text == "記憶一番目"
+    assert user.text == "ユーザーの発言"
+    assert not report["over_budget"]
+
+
+# 切り詰めは予算内に収め、省略の印を付けること
+def test_truncate_to_tokens_marks_omission():
+    text = truncate_to_tokens("あいうえおかきくけこさしすせそ", 10)
+    assert text.endswith(TRUNCATION_MARK)
+    assert estimate_tokens(text) <= 10
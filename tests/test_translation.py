@@ -0,0 +1,100 @@
+import threading
+
+import pytest
+
+from module.nlp.translation import GlossaryBackend, TranslationService
+
+
+class RecordingBackend:
+    name = "recording"
+
+    def __init__(self, fail=False):
+        self.batches = []
+        self.fail = fail
+
+    def translate_batch(self, texts):
+        if self.fail:
+            raise ConnectionError("offline")
+        self.batches.append(list(texts))
+        return [f"en:{t}" for t in texts]
+
+
+# 正規化後に同じ文はキャッシュから返し、バッチでは未訳の分だけを1回で渡すこと
+def test_batch_sends_only_unique_misses_once():
+    backend = RecordingBackend()
+    service = TranslationService(backend)
+    assert service.translate("こんにちは") == "en:こんにちは"
+
+    result = service.translate_batch(["ｺﾝﾆﾁﾊ", "こんにちは ", "ありがとう", "ありがとう"])
+    assert result == ["en:コンニチハ", "en:こんにちは", "en:ありがとう", "en:ありがとう"]
+    assert backend.batches == [["こんにちは"], ["コンニチハ", "ありがとう"]]
+
+
+# 永続層は新しいインスタンス（再起動後）からも読めること
+def test_persistent_cache_survives_restart(tmp_path):
+    path = str(tmp_path / "translation.sqlite3")
+    TranslationService(RecordingBackend(), persistent_path=path).translate("嬉しい")
+
+    backend = RecordingBackend()
+    assert TranslationService(backend, persistent_path=path).translate("嬉しい") == "en:嬉しい"
+    assert backend.batches == []
+
+
+# バックエンドが失敗したら用語集で訳し、その結果は永続化しないこと
+def test_fallback_results_are_not_persisted(tmp_path):
+    path = str(tmp_path / "translation.sqlite3")
+    service = TranslationService(RecordingBackend(fail=True), fallback=GlossaryBackend(), persistent_path=path)
+    assert service.translate("とても嬉しくて少し不安") == "happy anxiety"
+    assert service.stats()["fallbacks"] == 1
+
+    with pytest.raises(ConnectionError):
+        TranslationService(RecordingBackend(fail=True), persistent_path=path).translate("とても嬉しくて少し不安")
+
+
+# 期限内に返らない翻訳は用語集で代替し、その結果を永続化しないこと
+def test_slow_backend_times_out_to_fallback(tmp_path):
+    release = threading.Event()
+
+    class HangingBackend(RecordingBackend):
+        def translate_batch(self, texts):
+            release.wait(5)
+            return super().translate_batch(texts)
+
+    path = str(tmp_path / "translation.sqlite3")
+    service = TranslationService(HangingBackend(), fallback=GlossaryBackend(), persistent_path=path, timeout=0.05)
+    try:
+        assert service.translate("とても嬉しくて少し不安") == "happy anxiety"
+        assert service.stats()["timeouts"] == 1
+        assert service.stats()["fallbacks"] == 1
+    finally:
+        release.set()
+
+    backend = RecordingBackend()
+    assert TranslationService(backend, persistent_path=path).translate("とても嬉しくて少し不安") == "en:とても嬉しくて少し不安"
+
+
+# 先読み中の文を求めた呼び出しは、バックエンドを呼び直さずに先読みの結果を待つこと
+def test_translate_waits_for_inflight_prefetch():
+    started, release = threading.Event(), threading.Event()
+
+    class SlowBackend(RecordingBackend):
+        def translate_batch(self, texts):
+            started.set()
+            release.wait(5)
+            return super().translate_batch(texts)
+
+    backend = SlowBackend()
+    service = TranslationService(backend, timeout=5)
+    service.prefetch(["旅行が楽しみ"])
+    assert started.wait(5)
+    threading.Timer(0.05, release.set).start()
+
+    assert service.translate("旅行が楽しみ") == "en:旅行が楽しみ"
+    assert backend.batches == [["旅行が楽しみ"]]
+    assert service.stats()["inflight_waits"] == 1
+
+
+# 用語集は最長一致で語を拾うこと
+def test_glossary_prefers_longest_match():
+    glossary = GlossaryBackend({"楽し": "fun", "楽しみ": "anticipation"})
+    assert glossary.translate("明日が楽しみ、今日も楽しかった") == "anticipation fun"
@@ -0,0 +1,161 @@
+import os
+import subprocess
+import sys
+
+from bson import ObjectId, json_util
+from pymongo.errors import AutoReconnect, WriteError
+
+from module.mongo.write_spool import QUARANTINE_FILE, WriteSpool
+
+
+# 反映に成功したセグメントは削除され、pending からも消える
+def test_write_spool_replays_and_clears_pending(tmp_path):
+    written = []
+    spool = WriteSpool(str(tmp_path), writer=lambda name, docs: written.append((name, docs)),
+                       fsync_policy="never", replay_interval=60)
+
+    doc_id = spool.append("dialogue_history", {"role": "user", "message": "こんにちは"})
+    assert [d["_id"] for d in spool.pending("dialogue_history")] == [doc_id]
+
+    assert spool.replay_once()
+    assert written[0][0] == "dialogue_history"
+    assert written[0][1][0]["_id"] == doc_id
+    assert spool.pending("dialogue_history") == []
+    assert list(tmp_path.iterdir()) == []
+
+
+# 反映に失敗したセグメントはディスクに残り、次回起動時に pending に戻って同じ _id で再反映される
+def test_write_spool_keeps_segments_on_failure(tmp_path):
+    def failing_writer(name, docs):
+        raise ConnectionError("down")
+
+    spool = WriteSpool(str(tmp_path), writer=failing_writer, fsync_policy="always", replay_interval=60)
+    doc_id = spool.append("current_emotion", {"emotion_vector": {"喜び": 100}})
+    assert not spool.replay_once()
+    assert len(list(tmp_path.iterdir())) == 1
+
+    written = []
+    restarted = WriteSpool(str(tmp_path), writer=lambda name, docs: written.extend(docs), fsync_policy="never")
+    assert [d["_id"] for d in restarted.pending("current_emotion")] == [doc_id]  # 再起動後も読み込みに見える # visible after restart
+    assert restarted.replay_once()
+    assert [d["_id"] for d in written] == [doc_id]
+
+
+# 書き込み途中の破損行は読み飛ばす
+def test_write_spool_skips_torn_lines(tmp_path):
+    written = []
+    spool = WriteSpool(str(tmp_path), writer=lambda name, docs: written.extend(docs), fsync_policy="never")
+    spool.append("emotion_index", {"date": "20250101000000"})
+    spool._seal_active_segment()
+    segment = next(tmp_path.iterdir())
+    with open(segment, "ab") as f:
+        f.write(b'{"op": "insert", "collec')
+
+    assert spool.replay_once()
+    assert len(written) == 1
+
+
+# 反映できない文書は所定回数の失敗後に隔離し、同じセグメントの他の文書と後続のセグメントは反映を続ける
+def test_write_spool_quarantines_poison_document(tmp_path):
+    written = []
+
+    def writer(name, docs):
+        if any(d.get("poison") for d in docs):
+            raise WriteError("Document failed validation", code=121)
+        written.extend(docs)
+
+    spool = WriteSpool(str(tmp_path), writer=writer, fsync_policy="never", replay_interval=60, max_attempts=2)
+    good_id, poison_id = spool.append_many("emotion_index", [{"date": "1"}, {"date": "2", "poison": True}])
+    spool._seal_active_segment()
+    later_id = spool.append("emotion_index", {"date": "3"})
+
+    assert not spool.replay_once()
+    assert spool.replay_once()
+    assert [d["_id"] for d in written] == [good_id, later_id]
+    assert spool.stats()["quarantined"] == 1
+    assert spool.pending("emotion_index") == []
+
+    with open(tmp_path / QUARANTINE_FILE, "rb") as f:
+        record = json_util.loads(f.readline().decode("utf-8"))
+    assert record["doc"]["_id"] == poison_id and record["collection"] == "emotion_index"
+
+
+# 接続断は何度失敗しても隔離しない
+def test_write_spool_never_quarantines_on_connection_errors(tmp_path):
+    def writer(name, docs):
+        raise AutoReconnect("down")
+
+    spool = WriteSpool(str(tmp_path), writer=writer, fsync_policy="never", replay_interval=60, max_attempts=1)
+    spool.append("current_emotion", {"emotion_vector": {"喜び": 100}})
+    for _ in range(3):
+        assert not spool.replay_once()
+    assert spool.stats()["quarantined"] == 0
+    assert not (tmp_path / QUARANTINE_FILE).exists()
+
+
+
+def _write_segment(directory, pid, docs, collection="dialogue_history"):
+    path = directory / f"segment-{pid}-00000001.log"
+    with open(path, "wb") as f:
+        for doc in docs:
+            f.write((json_util.dumps({"op": "insert", "collection": collection, "doc": doc}) + "\n").encode("utf-8"))
+    return path
+
+
+def _dead_pid() -> int:
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+# 他の生きているプロセスのセグメントは反映しないこと
+def test_write_spool_leaves_live_peers_segments(tmp_path):
+    written = []
+    path = _write_segment(tmp_path, os.getppid(), [{"_id": ObjectId(), "message": "peer"}])
+    spool = WriteSpool(str(tmp_path), writer=lambda name, docs: written.extend(docs), fsync_policy="never")
+    assert spool.replay_once()
+    assert written == [] and path.exists()
+    assert spool.pending("dialogue_history") == []
+
+
+# 終了したプロセスのセグメントは引き取り、反映されるまで pending に載せること
+def test_write_spool_adopts_dead_process_segments(tmp_path):
+    doc_id = ObjectId()
+    path = _write_segment(tmp_path, _dead_pid(), [{"_id": doc_id, "message": "orphan"}])
+    written = []
+    spool = WriteSpool(str(tmp_path), writer=lambda name, docs: written.extend(docs), fsync_policy="never")
+    assert [d["_id"] for d in spool.pending("dialogue_history")] == [doc_id]
+
+    assert spool.replay_once()
+    assert [d["_id"] for d in written] == [doc_id]
+    assert not path.exists()
+    assert spool.pending("dialogue_history") == []
+
+
+# 引き取ったセグメントを別のプロセスが反映・削除したら pending から外すこと
+def test_write_spool_forgets_segments_replayed_elsewhere(tmp_path):
+    path = _write_segment(tmp_path, _dead_pid(), [{"_id": ObjectId(), "message": "orphan"}])
+    spool = WriteSpool(str(tmp_path), writer=lambda name, docs: None, fsync_policy="never")
+    assert len(spool.pending("dialogue_history")) == 1
+    os.remove(path)
+    spool._sealed_segments()
+    assert spool.pending("dialogue_history") == []
+
+
+# 更新・削除は挿入と同じセグメントに追記され、追記順に反映される
+def test_write_spool_replays_operations_in_append_order(tmp_path):
+    applied = []
+    spool = WriteSpool(str(tmp_path), writer=lambda name, docs: applied.append(("insert", [d["_id"] for d in docs])),
+                       operator=lambda name, record: applied.append((record["op"], record["filter"])),
+                       fsync_policy="never", replay_interval=60)
+
+    doc_id = spool.append("emotion_index", {"履歴": [{"date": "1"}]})
+    spool.append_operation("emotion_index", "update", {"_id": doc_id}, {"$set": {"履歴": []}})
+    spool.append_operation("emotion_oblivion", "delete", {"_id": {"$in": [doc_id]}})
+    assert [r["op"] for r in spool.pending_operations("emotion_index")] == ["update"]
+    assert spool.stats()["pending"] == 3
+
+    assert spool.replay_once()
+    assert applied == [("insert", [doc_id]), ("update", {"_id": doc_id}), ("delete", {"_id": {"$in": [doc_id]}})]
+    assert spool.pending_operations("emotion_index") == []
+    assert spool.stats()["pending"] == 0